@@ -1,12 +1,16 @@
 # app/chainlit_app.py
 
+import asyncio
+import time
 import chainlit as cl
-from app.services.azure_openai import AzureOpenAIWrapper
 from app.llm_validators.prompt_injection import PromptInjectionValidator
 from app.llm_validators.answer_relevance import AnswerRelevanceValidator
 from app.utils.helpers import get_logger
+from app.utils.tracing import traced
 from app.config.settings import get_settings
-from app.chains.langchain_rag import chat_with_rag
+from app.chains.langchain_rag import (
+    alookup_answer, astore_answer, astream_chat_with_rag, get_openai_client, warm_up,
+)
 
 
 
@@ -15,8 +19,8 @@ from app.chains.langchain_rag import chat_with_rag
 settings = get_settings()
 logger = get_logger(__name__)
 
-# Initialize AzureOpenAIWrapper
-openai_service = AzureOpenAIWrapper()
+# Initialize AzureOpenAIWrapper (shared with the RAG chain)
+openai_service = get_openai_client()
 
 # Initialize the Validators
 prompt_injection_validator = PromptInjectionValidator(openai_service=openai_service)
@@ -25,37 +29,56 @@ answer_relevance_validator = AnswerRelevanceValidator(openai_service=openai_serv
 
 
 @cl.on_message
-async def on_message(message: str):
+@traced("chainlit.message")
+async def on_message(message: cl.Message):
     """This function handles the incoming messages and performs validation checks."""
-    logger.info(f"Received message: {message}")
+    logger.info(f"Received message: {message.content}")
 
     # 1. Validate prompt injection
-    if await prompt_injection_validator.validate(message)== "YES":
+    if await prompt_injection_validator.validate(message.content) == "YES":
         logger.warning("Potential prompt injection detected.")
         await cl.Message(content="Potential prompt injection detected. Please rephrase your request.").send()
         return
 
-    # 2. Generate a response from the model using Azure OpenAI
+    # 2. Reuse the validated answer of a similar earlier question
+    cached = await alookup_answer(message.content)
+    if cached is not None:
+        await cl.Message(content=cached).send()
+        return
+
+    # 3. Stream a response from the model using Azure OpenAI
+    reply = cl.Message(content="")
+    start = time.perf_counter()
     try:
         user_query = message.content
-        # Generate response
-        response = chat_with_rag(user_query)
-        #response = await openai_service.chat_completion(user_query)
+        sources = []
+        async for token in astream_chat_with_rag(user_query, sources=sources):
+            if not reply.content:
+                logger.info(f"Time to first token: {time.perf_counter() - start:.3f}s")
+            await reply.stream_token(token)
+        response = reply.content
     except Exception as e:
         logger.error(f"Error generating response: {e}")
-        await cl.Message(content="Sorry, something went wrong while processing your request.").send()
+        reply.content = "Sorry, something went wrong while processing your request."
+        await reply.send()
         return
 
-    # 3. Validate answer relevance (optional - this is an additional step to make sure the response is valid)
-    if await answer_relevance_validator.validate(message, response) == "YES":
-        await cl.Message(content="The response seems irrelevant to your query. Please try again.").send()
+    # 4. Validate answer relevance on the finished answer (NO when irrelevant)
+    if await answer_relevance_validator.validate(user_query, response, sources) == "NO":
+        reply.content = "The response seems irrelevant to your query. Please try again."
+        await reply.send()
         return
 
-    # 4. Send the response back to the user
-    await cl.Message(content=response).send()
+    # 5. Finalize the streamed response
+    await reply.send()
+    await astore_answer(user_query, response, sources)
 
 
 @cl.on_chat_start
 async def on_chat_start():
     """This function handles the initialization when the chat starts."""
     await cl.Message(content="Hello! How can I assist you today?").send()
+    # Load the vector store and retriever in the background (no-op once loaded);
+    # text-only chat never captions images, so the captioner stays unloaded
+    startup = await asyncio.to_thread(warm_up, captioner=False)
+    logger.info(f"Startup timings (s): {startup}")
@@ -0,0 +1,286 @@
+# app/chains/answer_cache.py
+"""
+Semantic cache of validated answers.
+
+Questions are looked up by their embedding in a small in-memory FAISS
+inner-product index of previously answered questions; the answer of the
+closest one is served when the cosine similarity reaches
+ANSWER_CACHE_THRESHOLD and it was answered under the same system prompt and
+shard scope. Entries expire after ANSWER_CACHE_TTL seconds and the least
+recently used ones are evicted beyond ANSWER_CACHE_MAX_ENTRIES.
+
+Each entry records the documents its answer was generated from, with their
+content hash from the shard's manifest. When a shard is rebuilt and
+reloaded, entries whose documents changed or were removed are dropped.
+Chunks without a doc_id cannot be fingerprinted, so their entries are
+dropped with any reload of their shard, and entries that record no
+document at all with any reload. `invalidate(doc_ids)` drops entries by
+document explicitly.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain.schema import Document
+
+from app.chains.index_manifest import load_manifest
+from app.chains.sharded_store import DEFAULT_SHARD
+from app.utils.helpers import get_logger
+from app.utils.ttl_cache import TTLCache
+
+if TYPE_CHECKING:
+    from app.chains.sharded_store import ShardedVectorStore
+
+logger = get_logger(__name__)
+
+# Nearest cached questions checked per lookup (entries of other scopes may rank first)
+SEARCH_DEPTH = 8
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    namespace: str
+    # (collection, doc_id) -> sha256 when answered (doc_id, sha256 None if unknown)
+    documents: Dict[Tuple[str, Optional[str]], Optional[str]]
+    expires: float
+    hits: int = 0
+    similarity: float = 1.0  # of the lookup that last served it
+
+
+class AnswerCache:
+    """
+    Validated answers keyed by question embedding, invalidated with the documents they
+    come from.
+    """
+
+    def __init__(
+        self,
+        vector_store: "ShardedVectorStore",
+        threshold: float = 0.95,
+        max_entries: int = 5000,
+        ttl: float = 86400.0,
+    ):
+        self.vector_store = vector_store
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self.stats = {
+            "lookups": 0,
+            "hits": 0,
+            "stores": 0,
+            "expired": 0,
+            "evicted": 0,
+            "invalidated": 0,
+        }
+        # Created by the first store (embedding dimension)
+        self._index: Optional[faiss.Index] = None
+        self._next_id = 0
+        self._versions = self._shard_versions()
+        self._hashes: Dict[str, Tuple[Optional[tuple], Dict[str, str]]] = {}
+        # Vectors of recent misses, so storing their answer needs no second embedding
+        self._pending = TTLCache(max_entries=1000, ttl=600.0)
+        self._lock = threading.Lock()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            lookups = self.stats["lookups"]
+            return {
+                "entries": len(self.entries),
+                **self.stats,
+                "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+            }
+
+    # --- Lookup and store ---
+
+    def lookup(
+        self, question: str, vector: List[float], namespace: str
+    ) -> Optional[CachedAnswer]:
+        """
+        The cached answer of the most similar question above the threshold, or None.
+        """
+        self.vector_store.maybe_reload()
+        query = _normalized(vector)
+        with self._lock:
+            self._check_versions()
+            self.stats["lookups"] += 1
+            hit = self._nearest(query, namespace)
+            if hit is None:
+                self._pending.set((namespace, question), query)
+                return None
+            entry_id, similarity = hit
+            entry = self.entries[entry_id]
+            self.entries.move_to_end(entry_id)
+            entry.hits += 1
+            entry.similarity = similarity
+            self.stats["hits"] += 1
+            return entry
+
+    def pending(self, question: str, namespace: str) -> Optional[np.ndarray]:
+        """Vector of a question whose lookup just missed, if still known."""
+        return self._pending.get((namespace, question))
+
+    def store(
+        self,
+        question: str,
+        vector: List[float],
+        answer: str,
+        sources: List[Document],
+        namespace: str,
+    ) -> None:
+        """
+        Caches `answer` with the documents (retrieved chunks) it was generated from.
+        """
+        query = _normalized(vector)
+        with self._lock:
+            self._check_versions()
+            documents = {}
+            for doc in sources:
+                collection = doc.metadata.get("collection", DEFAULT_SHARD)
+                doc_id = doc.metadata.get("doc_id")
+                sha = (
+                    self._document_hashes(collection).get(doc_id)
+                    if doc_id is not None
+                    else None
+                )
+                documents[(collection, doc_id)] = sha
+            if self._index is None:
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(len(query)))
+            # A paraphrase answered concurrently is superseded by the newer answer
+            previous = self._nearest(query, namespace)
+            if previous is not None:
+                self._remove([previous[0]])
+
+            entry_id, self._next_id = self._next_id, self._next_id + 1
+            self._index.add_with_ids(
+                query[None, :], np.array([entry_id], dtype="int64")
+            )
+            self.entries[entry_id] = CachedAnswer(
+                question=question,
+                answer=answer,
+                namespace=namespace,
+                documents=documents,
+                expires=time.monotonic() + self.ttl,
+            )
+            self.stats["stores"] += 1
+            if len(self.entries) > self.max_entries:
+                evicted = list(self.entries)[:len(self.entries) - self.max_entries]
+                self._remove(evicted)
+                self.stats["evicted"] += len(evicted)
+
+    def _nearest(
+        self, query: np.ndarray, namespace: str
+    ) -> Optional[Tuple[int, float]]:
+        if self._index is None or not self._index.ntotal:
+            return None
+        scores, ids = self._index.search(
+            query[None, :], min(SEARCH_DEPTH, self._index.ntotal)
+        )
+        now = time.monotonic()
+        expired = []
+        hit = None
+        for score, entry_id in zip(scores[0], ids[0]):
+            if entry_id == -1 or score < self.threshold:
+                break
+            entry = self.entries[int(entry_id)]
+            if entry.expires < now:
+                expired.append(int(entry_id))
+            elif entry.namespace == namespace:
+                hit = int(entry_id), float(score)
+                break
+        if expired:
+            self._remove(expired)
+            self.stats["expired"] += len(expired)
+        return hit
+
+    def _remove(self, entry_ids: List[int]) -> None:
+        self._index.remove_ids(np.array(entry_ids, dtype="int64"))
+        for entry_id in entry_ids:
+            del self.entries[entry_id]
+
+    # --- Invalidation ---
+
+    def invalidate(self, doc_ids: Optional[Iterable[str]] = None) -> int:
+        """
+        Drops the entries answered from any of `doc_ids` (every entry if None); returns
+        how many.
+        """
+        with self._lock:
+            if doc_ids is None:
+                stale = list(self.entries)
+            else:
+                doc_ids = set(doc_ids)
+                stale = [
+                    entry_id for entry_id, entry in self.entries.items()
+                    if any(doc_id in doc_ids for _, doc_id in entry.documents)
+                ]
+            if stale:
+                self._remove(stale)
+                self.stats["invalidated"] += len(stale)
+            return len(stale)
+
+    def _shard_versions(self) -> Dict[str, Optional[tuple]]:
+        return {name: shard.version for name, shard in self.vector_store.shards.items()}
+
+    def _document_hashes(self, collection: str) -> Dict[str, str]:
+        """
+        doc_id -> sha256 of the documents in the loaded version of shard `collection`.
+        """
+        shard = self.vector_store.shards.get(collection)
+        if shard is None:
+            return {}
+        version, hashes = self._hashes.get(collection, (None, None))
+        if hashes is None or version != shard.version:
+            manifest = load_manifest(shard.path) or {}
+            hashes = {
+                doc_id: entry.get("sha256")
+                for doc_id, entry in manifest.get("files", {}).items()
+            }
+            self._hashes[collection] = (shard.version, hashes)
+        return hashes
+
+    def _check_versions(self) -> None:
+        """
+        Drops entries whose documents changed in shards reloaded since the
+        last check, and entries without known documents on any reload.
+        """
+        versions = self._shard_versions()
+        changed = {
+            name
+            for name, version in versions.items()
+            if version != self._versions.get(name)
+        }
+        self._versions = versions
+        if not changed or not self.entries:
+            return
+        hashes = {name: self._document_hashes(name) for name in changed}
+        stale = [
+            entry_id
+            for entry_id, entry in self.entries.items()
+            if not entry.documents
+            or any(
+                collection in changed
+                and (sha is None or hashes[collection].get(doc_id) != sha)
+                for (collection, doc_id), sha in entry.documents.items()
+            )
+        ]
+        if stale:
+            self._remove(stale)
+            self.stats["invalidated"] += len(stale)
+        logger.info(
+            f"Index shards {sorted(changed)} reloaded: "
+            f"{len(stale)} cached answers invalidated"
+        )
+
+
+def _normalized(vector) -> np.ndarray:
+    query = np.asarray(vector, dtype="float32")
+    norm = np.linalg.norm(query)
+    return query / norm if norm else query
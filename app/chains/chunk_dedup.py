@@ -0,0 +1,139 @@
+# app/chains/chunk_dedup.py
+"""
+Near-duplicate chunk elimination at index build time.
+
+Boilerplate pages (legal notices, headers, repeated spec tables) split into
+many nearly identical chunks. Each chunk gets a MinHash signature of its
+word shingles (computed in the extraction workers); an LSH index over the
+signatures finds candidates whose estimated Jaccard similarity reaches
+CHUNK_DEDUP_THRESHOLD. Only the first chunk of each cluster is embedded and
+stored, with the sources of its duplicates merged into its metadata.
+"""
+
+import zlib
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.schema import Document
+
+from app.chains.context_packing import word_shingles
+from app.utils.batching import estimate_tokens
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+SEED = 1
+
+
+@lru_cache(maxsize=4)
+def _permutations(num_perm: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Fixed seed: signatures from different worker processes must be comparable.
+    # With 32-bit a, b and shingle hashes, a * x + b cannot overflow uint64
+    rng = np.random.RandomState(SEED)
+    a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+    b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def minhash(text: str, num_perm: int = 128) -> np.ndarray:
+    """MinHash signature of the text's word shingles (stable across processes)."""
+    a, b = _permutations(num_perm)
+    hashes = np.array(
+        [zlib.crc32(s.encode("utf-8")) for s in word_shingles(text)] or [0],
+        dtype=np.uint64,
+    )
+    values = (a[:, None] * hashes[None, :] + b[:, None]) % MERSENNE_PRIME
+    return (values & MAX_HASH).min(axis=1)
+
+
+def lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """(bands, rows) whose S-curve midpoint (1/b)^(1/r) is closest to `threshold`."""
+    candidates = [
+        (b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0
+    ]
+    return min(candidates, key=lambda br: abs((1 / br[0]) ** (1 / br[1]) - threshold))
+
+
+class ChunkDeduplicator:
+    """
+    Keeps the first chunk of every near-duplicate cluster. Later chunks are
+    compared with the kept representatives only, so clusters do not chain.
+    """
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = 128):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self.buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+        self.signatures: List[np.ndarray] = []
+        self.representatives: List[Document] = []
+        self.seen = 0
+        self.dropped = 0
+        self.dropped_tokens = 0
+
+    def add(
+        self, chunks: List[Document], signatures: Optional[Sequence[np.ndarray]] = None
+    ) -> List[Document]:
+        """Returns the chunks that are not near-duplicates of a chunk kept so far."""
+        if signatures is None:
+            signatures = [minhash(c.page_content, self.num_perm) for c in chunks]
+        kept = []
+        for chunk, signature in zip(chunks, signatures):
+            self.seen += 1
+            match = self._find(signature)
+            if match is None:
+                self._insert(chunk, signature)
+                kept.append(chunk)
+            else:
+                self._merge(self.representatives[match], chunk)
+        return kept
+
+    def _bands(self, signature: np.ndarray) -> List[bytes]:
+        return [
+            signature[i * self.rows : (i + 1) * self.rows].tobytes()
+            for i in range(self.bands)
+        ]
+
+    def _find(self, signature: np.ndarray) -> Optional[int]:
+        candidates = set()
+        for buckets, key in zip(self.buckets, self._bands(signature)):
+            candidates.update(buckets.get(key, ()))
+        best, best_similarity = None, self.threshold
+        for i in candidates:
+            similarity = float(np.mean(self.signatures[i] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = i, similarity
+        return best
+
+    def _insert(self, chunk: Document, signature: np.ndarray) -> None:
+        position = len(self.representatives)
+        self.representatives.append(chunk)
+        self.signatures.append(signature)
+        for buckets, key in zip(self.buckets, self._bands(signature)):
+            buckets.setdefault(key, []).append(position)
+
+    def _merge(self, representative: Document, duplicate: Document) -> None:
+        """
+        Records the duplicate's source on the kept chunk
+        (metadata["duplicate_sources"]).
+        """
+        self.dropped += 1
+        self.dropped_tokens += estimate_tokens(duplicate.page_content)
+        metadata = representative.metadata
+        metadata["duplicates"] = metadata.get("duplicates", 0) + 1
+        metadata.setdefault("duplicate_sources", []).append(
+            {
+                k: duplicate.metadata[k]
+                for k in ("doc_id", "source", "page")
+                if k in duplicate.metadata
+            }
+        )
+
+    def report(self, embedding_requests_saved: int = 0) -> str:
+        rate = self.dropped / self.seen if self.seen else 0.0
+        return (
+            f"{self.dropped} of {self.seen} chunks were near-duplicates "
+            f"({rate:.1%}, threshold {self.threshold}, LSH {self.bands}x{self.rows}); "
+            f"~{self.dropped_tokens} tokens and "
+            f"{embedding_requests_saved} embedding requests saved"
+        )
@@ -0,0 +1,213 @@
+# app/chains/context_packing.py
+"""
+Context assembly for RAG prompts: retrieves more candidates than will be
+sent, merges overlapping chunks of the same page back together, drops
+near-duplicate passages (e.g. an image caption repeating its page text) and
+packs what is left, most relevant first, into a token budget.
+"""
+
+import re
+from functools import lru_cache
+from typing import Any, List, Optional
+
+from langchain.schema import BaseRetriever, Document
+
+from app.utils.helpers import get_logger
+from app.utils.tracing import span
+
+logger = get_logger(__name__)
+
+WORD_RE = re.compile(r"\w+")
+SHINGLE_SIZE = 3
+MIN_OVERLAP_CHARS = 20
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    """
+    cl100k_base tokenizer (GPT-4o family), or None when tiktoken or its BPE file is
+    unavailable.
+    """
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable, estimating tokens from characters: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    encoding = _encoding()
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def _overlap(first: str, second: str) -> int:
+    """Length of the longest suffix of `first` that is a prefix of `second`."""
+    for size in range(min(len(first), len(second)), MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:size]):
+            return size
+    return 0
+
+
+def _join(first: str, second: str) -> Optional[str]:
+    """
+    `first` and `second` as one passage if they overlap (in either order), else None.
+    """
+    if second in first:
+        return first
+    if first in second:
+        return second
+    size = _overlap(first, second)
+    if size:
+        return first + second[size:]
+    size = _overlap(second, first)
+    if size:
+        return second + first[size:]
+    return None
+
+
+def _page_key(doc: Document) -> tuple:
+    return (
+        doc.metadata.get("source"),
+        doc.metadata.get("page"),
+        doc.metadata.get("type"),
+    )
+
+
+def merge_adjacent(docs: List[Document]) -> List[Document]:
+    """
+    Merges chunks of the same source and page whose text overlaps (the
+    splitter's chunk_overlap). A merged passage takes the rank of its best chunk.
+    """
+    merged: List[Document] = []
+    for doc in docs:
+        position = len(merged)
+        i = 0
+        while i < len(merged):
+            kept = merged[i]
+            text = (
+                _join(kept.page_content, doc.page_content)
+                if _page_key(kept) == _page_key(doc)
+                else None
+            )
+            if text is None:
+                i += 1
+                continue
+            # Start over: the longer passage may now bridge to another kept chunk
+            chunks = kept.metadata.get("merged_chunks", 1) + doc.metadata.get(
+                "merged_chunks", 1
+            )
+            doc = Document(
+                page_content=text, metadata={**kept.metadata, "merged_chunks": chunks}
+            )
+            del merged[i]
+            position = min(position, i)
+            i = 0
+        merged.insert(min(position, len(merged)), doc)
+    return merged
+
+
+def word_shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    """Lower-cased runs of `size` words (the whole text if it is shorter)."""
+    words = WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+def remove_near_duplicates(docs: List[Document], threshold: float) -> List[Document]:
+    """
+    Drops passages whose word shingles are at least `threshold` contained in
+    an already kept, more relevant passage (or that contain one that much).
+    """
+    kept: List[tuple] = []
+    for doc in docs:
+        shingles = word_shingles(doc.page_content)
+        duplicate = False
+        for _, other in kept:
+            common = len(shingles & other)
+            if common and common / min(len(shingles), len(other)) >= threshold:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append((doc, shingles))
+    return [doc for doc, _ in kept]
+
+
+def pack(docs: List[Document], token_budget: int, max_chunks: int) -> List[Document]:
+    """
+    Greedily keeps passages, most relevant first, while they fit in
+    `token_budget` and add up to at most `max_chunks` original chunks. The
+    most relevant passage is truncated rather than dropped.
+    """
+    packed: List[Document] = []
+    remaining = token_budget
+    chunks = 0
+    for doc in docs:
+        if chunks >= max_chunks:
+            break
+        tokens = count_tokens(doc.page_content)
+        if tokens <= remaining:
+            packed.append(doc)
+            remaining -= tokens
+            chunks += doc.metadata.get("merged_chunks", 1)
+        elif not packed:
+            packed.append(Document(
+                page_content=truncate_to_tokens(doc.page_content, remaining),
+                metadata={**doc.metadata, "truncated": True},
+            ))
+            remaining = 0
+    return packed
+
+
+def pack_context(
+    docs: List[Document], token_budget: int, max_chunks: int, dedup_threshold: float
+) -> List[Document]:
+    """Merges, deduplicates and packs retrieved chunks (given in relevance order)."""
+    return pack(
+        remove_near_duplicates(merge_adjacent(docs), dedup_threshold),
+        token_budget,
+        max_chunks,
+    )
+
+
+class PackedContextRetriever(BaseRetriever):
+    """
+    Retrieves `candidates` chunks from the vector store and returns them packed
+    with `pack_context`: at most `max_chunks` chunks and `token_budget` tokens,
+    with slots freed by duplicates going to the next most relevant chunks.
+    """
+
+    vector_store: Any
+    candidates: int = 8
+    max_chunks: int = 3
+    token_budget: int = 1000
+    dedup_threshold: float = 0.8
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager=None
+    ) -> List[Document]:
+        return self.pack(self.vector_store.similarity_search(query, k=self.candidates))
+
+    def pack(self, docs: List[Document]) -> List[Document]:
+        """Packs candidates retrieved elsewhere (e.g. by a multi-query search)."""
+        with span("context.pack", candidates=len(docs)) as pack_span:
+            packed = pack_context(
+                docs, self.token_budget, self.max_chunks, self.dedup_threshold
+            )
+            pack_span.set(
+                passages=len(packed),
+                candidate_tokens=sum(count_tokens(d.page_content) for d in docs),
+                context_tokens=sum(count_tokens(d.page_content) for d in packed),
+            )
+        return packed
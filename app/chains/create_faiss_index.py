@@ -1,50 +1,184 @@
+import argparse
 import os
 import base64
-import fitz  # PyMuPDF
-from langchain.vectorstores import FAISS
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.document_loaders import PyPDFLoader
+import hashlib
+import time
+from typing import Dict, List, Optional, Tuple
 from langchain.schema import Document
+from app.chains.ingestion import build_index
+from app.chains.sharded_store import build_dirs
+from app.config.settings import get_settings
 from app.services.azure_openai import AzureOpenAIWrapper
-from PIL import Image
-from transformers import AutoProcessor, LlavaForConditionalGeneration
-import torch
-import io
+from app.services.image_captioner import CAPTION_PROMPT, caption_messages
+from app.services.request_scheduler import BATCH, request_priority
+from app.utils.caption_cache import CaptionCache
 import asyncio
 
+def caption_cache_version(openai_service: AzureOpenAIWrapper) -> str:
+    """Cache version for captions: changes whenever the model or the prompt changes."""
+    prompt_hash = hashlib.sha256(CAPTION_PROMPT.encode("utf-8")).hexdigest()[:12]
+    return f"{openai_service.deployment_name}:{prompt_hash}"
 
 
-async def caption_image(image_bytes: bytes) -> str:
+async def caption_image(
+    image_bytes: bytes, openai_service: Optional[AzureOpenAIWrapper] = None
+) -> str:
     """
     Generate a caption for an image using OpenAI's GPT-4o model.
     :param image_bytes: The image in bytes.
+    :param openai_service: Shared client to reuse; a new one is created if omitted.
     :return: Caption string.
     """
-    openai_service = AzureOpenAIWrapper()
+    openai_service = openai_service or AzureOpenAIWrapper()
 
     img_b64 = base64.b64encode(image_bytes).decode("utf-8")
-    messages = [
-        {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": "Describe this image in one sentence."},
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/jpeg;base64,{img_b64}"
-                    }
-                }
-            ]
-        }
-    ]
-    
-    response = await openai_service.chat_completion(messages)
-    print(f"Generated caption: {response.strip()}")
+    response = await openai_service.chat_completion(caption_messages(img_b64))
     return response.strip()
 
 
+class CaptionStage:
+    """
+    Bounded-parallel captioning stage of the indexing pipeline.
+    Images are queued as soon as they are extracted and captioned by
+    `concurrency` workers sharing one AzureOpenAIWrapper, while the
+    producer keeps loading the next PDFs. Images already in `cache` are
+    resolved at submit time without an API call, and repeats of an image
+    submitted earlier in the build (logos, headers) share its caption
+    instead of being queued again. Rate limits and retries are handled by
+    the chat deployment's request scheduler.
+    """
+
+    def __init__(
+        self,
+        openai_service: AzureOpenAIWrapper,
+        concurrency: int,
+        progress_every: int = 10,
+        cache: Optional[CaptionCache] = None,
+    ):
+        self.openai_service = openai_service
+        self.cache = cache
+        self.concurrency = max(1, concurrency)
+        self.progress_every = progress_every
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 4)
+        self.results: List[Tuple[tuple, Document]] = []
+        # Caption of every image queued in this build, by content key
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._duplicates: List[Tuple[asyncio.Future, tuple]] = []
+        self.submitted = 0
+        self.deduplicated = 0
+        self.completed = 0
+        self.failed = 0
+        self._workers: List[asyncio.Task] = []
+        self._started = 0.0
+
+    def start(self) -> None:
+        self._started = time.perf_counter()
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.concurrency)
+        ]
+
+    async def submit(
+        self, image_bytes: bytes, filename: str, page: int, img_index: int
+    ) -> None:
+        key = self._key(image_bytes)
+        if self.cache is not None:
+            caption = self.cache.get(key)
+            if caption is not None:
+                self._add_result(caption, filename, page, img_index)
+                return
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.deduplicated += 1
+            self._duplicates.append((pending, (filename, page, img_index)))
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self.submitted += 1
+        await self.queue.put((image_bytes, key, future, filename, page, img_index))
+
+    async def close(self) -> List[Document]:
+        """Waits for queued captions to finish and returns them in document order."""
+        await self.queue.join()
+        self.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        for future, (filename, page, img_index) in self._duplicates:
+            if future.result() is not None:
+                self._add_result(future.result(), filename, page, img_index)
+
+        elapsed = time.perf_counter() - self._started
+        rate = self.completed / elapsed if elapsed else 0.0
+        cached = self.cache.hits if self.cache is not None else 0
+        print(
+            f"🖼️ Captioned {self.completed} images ({self.failed} failed, "
+            f"{cached} from cache, {self.deduplicated} repeated) "
+            f"in {elapsed:.1f}s ({rate:.2f} img/s)"
+        )
+        return [doc for _, doc in sorted(self.results, key=lambda r: r[0])]
+
+    def cancel(self) -> None:
+        """Stops the workers without waiting for queued images (aborted build)."""
+        for worker in self._workers:
+            worker.cancel()
+
+    def _key(self, image_bytes: bytes) -> str:
+        if self.cache is not None:
+            return self.cache.key(image_bytes)
+        return hashlib.sha256(image_bytes).hexdigest()
+
+    def _add_result(
+        self, caption: str, filename: str, page: int, img_index: int
+    ) -> None:
+        self.results.append(
+            (
+                (filename, page, img_index),
+                Document(
+                    page_content=f"[Image on page {page} of {filename}]: {caption}",
+                    metadata={
+                        "source": filename,
+                        "page": page,
+                        "type": "image",
+                        "doc_id": filename,
+                    },
+                ),
+            )
+        )
+
+    async def _worker(self) -> None:
+        while True:
+            image_bytes, key, future, filename, page, img_index = await self.queue.get()
+            caption = None
+            try:
+                caption = await self._caption(image_bytes)
+                if caption is not None:
+                    if self.cache is not None:
+                        self.cache.put(key, caption)
+                    self._add_result(caption, filename, page, img_index)
+                self._report_progress()
+            finally:
+                future.set_result(caption)
+                self.queue.task_done()
+
+    async def _caption(self, image_bytes: bytes) -> Optional[str]:
+        try:
+            caption = await caption_image(image_bytes, self.openai_service)
+        except Exception as e:
+            print(f"⚠️ Captioning failed: {e}")
+            self.failed += 1
+            return None
+        self.completed += 1
+        return caption
+
+    def _report_progress(self) -> None:
+        done = self.completed + self.failed
+        if done % self.progress_every == 0:
+            elapsed = time.perf_counter() - self._started
+            rate = done / elapsed if elapsed else 0.0
+            print(f"🖼️ {done}/{self.submitted} images captioned ({rate:.2f} img/s)")
+
+
 # --- Main async indexing logic ---
-async def main():
+async def main(collection: Optional[str] = None):
+    settings = get_settings()
     openai_client = AzureOpenAIWrapper()
     embedding_model = openai_client.get_embedding_function()
 
@@ -52,45 +186,55 @@ async def main():
     BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     pdf_directory = os.path.join(BASE_DIR, "data", "docs")
     faiss_index_directory = os.path.join(BASE_DIR, "data", "faiss_index")
+    # Sharded: docs/<collection> -> <index root>/<collection>, one shard per run
+    try:
+        pdf_directory, faiss_index_directory = build_dirs(
+            pdf_directory,
+            settings.faiss_index_path or faiss_index_directory,
+            collection,
+            settings,
+        )
+    except ValueError as e:
+        raise SystemExit(f"❌ {e}")
+    caption_cache_path = settings.caption_cache_path or os.path.join(
+        BASE_DIR, "data", "cache", "captions.sqlite"
+    )
+
+    # Images are captioned concurrently while the remaining PDFs are extracted
+    caption_cache = CaptionCache(
+        caption_cache_path, caption_cache_version(openai_client)
+    )
+    caption_stage = CaptionStage(
+        openai_client, settings.caption_concurrency, cache=caption_cache
+    )
+
+    # Single-pass, process-parallel extraction; see app/chains/ingestion.py
+    try:
+        faiss_index = await build_index(
+            pdf_directory,
+            faiss_index_directory,
+            embedding_model,
+            settings,
+            caption_stage,
+        )
+    finally:
+        caption_cache.close()
+    if faiss_index is None:
+        print("✅ FAISS index is already up to date.")
+        return
 
-    # Load and split PDFs (text)
-    documents = []
-    for filename in os.listdir(pdf_directory):
-        if filename.endswith(".pdf"):
-            pdf_path = os.path.join(pdf_directory, filename)
-            # Load text
-            loader = PyPDFLoader(pdf_path)
-            documents.extend(loader.load())
-
-            # --- Extract images and caption them ---
-            doc = fitz.open(pdf_path)
-            for page_num, page in enumerate(doc):
-                images = page.get_images(full=True)
-                for img_index, img in enumerate(images):
-                    xref = img[0]
-                    base_image = doc.extract_image(xref)
-                    image_bytes = base_image["image"]
-                    caption = await caption_image(image_bytes)
-                    # Add the caption as a document chunk
-                    documents.append(
-                        Document(
-                            page_content=f"[Image on page {page_num+1} of {filename}]: {caption}",
-                            metadata={"source": filename, "page": page_num+1, "type": "image"}
-                        )
-                    )
-
-    # Split documents into chunks for embedding and retrieval
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    split_docs = splitter.split_documents(documents)
-
-    # Create FAISS index
-    faiss_index = FAISS.from_documents(split_docs, embedding_model)
-
-    # Save index with metadata
-    os.makedirs(faiss_index_directory, exist_ok=True)
-    faiss_index.save_local(faiss_index_directory)
-
-    print("✅ FAISS index with image captions created and saved successfully!")
+    print("✅ FAISS index with image captions saved successfully!")
+    if openai_client.embedding_cache is not None:
+        print(f"📦 Embedding cache: {openai_client.embedding_cache.stats()}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(
+        description="Create or update the FAISS index from app/data/docs."
+    )
+    parser.add_argument(
+        "--collection", help="Build only this index shard (app/data/docs/<collection>)"
+    )
+    args = parser.parse_args()
+    # Indexing yields to interactive requests sharing the deployment's quota
+    with request_priority(BATCH):
+        asyncio.run(main(args.collection))
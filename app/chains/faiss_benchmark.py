@@ -0,0 +1,186 @@
+# app/chains/faiss_benchmark.py
+"""
+Compares FAISS index types against the exact flat index: recall@k, single-query
+latency percentiles, build time and serialized index size.
+
+    python -m app.chains.faiss_benchmark                      # app/data/faiss_index
+    python -m app.chains.faiss_benchmark --synthetic 1000000  # clustered vectors
+"""
+
+import argparse
+import os
+import time
+from typing import Dict, List, Tuple
+
+import faiss
+import numpy as np
+
+from app.chains.faiss_index_factory import auto_nlist, build_index
+from app.utils.stats import percentiles
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # app/
+FAISS_INDEX_PATH = os.path.join(APP_DIR, "data", "faiss_index")
+
+
+def load_index_vectors(index_dir: str) -> np.ndarray:
+    index = faiss.read_index(os.path.join(index_dir, "index.faiss"))
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def synthetic_vectors(
+    n: int, dim: int, clusters: int = 256, seed: int = 0
+) -> np.ndarray:
+    """Clustered unit vectors, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype("float32")
+    noise = rng.standard_normal((n, dim)).astype("float32")
+    vectors = centers[rng.integers(0, clusters, n)] + 0.5 * noise
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def split_queries(
+    vectors: np.ndarray, n_queries: int, seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Holds out `n_queries` vectors as queries; the rest is the database."""
+    rng = np.random.default_rng(seed)
+    mask = np.zeros(len(vectors), dtype=bool)
+    n_held_out = min(n_queries, len(vectors) // 2)
+    held_out = rng.choice(len(vectors), n_held_out, replace=False)
+    mask[held_out] = True
+    return np.ascontiguousarray(vectors[~mask]), np.ascontiguousarray(vectors[mask])
+
+
+def measure(
+    index: faiss.Index, queries: np.ndarray, k: int, truth: np.ndarray
+) -> Dict[str, float]:
+    latencies: List[float] = []
+    found = np.zeros((len(queries), k), dtype="int64")
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, labels = index.search(queries[i:i + 1], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found[i] = labels[0]
+    recall = np.mean(
+        [len(set(found[i]) & set(truth[i])) / k for i in range(len(queries))]
+    )
+    return {
+        "recall": float(recall),
+        **{f"{p}_ms": v for p, v in percentiles(latencies).items()},
+    }
+
+
+def benchmark(vectors: np.ndarray, args: argparse.Namespace) -> List[Dict[str, object]]:
+    database, queries = split_queries(vectors, args.queries)
+    nlist = args.nlist or auto_nlist(len(database))
+    configs = [
+        ({"type": "flat"}, "-", [None]),
+        ({"type": "ivf", "nlist": nlist}, "nprobe", args.nprobe),
+        (
+            {
+                "type": "hnsw",
+                "hnsw_m": args.hnsw_m,
+                "ef_construction": args.ef_construction,
+            },
+            "efSearch",
+            args.ef_search,
+        ),
+        (
+            {"type": "ivfpq", "nlist": nlist, "pq_m": args.pq_m, "pq_nbits": 8},
+            "nprobe",
+            args.nprobe,
+        ),
+    ]
+
+    results = []
+    truth = None
+    for config, param, values in configs:
+        if args.types and config["type"] not in args.types and config["type"] != "flat":
+            continue
+        start = time.perf_counter()
+        try:
+            index = build_index(database, config, train_sample=args.train_sample)
+        except (ValueError, RuntimeError) as e:
+            print(f"Skipping {config['type']}: {e}")
+            continue
+        build_s = time.perf_counter() - start
+        size_mb = faiss.serialize_index(index).nbytes / 1e6
+
+        if truth is None:
+            _, truth = index.search(queries, args.k)
+
+        for value in values:
+            if param == "nprobe":
+                faiss.extract_index_ivf(index).nprobe = value
+            elif param == "efSearch":
+                index.hnsw.efSearch = value
+            row = {
+                "type": config["type"],
+                "param": f"{param}={value}" if value else "-",
+                "build_s": build_s,
+                "size_mb": size_mb,
+            }
+            row.update(measure(index, queries, args.k, truth))
+            results.append(row)
+    return results
+
+
+def print_table(results: List[Dict[str, object]], k: int) -> None:
+    header = (
+        f"{'type':<7}{'param':<14}{'recall@' + str(k):>10}"
+        f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'size MB':>10}{'build s':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['type']:<7}{r['param']:<14}{r['recall']:>10.3f}"
+            f"{r['p50_ms']:>9.3f}{r['p95_ms']:>9.3f}{r['p99_ms']:>9.3f}"
+            f"{r['size_mb']:>10.1f}{r['build_s']:>9.1f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark FAISS index types against the exact index."
+    )
+    parser.add_argument(
+        "--index-dir",
+        default=FAISS_INDEX_PATH,
+        help="Index whose vectors are benchmarked",
+    )
+    parser.add_argument(
+        "--synthetic", type=int, default=0, help="Use N synthetic vectors instead"
+    )
+    parser.add_argument(
+        "--dim", type=int, default=1536, help="Dimension of synthetic vectors"
+    )
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument(
+        "--types", nargs="*", default=[], help="Subset of ivf, hnsw, ivfpq"
+    )
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--pq-m", type=int, default=16)
+    parser.add_argument("--train-sample", type=int, default=100000)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        vectors = synthetic_vectors(args.synthetic, args.dim)
+    else:
+        vectors = load_index_vectors(args.index_dir)
+    print(
+        f"Benchmarking {len(vectors)} vectors of dimension {vectors.shape[1]}, "
+        f"{args.queries} queries, k={args.k}"
+    )
+    print_table(benchmark(vectors, args), args.k)
+
+
+if __name__ == "__main__":
+    main()
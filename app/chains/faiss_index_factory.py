@@ -0,0 +1,230 @@
+# app/chains/faiss_index_factory.py
+
+import math
+import os
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+from langchain.docstore.in_memory import InMemoryDocstore
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+from langchain.vectorstores import FAISS
+
+from app.chains.sqlite_docstore import (
+    DOCSTORE_FILE,
+    PositionMap,
+    SQLiteDocstore,
+    read_docstore,
+    write_docstore,
+)
+from app.config.settings import Settings
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+LOAD_MODES = ("mmap", "memory")
+INDEX_FILE = "index.faiss"
+
+
+def index_config(settings: Settings) -> Dict[str, object]:
+    """Build-time parameters of the configured index type (stored in the manifest)."""
+    config = {"type": settings.faiss_index_type}
+    if settings.faiss_index_type in ("ivf", "ivfpq"):
+        config["nlist"] = settings.faiss_nlist
+    if settings.faiss_index_type == "ivfpq":
+        config.update(pq_m=settings.faiss_pq_m, pq_nbits=settings.faiss_pq_nbits)
+    if settings.faiss_index_type == "hnsw":
+        config.update(
+            hnsw_m=settings.faiss_hnsw_m, ef_construction=settings.faiss_ef_construction
+        )
+    return config
+
+
+def auto_nlist(n_vectors: int) -> int:
+    """~4*sqrt(n) inverted lists, keeping at least 39 training points per centroid."""
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+
+def build_index(
+    vectors: np.ndarray,
+    config: Dict[str, object],
+    train_sample: int = 100000,
+    seed: int = 0,
+) -> faiss.Index:
+    """
+    Creates, trains (on a random sample) and fills a FAISS index of the given type.
+    All types use L2 distance, like LangChain's default flat index.
+    """
+    index_type = config["type"]
+    if index_type not in INDEX_TYPES:
+        raise ValueError(
+            f"Unknown FAISS index type '{index_type}', expected one of {INDEX_TYPES}"
+        )
+
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, dim = vectors.shape
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, int(config["hnsw_m"]))
+        index.hnsw.efConstruction = int(config["ef_construction"])
+    else:
+        nlist = int(config["nlist"]) or auto_nlist(n)
+        if index_type == "ivf":
+            description = f"IVF{nlist},Flat"
+        else:
+            if n < 2 ** int(config["pq_nbits"]):
+                raise ValueError(
+                    f"ivfpq needs at least {2 ** int(config['pq_nbits'])} "
+                    f"vectors to train, got {n}"
+                )
+            description = f"IVF{nlist},PQ{config['pq_m']}x{config['pq_nbits']}"
+        index = faiss.index_factory(dim, description, faiss.METRIC_L2)
+
+    if not index.is_trained:
+        rng = np.random.default_rng(seed)
+        sample = (
+            vectors
+            if n <= train_sample
+            else vectors[rng.choice(n, train_sample, replace=False)]
+        )
+        index.train(sample)
+
+    index.add(vectors)
+    return index
+
+
+def tune_index(index: faiss.Index, settings: Settings) -> faiss.Index:
+    """Applies runtime search parameters (nprobe for IVF, efSearch for HNSW)."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = settings.faiss_nprobe
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = settings.faiss_ef_search
+    return index
+
+
+def create_vector_store(
+    chunks: List[Document],
+    embedding: Embeddings,
+    ids: List[str],
+    settings: Settings,
+    vectors: Optional[List[List[float]]] = None,
+) -> FAISS:
+    """
+    Wraps an index of the configured type in a LangChain FAISS store.
+    `chunks` are embedded unless their `vectors` are given.
+    """
+    if vectors is None:
+        vectors = embedding.embed_documents([c.page_content for c in chunks])
+    vectors = np.array(vectors, dtype="float32")
+    index = build_index(vectors, index_config(settings), settings.faiss_train_sample)
+    return FAISS(
+        embedding_function=embedding,
+        index=tune_index(index, settings),
+        docstore=InMemoryDocstore(dict(zip(ids, chunks))),
+        index_to_docstore_id=dict(enumerate(ids)),
+    )
+
+
+def delete_chunks(vector_store: FAISS, ids: List[str], settings: Settings) -> None:
+    """
+    Removes chunks by docstore ID. Flat indexes delete in place. IVF/HNSW
+    indexes do not renumber labels after `remove_ids`, which LangChain's
+    position-based mapping relies on, so they are rebuilt from the remaining
+    vectors (exact reconstructions, or re-embedded texts for lossy PQ codes,
+    which the embedding cache normally serves without API calls).
+    """
+    if isinstance(vector_store.index, faiss.IndexFlat):
+        vector_store.delete(ids)
+        return
+
+    drop = set(ids)
+    keep = [
+        (pos, doc_id)
+        for pos, doc_id in sorted(vector_store.index_to_docstore_id.items())
+        if doc_id not in drop
+    ]
+    vectors = _stored_vectors(vector_store, keep)
+
+    vector_store.index = tune_index(
+        build_index(vectors, index_config(settings), settings.faiss_train_sample),
+        settings,
+    )
+    vector_store.docstore.delete(list(drop))
+    vector_store.index_to_docstore_id = {
+        i: doc_id for i, (_, doc_id) in enumerate(keep)
+    }
+
+
+def _stored_vectors(vector_store: FAISS, keep: List[tuple]) -> np.ndarray:
+    index = vector_store.index
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and not isinstance(ivf, faiss.IndexIVFFlat):
+        texts = [
+            vector_store.docstore.search(doc_id).page_content for _, doc_id in keep
+        ]
+        return np.array(
+            vector_store.embedding_function.embed_documents(texts), dtype="float32"
+        ).reshape(-1, index.d)
+
+    if ivf is not None:
+        ivf.make_direct_map()
+    vectors = np.zeros((len(keep), index.d), dtype="float32")
+    for row, (pos, _) in enumerate(keep):
+        vectors[row] = index.reconstruct(pos)
+    return vectors
+
+
+def save_store(vector_store: FAISS, index_dir: str) -> None:
+    """Writes index.faiss and the SQLite docstore (no pickle) into `index_dir`."""
+    os.makedirs(index_dir, exist_ok=True)
+    faiss.write_index(vector_store.index, os.path.join(index_dir, INDEX_FILE))
+    write_docstore(
+        os.path.join(index_dir, DOCSTORE_FILE),
+        vector_store.docstore,
+        vector_store.index_to_docstore_id,
+    )
+
+
+def load_store(
+    index_dir: str, embedding: Embeddings, settings: Settings, mode: str = "memory"
+) -> FAISS:
+    """
+    Loads an index saved by `save_store`. "mmap" memory-maps index.faiss and
+    reads chunks from SQLite per hit, so resident memory does not grow with
+    the corpus (read-only); "memory" loads everything for updates.
+    """
+    if mode not in LOAD_MODES:
+        raise ValueError(
+            f"Unknown FAISS load mode '{mode}', expected one of {LOAD_MODES}"
+        )
+    docstore_path = os.path.join(index_dir, DOCSTORE_FILE)
+    if not os.path.exists(docstore_path):
+        raise FileNotFoundError(
+            f"No {DOCSTORE_FILE} in {index_dir}; convert a pickled index with "
+            "`python -m app.chains.sqlite_docstore`."
+        )
+
+    if mode == "mmap":
+        index = faiss.read_index(os.path.join(index_dir, INDEX_FILE), _mmap_flags())
+        docstore = SQLiteDocstore(docstore_path)
+        index_to_docstore_id = PositionMap(docstore)
+    else:
+        index = faiss.read_index(os.path.join(index_dir, INDEX_FILE))
+        docstore, index_to_docstore_id = read_docstore(docstore_path)
+
+    return FAISS(
+        embedding_function=embedding,
+        index=tune_index(index, settings),
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+    )
+
+
+def _mmap_flags() -> int:
+    # IO_FLAG_MMAP_IFC (faiss >= 1.9) maps flat codes and inverted lists
+    # zero-copy; older releases only map IVF lists with IO_FLAG_MMAP
+    if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+        return faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+    return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
@@ -0,0 +1,281 @@
+# app/chains/index_manifest.py
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+from langchain.vectorstores import FAISS
+
+from app.chains.faiss_index_factory import (
+    INDEX_FILE,
+    create_vector_store,
+    delete_chunks,
+    index_config,
+    load_store,
+    save_store,
+)
+from app.chains.sqlite_docstore import DOCSTORE_FILE, LEGACY_BACKUP_FILE
+from app.config.settings import get_settings
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+# Files that are not written by a save but must survive its directory swap
+KEPT_FILES = (LEGACY_BACKUP_FILE,)
+
+
+@dataclass
+class IndexUpdatePlan:
+    """
+    What an index build has to do: which sources to (re)load and which chunks to drop.
+    """
+    index_dir: str
+    manifest: dict
+    incremental: bool
+    # doc_id -> {"path", "sha256", "mtime", "size"}
+    sources: Dict[str, dict] = field(default_factory=dict)
+    to_load: List[str] = field(default_factory=list)
+    to_delete: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(index_dir: str) -> Optional[dict]:
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+
+def scan_sources(docs_dir: str, extensions: tuple) -> Dict[str, str]:
+    """Maps doc_id (path relative to `docs_dir`) to the absolute file path."""
+    sources = {}
+    for root, _, files in os.walk(docs_dir):
+        for name in sorted(files):
+            if name.lower().endswith(extensions):
+                path = os.path.join(root, name)
+                sources[os.path.relpath(path, docs_dir).replace(os.sep, "/")] = (
+                    os.path.abspath(path)
+                )
+    return dict(sorted(sources.items()))
+
+
+def plan_update(
+    index_dir: str, sources: Dict[str, str], incremental: bool = True
+) -> IndexUpdatePlan:
+    """
+    Compares source files with the manifest stored next to index.faiss.
+    Unchanged files (same size and mtime, or same content hash) are skipped;
+    chunks of changed or deleted files are scheduled for removal.
+    Without a usable manifest, index and docstore, or when the configured
+    index type changed, the plan is a full rebuild.
+    """
+    config = index_config(get_settings())
+    manifest = load_manifest(index_dir) if incremental else None
+    if (
+        manifest is None
+        or manifest.get("index", {"type": "flat"}) != config
+        or not os.path.exists(os.path.join(index_dir, INDEX_FILE))
+        or not os.path.exists(os.path.join(index_dir, DOCSTORE_FILE))
+    ):
+        manifest, incremental = {
+            "version": MANIFEST_VERSION,
+            "index": config,
+            "files": {},
+        }, False
+
+    plan = IndexUpdatePlan(
+        index_dir=index_dir, manifest=manifest, incremental=incremental
+    )
+    known = manifest["files"]
+
+    for doc_id, path in sources.items():
+        stat = os.stat(path)
+        entry = known.get(doc_id)
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            plan.sources[doc_id] = {**entry, "path": path}
+            continue
+
+        sha = file_sha256(path)
+        plan.sources[doc_id] = {
+            "path": path,
+            "sha256": sha,
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+        }
+        if entry and entry["sha256"] == sha:
+            plan.sources[doc_id]["chunk_ids"] = entry["chunk_ids"]
+            if entry.get("merged_into"):
+                plan.sources[doc_id]["merged_into"] = entry["merged_into"]
+            continue
+
+        plan.to_load.append(doc_id)
+        if entry:
+            plan.to_delete.extend(entry["chunk_ids"])
+
+    for doc_id, entry in known.items():
+        if doc_id not in sources:
+            plan.removed.append(doc_id)
+            plan.to_delete.extend(entry["chunk_ids"])
+
+    _reload_merged(plan)
+    return plan
+
+
+def _reload_merged(plan: IndexUpdatePlan) -> None:
+    """
+    Near-duplicate chunks of a file are stored only as the kept chunk of
+    another file ("merged_into"); when that file is reloaded or removed,
+    the file's own chunks must be re-ingested too.
+    """
+    affected = set(plan.to_load) | set(plan.removed)
+    while True:
+        cascade = [
+            doc_id
+            for doc_id, source in plan.sources.items()
+            if doc_id not in plan.to_load
+            and affected.intersection(source.get("merged_into", ()))
+        ]
+        if not cascade:
+            return
+        for doc_id in cascade:
+            source = plan.sources[doc_id]
+            plan.to_load.append(doc_id)
+            plan.to_delete.extend(source.pop("chunk_ids", []))
+            source.pop("merged_into", None)
+            affected.add(doc_id)
+
+
+def apply_update(plan: IndexUpdatePlan, chunks: List[Document], embedding: Embeddings,
+                 vectors: Optional[List[List[float]]] = None) -> Optional[FAISS]:
+    """
+    Removes stale vectors, adds `chunks` (each tagged with metadata["doc_id"],
+    embedded here unless their `vectors` are given), then saves index,
+    docstore and manifest atomically.
+    Returns the updated vector store, or None when there was nothing to do.
+    """
+    if not plan.to_load and not plan.to_delete and plan.incremental:
+        return None
+
+    chunk_ids: Dict[str, List[str]] = {doc_id: [] for doc_id in plan.to_load}
+    # Prefixed by path and content, so identical copies of a file get distinct IDs
+    prefixes = {
+        doc_id: hashlib.sha256(
+            f"{doc_id}\0{plan.sources[doc_id]['sha256']}".encode("utf-8")
+        ).hexdigest()[:16]
+        for doc_id in plan.to_load
+    }
+    ids = []
+    for chunk in chunks:
+        doc_id = chunk.metadata["doc_id"]
+        chunk_id = f"{prefixes[doc_id]}-{len(chunk_ids[doc_id])}"
+        chunk_ids[doc_id].append(chunk_id)
+        ids.append(chunk_id)
+
+    settings = get_settings()
+    vector_store = None
+    if plan.incremental:
+        vector_store = load_store(plan.index_dir, embedding, settings, mode="memory")
+        if plan.to_delete:
+            delete_chunks(vector_store, plan.to_delete, settings)
+        if chunks and vectors is None:
+            vector_store.add_documents(chunks, ids=ids)
+        elif chunks:
+            vector_store.add_embeddings(
+                list(zip([c.page_content for c in chunks], vectors)),
+                [c.metadata for c in chunks],
+                ids=ids,
+            )
+    elif chunks:
+        vector_store = create_vector_store(chunks, embedding, ids, settings, vectors)
+
+    if vector_store is None:
+        raise ValueError("No documents to index.")
+
+    # Files whose near-duplicate chunks were merged into another file's chunks
+    merged_into: Dict[str, set] = {}
+    for chunk in chunks:
+        for duplicate in chunk.metadata.get("duplicate_sources", ()):
+            if duplicate.get("doc_id") not in (None, chunk.metadata["doc_id"]):
+                merged_into.setdefault(duplicate["doc_id"], set()).add(
+                    chunk.metadata["doc_id"]
+                )
+
+    files = {}
+    for doc_id, source in plan.sources.items():
+        entry = {k: v for k, v in source.items() if k != "path"}
+        if doc_id in chunk_ids:
+            entry["chunk_ids"] = chunk_ids[doc_id]
+            entry.pop("merged_into", None)
+        if doc_id in merged_into:
+            entry["merged_into"] = sorted(merged_into[doc_id])
+        files[doc_id] = entry
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "index": index_config(settings),
+        "files": files,
+    }
+
+    save_atomically(vector_store, manifest, plan.index_dir)
+    return vector_store
+
+
+def save_atomically(vector_store: FAISS, manifest: dict, index_dir: str) -> None:
+    """
+    Writes the index into a sibling temp directory, then swaps it into place
+    with renames, so readers never see a half-written index/docstore pair.
+    KEPT_FILES of the previous index are carried over.
+    """
+    index_dir = os.path.abspath(index_dir)
+    parent = os.path.dirname(index_dir)
+    os.makedirs(parent, exist_ok=True)
+    backup = f"{index_dir}.old"
+    shutil.rmtree(backup, ignore_errors=True)
+
+    tmp_dir = tempfile.mkdtemp(prefix=f".{os.path.basename(index_dir)}-", dir=parent)
+    try:
+        save_store(vector_store, tmp_dir)
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        for name in KEPT_FILES:
+            kept = os.path.join(index_dir, name)
+            if os.path.exists(kept):
+                _link_or_copy(kept, os.path.join(tmp_dir, name))
+
+        if os.path.exists(index_dir):
+            os.replace(index_dir, backup)
+        os.replace(tmp_dir, index_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    shutil.rmtree(backup, ignore_errors=True)
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def summarize(plan: IndexUpdatePlan) -> str:
+    mode = "incremental" if plan.incremental else "full rebuild"
+    return (
+        f"{mode}: {len(plan.to_load)} new/changed, {len(plan.removed)} deleted, "
+        f"{len(plan.sources) - len(plan.to_load)} unchanged, "
+        f"{len(plan.to_delete)} stale chunks"
+    )
@@ -0,0 +1,287 @@
+# app/chains/ingestion.py
+"""
+Shared document ingestion pipeline used by both index builders.
+
+Each file is read in a single PyMuPDF pass (page text and embedded images)
+by a process pool. Chunks of a file are sent to the embedding stage as soon
+as that file is done, and its images go to the optional caption stage, so
+extraction, captioning and embedding overlap.
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+from langchain.vectorstores import FAISS
+
+from app.chains.chunk_dedup import ChunkDeduplicator, minhash
+from app.chains.index_manifest import apply_update, plan_update, scan_sources, summarize
+from app.config.settings import Settings
+from app.utils.batching import make_batches
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+EXTENSIONS = (".pdf", ".txt")
+
+
+def extract_file(
+    doc_id: str,
+    path: str,
+    min_image_size: int,
+    with_images: bool,
+    minhash_perm: int = 0,
+) -> dict:
+    """
+    Runs in a worker process: reads text (and images) of one file and splits
+    the text into chunks. Images are deduplicated by xref, and images smaller
+    than `min_image_size` pixels on either side are skipped. With
+    `minhash_perm`, the chunks' MinHash signatures are computed here too.
+    """
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    pages: List[Document] = []
+    images = []
+    if path.lower().endswith(".pdf"):
+        import pymupdf
+
+        with pymupdf.open(path) as pdf:
+            seen_xrefs = set()
+            for page in pdf:
+                pages.append(
+                    Document(
+                        page_content=page.get_text(),
+                        metadata={
+                            "source": path,
+                            "page": page.number,
+                            "total_pages": pdf.page_count,
+                            "doc_id": doc_id,
+                        },
+                    )
+                )
+                if not with_images:
+                    continue
+                for img_index, img in enumerate(page.get_images(full=True)):
+                    xref = img[0]
+                    if xref in seen_xrefs:
+                        continue
+                    seen_xrefs.add(xref)
+                    base_image = pdf.extract_image(xref)
+                    if min(base_image["width"], base_image["height"]) < min_image_size:
+                        continue
+                    images.append((base_image["image"], page.number + 1, img_index))
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            pages.append(
+                Document(
+                    page_content=f.read(), metadata={"source": path, "doc_id": doc_id}
+                )
+            )
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP
+    )
+    chunks = splitter.split_documents(pages)
+    signatures = (
+        [minhash(c.page_content, minhash_perm) for c in chunks]
+        if minhash_perm
+        else None
+    )
+    return {
+        "doc_id": doc_id,
+        "pages": len(pages),
+        "chunks": chunks,
+        "signatures": signatures,
+        "images": images,
+    }
+
+
+class IngestionStats:
+    def __init__(self):
+        self.files = 0
+        self.pages = 0
+        self.chunks = 0
+        self.images = 0
+        # doc_id -> error of files that could not be read; they are not indexed
+        self.failed: Dict[str, str] = {}
+        self.dedup: Optional[ChunkDeduplicator] = None
+        self.embedding_requests_saved = 0
+        self.started = time.perf_counter()
+        self.extracted_at = self.started
+
+    def report(self) -> str:
+        extract_s = max(self.extracted_at - self.started, 1e-9)
+        total_s = max(time.perf_counter() - self.started, 1e-9)
+        return (
+            f"{self.files} files, {self.pages} pages, {self.images} images "
+            f"extracted in {extract_s:.1f}s ({self.pages / extract_s:.1f} pages/s); "
+            f"{self.chunks} chunks embedded in {total_s:.1f}s "
+            f"({self.chunks / total_s:.1f} chunks/s)"
+            + (
+                f"; {self.dedup.report(self.embedding_requests_saved)}"
+                if self.dedup is not None
+                else ""
+            )
+            + (
+                f"; {len(self.failed)} files failed: {', '.join(self.failed)}"
+                if self.failed
+                else ""
+            )
+        )
+
+
+async def ingest(sources: Dict[str, str], embedding: Embeddings, settings: Settings,
+                 caption_stage=None) -> tuple:
+    """
+    Extracts, chunks and embeds the given files (doc_id -> path).
+    Returns (chunks, vectors, stats); chunks are in `sources` order, text
+    before image captions. Files that cannot be read are skipped and
+    listed in `stats.failed`. Near-duplicate text chunks are dropped before
+    embedding (CHUNK_DEDUP_ENABLED), keeping the first in `sources` order;
+    see app/chains/chunk_dedup.py.
+    """
+    stats = IngestionStats()
+    if settings.chunk_dedup_enabled:
+        stats.dedup = ChunkDeduplicator(
+            settings.chunk_dedup_threshold, settings.chunk_dedup_num_perm
+        )
+    minhash_perm = settings.chunk_dedup_num_perm if stats.dedup is not None else 0
+    embed_limit = asyncio.Semaphore(settings.embedding_max_concurrency)
+
+    async def embed(chunks: List[Document]) -> List[List[float]]:
+        if not chunks:
+            return []
+        async with embed_limit:
+            return await embedding.aembed_documents([c.page_content for c in chunks])
+
+    def add_text(result: dict) -> None:
+        doc_chunks = result["chunks"]
+        if stats.dedup is not None:
+            doc_chunks = stats.dedup.add(doc_chunks, result["signatures"])
+            saved = _embedding_requests(
+                result["chunks"], settings
+            ) - _embedding_requests(doc_chunks, settings)
+            stats.embedding_requests_saved += saved
+        text[result["doc_id"]] = (doc_chunks, asyncio.create_task(embed(doc_chunks)))
+
+    loop = asyncio.get_running_loop()
+    workers = settings.ingest_workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=min(workers, max(1, len(sources))))
+
+    async def extract(doc_id: str, path: str) -> tuple:
+        try:
+            return doc_id, await loop.run_in_executor(
+                pool,
+                extract_file,
+                doc_id,
+                path,
+                settings.caption_min_image_size,
+                caption_stage is not None,
+                minhash_perm,
+            )
+        except Exception as e:
+            # One corrupt file must not abort the build
+            print(f"⚠️ Skipping {doc_id}: {e}")
+            stats.failed[doc_id] = str(e)
+            return doc_id, None
+
+    order = list(sources)
+    extracted: Dict[str, dict] = {}
+    text: Dict[str, tuple] = {}
+    futures = [
+        asyncio.ensure_future(extract(doc_id, path))
+        for doc_id, path in sources.items()
+    ]
+    try:
+        for future in asyncio.as_completed(futures):
+            doc_id, result = await future
+            if result is None:
+                # Keeps the failed file's place in `sources` order
+                result = {"doc_id": doc_id, "chunks": [], "signatures": []}
+            else:
+                stats.files += 1
+                stats.pages += result["pages"]
+                stats.images += len(result["images"])
+                for image_bytes, page, img_index in result["images"]:
+                    await caption_stage.submit(image_bytes, doc_id, page, img_index)
+            # Text is deduplicated in `sources` order, so the chunk kept from a
+            # duplicate cluster does not depend on which worker finished first
+            extracted[doc_id] = result
+            while len(text) < len(order) and order[len(text)] in extracted:
+                add_text(extracted.pop(order[len(text)]))
+        stats.extracted_at = time.perf_counter()
+
+        chunks: List[Document] = []
+        vectors: List[List[float]] = []
+        for doc_id in sources:
+            doc_chunks, task = text[doc_id]
+            chunks.extend(doc_chunks)
+            vectors.extend(await task)
+
+        if caption_stage is not None:
+            captions = await caption_stage.close()
+            chunks.extend(captions)
+            vectors.extend(await embed(captions))
+    finally:
+        # On failure, nothing keeps running in the background: queued files,
+        # embedding requests and caption workers are all stopped
+        for future in futures:
+            future.cancel()
+        for _, task in text.values():
+            task.cancel()
+        if caption_stage is not None:
+            caption_stage.cancel()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    stats.chunks = len(chunks)
+    return chunks, vectors, stats
+
+
+def _embedding_requests(chunks: List[Document], settings: Settings) -> int:
+    texts = [c.page_content for c in chunks]
+    return len(
+        make_batches(
+            texts, settings.embedding_batch_size, settings.embedding_batch_max_tokens
+        )
+    )
+
+
+async def build_index(
+    docs_dir: str,
+    index_dir: str,
+    embedding: Embeddings,
+    settings: Settings,
+    caption_stage=None,
+) -> Optional[FAISS]:
+    """
+    Plans an incremental update of the index in `index_dir` from the files in
+    `docs_dir`, ingests new or changed files and saves the index. Returns the
+    updated vector store, or None when it was already up to date.
+    """
+    sources = scan_sources(docs_dir, EXTENSIONS)
+    if not sources:
+        raise ValueError(f"No documents found in {docs_dir}.")
+
+    # Only new or changed files are loaded; see app/chains/index_manifest.py
+    plan = plan_update(index_dir, sources, settings.index_incremental)
+    print(f"📄 Index update plan ({summarize(plan)})")
+
+    if caption_stage is not None:
+        caption_stage.start()
+    chunks, vectors, stats = await ingest(
+        {doc_id: plan.sources[doc_id]["path"] for doc_id in plan.to_load},
+        embedding,
+        settings,
+        caption_stage,
+    )
+    print(f"⏱️ Ingestion: {stats.report()}")
+    for doc_id in stats.failed:
+        # Left out of the manifest, so the next build retries them
+        plan.to_load.remove(doc_id)
+        del plan.sources[doc_id]
+
+    # Update (or create) the FAISS index and save it with its manifest
+    return await asyncio.to_thread(apply_update, plan, chunks, embedding, vectors)
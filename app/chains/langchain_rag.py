@@ -1,21 +1,47 @@
 # app/chains/langchain_rag.py
 
-from typing import Optional, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Optional, List, TypeVar
+import asyncio
+import contextvars
 import os
+import time
 
-from langchain.vectorstores import FAISS
-from langchain.chains import RetrievalQA
-from langchain.schema import Document as LCDocument
-from langchain.embeddings.base import Embeddings
+from app.utils.startup import lazy_singleton, startup_report, timed
+
+with timed("import:langchain"):
+    from langchain.embeddings.base import Embeddings
 
 from app.config.settings import get_settings
 from app.services.azure_openai import AzureOpenAIWrapper
-from langchain.document_loaders import ImageCaptionLoader
-#from langchain.chat_models import ChatOpenAI  # or use AzureChatOpenAI if needed
-from langchain.chat_models import AzureChatOpenAI
+from app.services.request_scheduler import BATCH, request_key, request_priority
+from app.utils.helpers import get_logger
+from app.utils.tracing import current_span, span, traced
+
+if TYPE_CHECKING:
+    from langchain.schema import Document
+
+    from app.chains.answer_cache import AnswerCache
+    from app.chains.sharded_store import ShardedVectorStore
+
+logger = get_logger(__name__)
 
-settings = get_settings()
-openai_client = AzureOpenAIWrapper()
+T = TypeVar("T")
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant."
+
+# Same instructions as the "stuff" prompt used by RetrievalQA
+RAG_PROMPT_TEMPLATE = (
+    "Use the following pieces of context to answer the question at the end. "
+    "If you don't know the answer, just say that you don't know, "
+    "don't try to make up an answer.\n\n"
+    "{context}\n\n"
+    "Question: {question}\n"
+    "Helpful Answer:"
+)
+
+# Heavy objects (FAISS index, clients, retriever) are built lazily on first use
+# and memoized per process; call `warm_up()` to pay that cost ahead of time.
 
 # Define custom embedding class to wrap AzureOpenAI embeddings
 class CustomAzureEmbedding(Embeddings):
@@ -23,71 +49,444 @@ class CustomAzureEmbedding(Embeddings):
         self.client = client
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        return [self.client.get_embedding(text) for text in texts]
+        return self.client.get_embeddings(texts)
 
     def embed_query(self, text: str) -> List[float]:
         return self.client.get_embedding(text)
 
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.client.aget_embeddings(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.client.aget_embedding(text)
+
 # Get absolute path to the FAISS index directory
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # app/chains
 APP_DIR = os.path.dirname(BASE_DIR)  # app/
 FAISS_INDEX_PATH = os.path.join(APP_DIR, "data", "faiss_index")
-if not os.path.exists(os.path.join(FAISS_INDEX_PATH, "index.faiss")):
-    raise FileNotFoundError(f"FAISS index not found at {FAISS_INDEX_PATH}. Please run the index creation script.")
+
+
+@lazy_singleton("openai_client")
+def get_openai_client() -> AzureOpenAIWrapper:
+    return AzureOpenAIWrapper()
 
 
 # Load FAISS Vector Store
-def load_vector_store() -> FAISS:
-    embedding_model = CustomAzureEmbedding(openai_client)
-    return FAISS.load_local(FAISS_INDEX_PATH, embeddings=embedding_model, allow_dangerous_deserialization=True)
-
-
-
-# Setup retriever and QA chain
-vector_store = load_vector_store()
-retriever = vector_store.as_retriever(search_kwargs={"k": 3})
-
-qa_chain = RetrievalQA.from_chain_type(
-    llm=AzureChatOpenAI(
-        temperature=0,
-        openai_api_key=settings.azure_openai_api_key,
-        azure_endpoint=settings.azure_openai_endpoint,
-        api_version=settings.azure_openai_api_version,
-        deployment_name=settings.azure_openai_deployment_name
-    ),
-    retriever=retriever,
-    return_source_documents=True
-)
+def load_vector_store() -> "ShardedVectorStore":
+    settings = get_settings()
+    index_path = settings.faiss_index_path or FAISS_INDEX_PATH
+    with timed("import:faiss"):
+        from app.chains.sharded_store import ShardedVectorStore, shard_dirs
+    embedding_model = CustomAzureEmbedding(get_openai_client())
+    # One shard per collection (FAISS_SHARDS), or the whole index as one shard.
+    # "mmap" keeps each index on disk and reads only the top-k chunks per query,
+    # so several worker processes share one copy through the page cache
+    return ShardedVectorStore(
+        shard_dirs(index_path, settings),
+        embedding_model,
+        settings,
+        mode=settings.faiss_load_mode,
+    )
 
-def chat_with_rag(user_input: str, image_path: Optional[str] = None, system_prompt: Optional[str] = None) -> str:
+
+@lazy_singleton("vector_store")
+def get_vector_store() -> "ShardedVectorStore":
+    return load_vector_store()
+
+
+def reload_shards(name: Optional[str] = None) -> List[str]:
     """
-    Runs the RAG pipeline: retrieves relevant documents and generates an answer.
-    Optionally appends image captions and uses a system prompt.
+    Picks up rebuilt index shards without restarting the worker: reloads
+    shard `name`, or every shard whose index changed on disk.
+    """
+    if not get_vector_store.is_initialized():
+        return []
+    return get_vector_store().reload(name)
+
+
+@lazy_singleton("answer_cache")
+def get_answer_cache() -> "AnswerCache":
+    from app.chains.answer_cache import AnswerCache
+    settings = get_settings()
+    return AnswerCache(
+        get_vector_store(),
+        threshold=settings.answer_cache_threshold,
+        max_entries=settings.answer_cache_max_entries,
+        ttl=settings.answer_cache_ttl,
+    )
+
+
+def _answer_namespace(system_prompt: Optional[str]) -> str:
+    # Answers are only reused under the same system prompt and shard scope
+    from app.chains.sharded_store import current_scope
+    collections, filter = current_scope()
+    return request_key(
+        system_prompt or DEFAULT_SYSTEM_PROMPT, sorted(collections or []), filter
+    )
+
+
+@traced("answer_cache.lookup")
+async def alookup_answer(
+    user_input: str, system_prompt: Optional[str] = None
+) -> Optional[str]:
+    """
+    Cached validated answer of a previously asked question similar to
+    `user_input`, or None (always None unless ANSWER_CACHE_ENABLED).
     """
+    if not get_settings().answer_cache_enabled:
+        return None
+    namespace = _answer_namespace(system_prompt)
     try:
-        # Append image caption if provided
-        if image_path:
-            loader = ImageCaptionLoader([image_path])
-            docs = loader.load()
-            image_captions = "\n".join([doc.page_content for doc in docs])
-            user_input += f"\n\nImage Content:\n{image_captions}"
-
-        # Prepare input for the chain
-        prompt = system_prompt or "You are a helpful assistant."
-        
-        chain_input = {
-            "query": user_input,
-        }
-        if "system_prompt" in qa_chain.input_keys:
-            chain_input["system_prompt"] = prompt
-        else:
-            chain_input["query"] = f"{prompt}\n\n{user_input}"
+        vector = await get_openai_client().aget_embedding(user_input)
+        # The first lookup loads the vector store; a lookup may reload rebuilt shards
+        entry = await asyncio.to_thread(
+            lambda: get_answer_cache().lookup(user_input, vector, namespace)
+        )
+    except Exception as e:
+        logger.warning(f"Answer cache lookup failed, answering normally: {e}")
+        return None
+    current_span().set(hit=entry is not None)
+    if entry is None:
+        return None
+    current_span().set(similarity=round(entry.similarity, 4))
+    logger.info(
+        f"Answer cache hit (similarity {entry.similarity:.3f}): '{entry.question[:80]}'"
+    )
+    return entry.answer
 
-        result = qa_chain(chain_input)
-        # result is a dict if return_source_documents=True
-        if isinstance(result, dict) and "result" in result:
-            return result["result"]
-        return str(result)
 
+async def astore_answer(
+    user_input: str, answer: str, sources: list, system_prompt: Optional[str] = None
+) -> None:
+    """
+    Caches an answer that passed validation, with the documents (`sources`) it was
+    generated from.
+    """
+    if not get_settings().answer_cache_enabled or not sources:
+        return
+    namespace = _answer_namespace(system_prompt)
+    try:
+        cache = get_answer_cache()
+        vector = cache.pending(user_input, namespace)
+        if vector is None:
+            vector = await get_openai_client().aget_embedding(user_input)
+        cache.store(user_input, vector, answer, sources, namespace)
     except Exception as e:
-        return f"⚠️ Error during RAG or LLM response: {str(e)}"
\ No newline at end of file
+        logger.warning(f"Could not cache the answer: {e}")
+
+
+@lazy_singleton("retriever")
+def get_retriever():
+    settings = get_settings()
+    if not settings.context_packing_enabled:
+        return get_vector_store().as_retriever(
+            search_kwargs={"k": settings.retriever_top_k}
+        )
+    from app.chains.context_packing import PackedContextRetriever
+    # More candidates than the model sees: overlapping and duplicate chunks
+    # are merged away before packing into the token budget
+    return PackedContextRetriever(
+        vector_store=get_vector_store(),
+        candidates=settings.context_candidates,
+        max_chunks=settings.retriever_top_k,
+        token_budget=settings.context_token_budget,
+        dedup_threshold=settings.context_dedup_threshold,
+    )
+
+
+@lazy_singleton("rag_executor")
+def get_rag_executor() -> ThreadPoolExecutor:
+    # Bounded: FAISS search and captioning cannot take over every core of the worker
+    return ThreadPoolExecutor(
+        max_workers=max(1, get_settings().rag_cpu_workers), thread_name_prefix="rag-cpu"
+    )
+
+
+async def run_cpu_bound(fn: Callable[..., T], *args) -> T:
+    """
+    Runs blocking `fn(*args)` in the RAG executor, in the caller's context (shard scope,
+    priority, trace).
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_rag_executor(), contextvars.copy_context().run, fn, *args
+    )
+
+
+def warm_up(captioner: bool = True) -> dict:
+    """
+    Builds the clients, vector store, retriever and image captioner now
+    instead of on the first request, and returns the startup-timing report
+    (seconds per component). Front-ends that never caption images pass
+    `captioner=False` so the local model (and torch) is not loaded.
+    """
+    get_openai_client()
+    get_retriever()
+    if captioner:
+        from app.services.image_captioner import get_captioner
+        get_captioner()
+    return startup_report()
+
+@traced("caption")
+def caption_image(image: bytes) -> str:
+    """Captions an uploaded image in memory with the process-wide captioner."""
+    from app.services.image_captioner import get_captioner
+    return get_captioner().caption(image)
+
+
+def build_rag_messages(
+    question: str, docs: List["Document"], system_prompt: Optional[str] = None
+) -> list:
+    """Chat messages for answering `question` from the retrieved `docs`."""
+    context = "\n\n".join(doc.page_content for doc in docs)
+    return [
+        {"role": "system", "content": system_prompt or DEFAULT_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": RAG_PROMPT_TEMPLATE.format(context=context, question=question),
+        },
+    ]
+
+
+def _with_caption(user_input: str, image_captions: str) -> str:
+    return f"{user_input}\n\nImage Content:\n{image_captions}"
+
+
+def _rag_error(message: str) -> str:
+    return f"⚠️ Error during RAG or LLM response: {message}"
+
+
+def _search(vector: List[float]) -> List["Document"]:
+    """What the retriever returns for a query embedded as `vector`."""
+    settings = get_settings()
+    if not settings.context_packing_enabled:
+        return get_vector_store().similarity_search_by_vector(
+            vector, k=settings.retriever_top_k
+        )
+    candidates = get_vector_store().similarity_search_by_vector(
+        vector, k=settings.context_candidates
+    )
+    return get_retriever().pack(candidates)
+
+
+def retrieve(query: str) -> List["Document"]:
+    """Retriever for blocking callers: embeds `query` and searches the vector store."""
+    with span("retriever") as retriever_span:
+        docs = _search(get_openai_client().get_embedding(query))
+        retriever_span.set(documents=len(docs))
+    return docs
+
+
+async def aretrieve(query: str) -> List["Document"]:
+    """
+    Async retriever: the query embedding is awaited, FAISS search and packing run in the
+    RAG executor.
+    """
+    with span("retriever") as retriever_span:
+        vector = await get_openai_client().aget_embedding(query)
+        docs = await run_cpu_bound(_search, vector)
+        retriever_span.set(documents=len(docs))
+    return docs
+
+
+def chat_with_rag(
+    user_input: str,
+    image: Optional[bytes] = None,
+    system_prompt: Optional[str] = None,
+    sources: Optional[list] = None,
+) -> str:
+    """
+    Runs the RAG pipeline: retrieves relevant documents and generates an answer.
+    Optionally appends image captions and uses a system prompt. If `sources`
+    is given, the retrieved documents are appended to it. Blocking; request
+    handlers use `achat_with_rag`, which runs the same pipeline.
+    """
+    with span("rag.chat", image=bool(image)) as rag_span:
+        try:
+            return _chat_with_rag(user_input, image, system_prompt, sources)
+        except Exception as e:
+            rag_span.fail(e)
+            return _rag_error(str(e))
+
+
+def _chat_with_rag(
+    user_input: str,
+    image: Optional[bytes],
+    system_prompt: Optional[str],
+    sources: Optional[list],
+) -> str:
+    if image:
+        user_input = _with_caption(user_input, caption_image(image))
+
+    # Only the question is embedded; the system prompt goes to the model
+    docs = retrieve(user_input)
+    messages = build_rag_messages(user_input, docs, system_prompt)
+    answer = get_openai_client().chat_completion_sync(messages, temperature=0)
+    if sources is not None:
+        sources.extend(docs)
+    return answer
+
+
+async def achat_with_rag(
+    user_input: str,
+    image: Optional[bytes] = None,
+    system_prompt: Optional[str] = None,
+    sources: Optional[list] = None,
+    timeout: Optional[float] = None,
+) -> str:
+    """
+    Async-native `chat_with_rag`: model calls are awaited and FAISS search
+    and image captioning run in a bounded executor (RAG_CPU_WORKERS), so the
+    event loop keeps serving other requests. Gives up after `timeout` seconds
+    (RAG_TIMEOUT_SECONDS, 0 = no limit); cancelling the caller cancels the
+    in-flight model call. Errors are returned as a message, like `chat_with_rag`.
+    """
+    timeout = get_settings().rag_timeout_seconds if timeout is None else timeout
+    with span("rag.chat", image=bool(image)) as rag_span:
+        try:
+            return await asyncio.wait_for(
+                _achat_with_rag(user_input, image, system_prompt, sources),
+                timeout or None,
+            )
+        except asyncio.TimeoutError as e:
+            rag_span.fail(e)
+            return _rag_error(f"no answer within {timeout}s")
+        except Exception as e:
+            rag_span.fail(e)
+            return _rag_error(str(e))
+
+
+async def _achat_with_rag(
+    user_input: str,
+    image: Optional[bytes],
+    system_prompt: Optional[str],
+    sources: Optional[list],
+) -> str:
+    if image:
+        user_input = _with_caption(
+            user_input, await run_cpu_bound(caption_image, image)
+        )
+
+    docs = await aretrieve(user_input)
+    messages = build_rag_messages(user_input, docs, system_prompt)
+    answer = await get_openai_client().chat_completion(messages, temperature=0)
+    # Only a completed answer reports its sources
+    if sources is not None:
+        sources.extend(docs)
+    return answer
+
+
+@traced("rag.stream")
+async def astream_chat_with_rag(
+    user_input: str, image: Optional[bytes] = None, system_prompt: Optional[str] = None,
+    sources: Optional[list] = None
+) -> AsyncIterator[str]:
+    """
+    Streaming variant of `chat_with_rag`: yields answer tokens as the model
+    produces them. Errors are raised to the caller, which owns the response.
+    """
+    start = time.perf_counter()
+    if image:
+        user_input = _with_caption(
+            user_input, await run_cpu_bound(caption_image, image)
+        )
+
+    docs = await aretrieve(user_input)
+    messages = build_rag_messages(user_input, docs, system_prompt)
+
+    first_token = True
+    async for token in get_openai_client().chat_completion_stream(
+        messages, temperature=0
+    ):
+        if first_token:
+            first_token = False
+            logger.info(f"RAG time to first token: {time.perf_counter() - start:.3f}s")
+        yield token
+    # Only a completed answer reports its sources, as in `achat_with_rag`
+    if sources is not None:
+        sources.extend(docs)
+
+
+def search_many(queries: List[str], k: int) -> List[List["Document"]]:
+    """
+    Top-k chunks for several queries with one embedding batch and one FAISS search per
+    shard.
+    """
+    return get_vector_store().search_many(
+        get_openai_client().get_embeddings(queries), k
+    )
+
+
+@traced("rag.batch")
+async def abatch_chat_with_rag(
+    questions: List[str], system_prompt: Optional[str] = None
+) -> List[dict]:
+    """
+    Answers many questions at once. Identical questions are answered once,
+    all queries are embedded in batched calls and searched in one FAISS call,
+    and answers are generated concurrently (BATCH_MAX_CONCURRENCY). Returns
+    one result per question, in order: {"question", "status", "answer"|"error"},
+    with the chunks an answer was generated from under "sources".
+    Its Azure OpenAI calls yield to interactive requests.
+    """
+    with request_priority(BATCH):
+        return await _abatch_chat_with_rag(questions, system_prompt)
+
+
+async def _abatch_chat_with_rag(
+    questions: List[str], system_prompt: Optional[str]
+) -> List[dict]:
+    settings = get_settings()
+    unique = list(dict.fromkeys(q.strip() for q in questions if q and q.strip()))
+    answers: dict = {}
+    if unique:
+        k = (
+            settings.context_candidates
+            if settings.context_packing_enabled
+            else settings.retriever_top_k
+        )
+        candidates = await asyncio.to_thread(search_many, unique, k)
+        if settings.context_packing_enabled:
+            retriever = get_retriever()
+            candidates = await asyncio.gather(
+                *(run_cpu_bound(retriever.pack, docs) for docs in candidates)
+            )
+
+        client = get_openai_client()
+        limit = asyncio.Semaphore(settings.batch_max_concurrency)
+
+        async def answer(question: str, docs: List["Document"]) -> dict:
+            async with limit:
+                try:
+                    messages = build_rag_messages(question, docs, system_prompt)
+                    reply = await client.chat_completion(messages, temperature=0)
+                    return {"status": "ok", "answer": reply, "sources": docs}
+                except Exception as e:
+                    logger.warning(f"Batch answer failed for '{question[:80]}': {e}")
+                    return {"status": "error", "error": str(e)}
+
+        results = await asyncio.gather(
+            *(answer(q, docs) for q, docs in zip(unique, candidates))
+        )
+        answers = dict(zip(unique, results))
+        logger.info(f"Batch answered {len(questions)} questions ({len(unique)} unique)")
+
+    return [
+        {
+            "question": q,
+            **answers.get(
+                (q or "").strip(), {"status": "error", "error": "Empty question."}
+            ),
+        }
+        for q in questions
+    ]
+
+
+def batch_chat_with_rag(
+    questions: List[str], system_prompt: Optional[str] = None
+) -> List[dict]:
+    """
+    Blocking variant of `abatch_chat_with_rag` for scripts (evaluation runs, FAQ
+    generation).
+    """
+    return asyncio.run(abatch_chat_with_rag(questions, system_prompt))
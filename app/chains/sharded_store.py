@@ -0,0 +1,393 @@
+# app/chains/sharded_store.py
+"""
+Named FAISS index shards (one per collection) served as a single vector store.
+
+With FAISS_SHARDS=retail,pharma each collection has its own index directory
+under the index root (FAISS_INDEX_PATH/retail, ...), built from its own docs
+directory (app/data/docs/retail, ...) with
+
+    python -m app.chains.create_faiss_index --collection retail
+
+Without FAISS_SHARDS the whole index is one shard named "default".
+Queries are embedded once, the selected shards are searched in parallel and
+the hits merged by distance (all shards use the same embedding model and L2
+metric, so distances are comparable). Every hit carries
+metadata["collection"]. A shard rebuilt on disk is picked up by the next
+search after FAISS_RELOAD_INTERVAL seconds, or at once with `reload(name)`,
+without restarting workers.
+
+Requests are routed with `shard_scope`:
+
+    with shard_scope(collections=["retail"], filter={"source": "catalog.pdf"}):
+        answer = chat_with_rag(question)
+
+`route(metadata)` turns request metadata into such a scope: its "collection"
+or "collections" key selects shards, the remaining keys filter chunks.
+"""
+
+import contextvars
+import heapq
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+from langchain_core.vectorstores import VectorStore
+
+from app.config.settings import Settings
+from app.utils.helpers import get_logger
+from app.utils.tracing import span
+
+if TYPE_CHECKING:
+    from langchain.vectorstores import FAISS
+
+logger = get_logger(__name__)
+
+DEFAULT_SHARD = "default"
+# Same name as faiss_index_factory.INDEX_FILE; kept here so routing helpers
+# can be imported without loading FAISS
+INDEX_FILE = "index.faiss"
+
+_scope: ContextVar = ContextVar("shard_scope", default=(None, None))
+
+
+@contextmanager
+def shard_scope(
+    collections: Optional[Iterable[str]] = None, filter: Optional[dict] = None
+):
+    """
+    Restricts searches made inside the block to `collections` and chunks matching
+    `filter`.
+    """
+    token = _scope.set((list(collections) if collections else None, filter or None))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def current_scope() -> Tuple[Optional[List[str]], Optional[dict]]:
+    """
+    (collections, chunk filter) set by the enclosing `shard_scope`, (None, None) outside
+    one.
+    """
+    return _scope.get()
+
+
+def route(metadata: Optional[dict]) -> Tuple[Optional[List[str]], Optional[dict]]:
+    """Splits request metadata into (collections, chunk filter) for `shard_scope`."""
+    metadata = dict(metadata or {})
+    collections = metadata.pop("collections", None) or metadata.pop("collection", None)
+    if isinstance(collections, str):
+        collections = [collections]
+    return collections, metadata or None
+
+
+def shard_dirs(index_root: str, settings: Settings) -> Dict[str, str]:
+    """Shard name -> index directory for the configured collections."""
+    names = [n.strip() for n in (settings.faiss_shards or "").split(",") if n.strip()]
+    if not names:
+        return {DEFAULT_SHARD: index_root}
+    return {name: os.path.join(index_root, name) for name in names}
+
+
+def build_dirs(
+    docs_root: str, index_root: str, collection: Optional[str], settings: Settings
+) -> Tuple[str, str]:
+    """
+    (docs directory, index directory) of an index build. Shards live inside the
+    index root, so with FAISS_SHARDS set only a listed collection can be built:
+    a root build would index the collections' documents again and its atomic
+    swap of the root directory would delete every shard.
+    """
+    shards = shard_dirs(index_root, settings)
+    sharded = shards != {DEFAULT_SHARD: index_root}
+    if collection is None:
+        if sharded:
+            raise ValueError(
+                f"FAISS_SHARDS is set: build each shard with --collection "
+                f"(one of {list(shards)})"
+            )
+        return docs_root, index_root
+    if collection not in shards or not sharded:
+        raise ValueError(
+            f"'{collection}' is not listed in FAISS_SHARDS; the app would not serve it"
+        )
+    return os.path.join(docs_root, collection), shards[collection]
+
+
+class IndexShard:
+    """
+    One collection's vector store, swapped as a whole when its index changes on disk.
+    """
+
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        self.store: Optional["FAISS"] = None
+        self.version: Optional[tuple] = None
+        self.loaded_at: Optional[float] = None
+
+    def disk_version(self) -> Optional[tuple]:
+        # Rebuilds swap the whole directory in, so the file identity changes
+        try:
+            stat = os.stat(os.path.join(self.path, INDEX_FILE))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class ShardedVectorStore(VectorStore):
+    """Read-only LangChain vector store fanning queries out over named FAISS shards."""
+
+    def __init__(
+        self,
+        shards: Dict[str, str],
+        embedding: Embeddings,
+        settings: Settings,
+        mode: str = "mmap",
+    ):
+        self.embedding = embedding
+        self.settings = settings
+        self.mode = mode
+        self.reload_interval = settings.faiss_reload_interval
+        self.shards = {name: IndexShard(name, path) for name, path in shards.items()}
+        self._lock = threading.Lock()
+        self._checked = time.monotonic()
+        self._pool = ThreadPoolExecutor(
+            max_workers=max(1, settings.faiss_shard_workers),
+            thread_name_prefix="faiss-shard",
+        )
+        for name in self.shards:
+            self.load(name, required=len(self.shards) == 1)
+        if not self.loaded():
+            raise FileNotFoundError(
+                f"No FAISS shard found in {[s.path for s in self.shards.values()]}. "
+                "Please run the index creation script."
+            )
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def loaded(self) -> List[str]:
+        return [name for name, shard in self.shards.items() if shard.store is not None]
+
+    # --- Shard lifecycle ---
+
+    def load(self, name: str, required: bool = True) -> bool:
+        """
+        (Re)loads shard `name` from disk and swaps it in; in-flight searches finish on
+        the old copy.
+        """
+        shard = self.shards[name]
+        version = shard.disk_version()
+        if version is None:
+            if required:
+                raise FileNotFoundError(
+                    f"FAISS index not found at {shard.path}. "
+                    "Please run the index creation script."
+                )
+            logger.warning(
+                f"FAISS shard '{name}' has no index at {shard.path}; "
+                "skipped until it is built"
+            )
+            return False
+        from app.chains.faiss_index_factory import load_store
+        with span("shard.load", shard=name):
+            store = load_store(
+                shard.path, self.embedding, self.settings, mode=self.mode
+            )
+        # The old store (and its SQLite connection) is released once no search uses it
+        with self._lock:
+            shard.store, shard.version, shard.loaded_at = store, version, time.time()
+        logger.info(f"Loaded FAISS shard '{name}' ({store.index.ntotal} vectors)")
+        return True
+
+    def reload(self, name: Optional[str] = None) -> List[str]:
+        """
+        Reloads one shard, or every shard whose index changed on disk; returns the
+        reloaded names.
+        """
+        if name is not None:
+            return [name] if self.load(name) else []
+        reloaded = []
+        for shard in self.shards.values():
+            version = shard.disk_version()
+            if version is not None and version != shard.version:
+                try:
+                    if self.load(shard.name, required=False):
+                        reloaded.append(shard.name)
+                except Exception as e:
+                    # Keep serving the previous copy if a rebuild is unreadable
+                    logger.error(f"Failed to reload FAISS shard '{shard.name}': {e}")
+        return reloaded
+
+    def maybe_reload(self) -> None:
+        """
+        Reloads changed shards if FAISS_RELOAD_INTERVAL has passed since the last check.
+        """
+        if not self.reload_interval:
+            return
+        with self._lock:
+            if time.monotonic() - self._checked < self.reload_interval:
+                return
+            self._checked = time.monotonic()
+        self.reload()
+
+    def _selected(self, collections: Optional[List[str]]) -> List[Tuple[str, "FAISS"]]:
+        unknown = [c for c in collections or [] if c not in self.shards]
+        if unknown:
+            raise ValueError(
+                f"Unknown collections {unknown}, expected some of {list(self.shards)}"
+            )
+        with self._lock:
+            return [
+                (name, shard.store) for name, shard in self.shards.items()
+                if shard.store is not None and (not collections or name in collections)
+            ]
+
+    # --- Search ---
+
+    def _fan_out(self, search, stores: List[Tuple[str, "FAISS"]]) -> list:
+        """
+        Runs `search(name, store)` on every shard, in parallel when there are several.
+        """
+        if len(stores) == 1:
+            return [search(*stores[0])]
+        # Each shard runs in the caller's context so its spans nest under the caller's
+        futures = [
+            self._pool.submit(contextvars.copy_context().run, search, *item)
+            for item in stores
+        ]
+        return [f.result() for f in futures]
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[dict] = None,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        self.maybe_reload()
+        collections, scope_filter = _scope.get()
+        filter = filter or scope_filter
+        stores = self._selected(kwargs.pop("collections", None) or collections)
+
+        def search(name: str, store: "FAISS") -> List[Tuple[Document, float]]:
+            with span("shard.search", shard=name, k=k):
+                hits = store.similarity_search_with_score_by_vector(
+                    embedding, k, filter=filter, **kwargs
+                )
+            return [(_tagged(doc, name), score) for doc, score in hits]
+
+        with span("faiss.search", shards=len(stores), k=k):
+            return _merge(self._fan_out(search, stores), k)
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(
+            self.embedding.embed_query(query), k, **kwargs
+        )
+
+    def similarity_search(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return [
+            doc
+            for doc, _ in self.similarity_search_with_score_by_vector(
+                embedding, k, **kwargs
+            )
+        ]
+
+    def search_many(self, vectors: List[List[float]], k: int) -> List[List[Document]]:
+        """
+        Top-k chunks for several query vectors, with one multi-query FAISS search per
+        shard.
+        """
+        self.maybe_reload()
+        collections, filter = _scope.get()
+        stores = self._selected(collections)
+        if filter:
+            return [self.similarity_search_by_vector(vector, k) for vector in vectors]
+
+        import faiss
+        import numpy as np
+        queries = np.asarray(vectors, dtype="float32")
+
+        def search(name: str, store: "FAISS") -> List[List[Tuple[Document, float]]]:
+            shard_queries = queries.copy()
+            if getattr(store, "_normalize_L2", False):
+                faiss.normalize_L2(shard_queries)
+            with span("shard.search", shard=name, queries=len(vectors), k=k):
+                distances, positions = store.index.search(shard_queries, k)
+            return [
+                [
+                    (
+                        _tagged(
+                            store.docstore.search(store.index_to_docstore_id[int(i)]),
+                            name,
+                        ),
+                        float(d),
+                    )
+                    for d, i in zip(row_distances, row_positions)
+                    if i != -1
+                ]
+                for row_distances, row_positions in zip(distances, positions)
+            ]
+
+        with span("faiss.search", shards=len(stores), queries=len(vectors), k=k):
+            per_shard = self._fan_out(search, stores)
+        return [
+            [doc for doc, _ in _merge([hits[q] for hits in per_shard], k)]
+            for q in range(len(vectors))
+        ]
+
+    # --- Read-only VectorStore API ---
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        raise NotImplementedError(
+            "Shards are updated by rebuilding them with app.chains.create_faiss_index"
+        )
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        **kwargs: Any,
+    ) -> "ShardedVectorStore":
+        raise NotImplementedError("Build shards with app.chains.create_faiss_index")
+
+
+def _tagged(doc: Document, collection: str) -> Document:
+    return Document(
+        page_content=doc.page_content,
+        metadata={**doc.metadata, "collection": collection},
+    )
+
+
+def _merge(
+    results: List[List[Tuple[Document, float]]], k: int
+) -> List[Tuple[Document, float]]:
+    """Global top-k of per-shard hits by ascending L2 distance."""
+    return heapq.nsmallest(
+        k, (hit for hits in results for hit in hits), key=lambda hit: hit[1]
+    )
@@ -0,0 +1,203 @@
+# app/chains/sqlite_docstore.py
+"""
+On-disk docstore stored next to index.faiss. Chunks are keyed by their FAISS
+position, so a search only reads the rows of its top-k hits and nothing is
+unpickled at load time.
+
+    python -m app.chains.sqlite_docstore [index_dir]   # convert a legacy index.pkl
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+from typing import Dict, Iterator, Mapping, Optional, Tuple, Union
+
+from langchain.docstore.base import Docstore
+from langchain.docstore.in_memory import InMemoryDocstore
+from langchain.schema import Document
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # app/
+FAISS_INDEX_PATH = os.path.join(APP_DIR, "data", "faiss_index")
+DOCSTORE_FILE = "docstore.sqlite"
+# Pickled docstore of a migrated legacy index; index saves carry it over
+LEGACY_BACKUP_FILE = "index.pkl.bak"
+
+
+def write_docstore(
+    path: str, docstore: Docstore, index_to_docstore_id: Dict[int, str]
+) -> None:
+    """
+    Writes every chunk of a LangChain docstore, in FAISS position order, to a new SQLite
+    file.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute(
+            "CREATE TABLE chunks ("
+            "position INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, "
+            "page_content TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        rows = []
+        for position, doc_id in sorted(index_to_docstore_id.items()):
+            doc = docstore.search(doc_id)
+            if not isinstance(doc, Document):
+                raise ValueError(
+                    f"Chunk '{doc_id}' at position {position} "
+                    "is missing from the docstore"
+                )
+            rows.append(
+                (
+                    position,
+                    doc_id,
+                    doc.page_content,
+                    json.dumps(doc.metadata, ensure_ascii=False, default=str),
+                )
+            )
+        conn.executemany(
+            "INSERT INTO chunks (position, id, page_content, metadata) "
+            "VALUES (?, ?, ?, ?)",
+            rows,
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def read_docstore(path: str) -> Tuple[InMemoryDocstore, Dict[int, str]]:
+    """Loads the whole docstore into memory, for builders that update the index."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            "SELECT position, id, page_content, metadata FROM chunks ORDER BY position"
+        ).fetchall()
+    finally:
+        conn.close()
+    docs = {
+        doc_id: _document(doc_id, text, metadata) for _, doc_id, text, metadata in rows
+    }
+    return InMemoryDocstore(docs), {position: doc_id for position, doc_id, _, _ in rows}
+
+
+class SQLiteDocstore(Docstore):
+    """Read-only docstore that fetches chunk text and metadata on demand."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            f"file:{path}?mode=ro", uri=True, check_same_thread=False
+        )
+
+    def search(self, search: str) -> Union[str, Document]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT page_content, metadata FROM chunks WHERE id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return _document(search, *row)
+
+    def id_at(self, position: int) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM chunks WHERE position = ?", (position,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def all_positions(self) -> list:
+        with self._lock:
+            return [
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT position FROM chunks ORDER BY position"
+                )
+            ]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        raise NotImplementedError(
+            "SQLiteDocstore is read-only; rebuild the index to change it."
+        )
+
+    def delete(self, ids: list) -> None:
+        raise NotImplementedError(
+            "SQLiteDocstore is read-only; rebuild the index to change it."
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class PositionMap(Mapping):
+    """FAISS position -> docstore ID, looked up in SQLite instead of held in a dict."""
+
+    def __init__(self, docstore: SQLiteDocstore):
+        self._docstore = docstore
+
+    def __getitem__(self, position: int) -> str:
+        doc_id = self._docstore.id_at(int(position))
+        if doc_id is None:
+            raise KeyError(position)
+        return doc_id
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._docstore.all_positions())
+
+    def __len__(self) -> int:
+        return self._docstore.count()
+
+
+def _document(doc_id: str, page_content: str, metadata: str) -> Document:
+    return Document(id=doc_id, page_content=page_content, metadata=json.loads(metadata))
+
+
+def migrate(index_dir: str) -> None:
+    """
+    Converts the pickled docstore (index.pkl) of a legacy index into
+    docstore.sqlite. Once every chunk reads back from SQLite, index.pkl is
+    renamed to index.pkl.bak (LEGACY_BACKUP_FILE) rather than deleted.
+    """
+    import pickle
+
+    pkl_path = os.path.join(index_dir, "index.pkl")
+    sqlite_path = os.path.join(index_dir, DOCSTORE_FILE)
+    with open(pkl_path, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    try:
+        write_docstore(sqlite_path, docstore, index_to_docstore_id)
+        _verify(sqlite_path, index_to_docstore_id)
+    except Exception:
+        if os.path.exists(sqlite_path):
+            os.remove(sqlite_path)
+        raise
+
+    backup_path = os.path.join(index_dir, LEGACY_BACKUP_FILE)
+    os.replace(pkl_path, backup_path)
+    print(f"Wrote {len(index_to_docstore_id)} chunks to {sqlite_path}")
+    print(f"Previous docstore kept as {backup_path}")
+
+
+def _verify(path: str, index_to_docstore_id: Dict[int, str]) -> None:
+    docstore = SQLiteDocstore(path)
+    try:
+        mismatched = [
+            position
+            for position, doc_id in index_to_docstore_id.items()
+            if docstore.id_at(position) != doc_id
+        ]
+    finally:
+        docstore.close()
+    if mismatched:
+        raise ValueError(f"{len(mismatched)} chunks did not read back from {path}")
+
+
+if __name__ == "__main__":
+    migrate(sys.argv[1] if len(sys.argv) > 1 else FAISS_INDEX_PATH)
@@ -1,6 +1,8 @@
 # app/config/settings.py
 
 import os
+from functools import lru_cache
+from typing import Optional
 from pydantic import Field, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -22,9 +24,313 @@ class Settings(BaseSettings):
     function_enable_logging: bool = Field(default=False, description="Enable logging")
     function_enable_prompt_validation: bool = Field(default=True, description="Enable prompt validation")
     function_enable_relevance_validation: bool = Field(default=True, description="Enable relevance validation")
+    function_speculative_generation: bool = Field(
+        default=False,
+        description="Start generation while the prompt injection check runs",
+    )
+    function_warm_up_on_start: bool = Field(
+        default=False, description="Load the vector store and retriever at startup"
+    )
+
+    # Prompt injection validator tiers
+    injection_local_tier_enabled: bool = Field(
+        default=True, description="Settle clear-cut inputs without calling the LLM"
+    )
+    injection_safe_threshold: float = Field(
+        default=0.0,
+        description="Local model score at or below which input is safe "
+        "(0 = only safe rules settle input locally; must stay below 0.047)",
+    )
+    injection_unsafe_threshold: float = Field(
+        default=0.9,
+        description="Local model score at or above which input is an injection",
+    )
+    injection_cache_ttl_seconds: float = Field(
+        default=3600.0, description="Lifetime of cached injection verdicts"
+    )
+    injection_cache_max_entries: int = Field(
+        default=10000, description="Maximum cached injection verdicts"
+    )
+
+    # Answer relevance validator tiers
+    relevance_fast_path_enabled: bool = Field(
+        default=True, description="Settle clear-cut answers by embedding similarity"
+    )
+    relevance_accept_threshold: Optional[float] = Field(
+        default=None,
+        description="Score at or above which an answer is relevant "
+        "(unset = only the LLM accepts; use the calibrated value from metrics())",
+    )
+    relevance_reject_threshold: Optional[float] = Field(
+        default=None,
+        description="Score at or below which an answer is irrelevant "
+        "(unset = only the LLM rejects; use the calibrated value from metrics())",
+    )
+    relevance_source_weight: float = Field(
+        default=0.3, description="Weight of the answer's overlap with retrieved sources"
+    )
+    relevance_audit_rate: float = Field(
+        default=0.05, description="Fraction of fast-path verdicts re-checked by the LLM"
+    )
+
+    # Azure OpenAI connection pool
+    openai_max_connections: int = Field(
+        default=100, description="Maximum pooled connections to Azure OpenAI"
+    )
+    openai_max_keepalive_connections: int = Field(
+        default=20, description="Maximum idle keep-alive connections"
+    )
+    openai_keepalive_expiry: float = Field(
+        default=30.0, description="Seconds an idle connection is kept open"
+    )
+    openai_timeout_seconds: float = Field(
+        default=60.0, description="Read timeout for Azure OpenAI requests"
+    )
+
+    # Azure OpenAI request scheduling (rate limits of the deployments, 0 = unlimited)
+    openai_chat_rpm: int = Field(
+        default=0, description="Chat requests per minute allowed by the deployment"
+    )
+    openai_chat_tpm: int = Field(
+        default=0, description="Chat tokens per minute allowed by the deployment"
+    )
+    openai_embedding_rpm: int = Field(
+        default=0, description="Embedding requests per minute allowed by the deployment"
+    )
+    openai_embedding_tpm: int = Field(
+        default=0, description="Embedding tokens per minute allowed by the deployment"
+    )
+    openai_interactive_reserve: float = Field(
+        default=0.2,
+        description="Share of each rate limit kept for interactive requests",
+    )
+    openai_max_retries: int = Field(
+        default=6,
+        description="Retries for rate-limited (429), 5xx and connection errors",
+    )
+    openai_backoff_base: float = Field(
+        default=0.5, description="Base delay (s) of the jittered exponential backoff"
+    )
+    openai_backoff_max: float = Field(
+        default=30.0,
+        description="Maximum backoff delay (s), unless Retry-After is longer",
+    )
+    openai_coalesce_requests: bool = Field(
+        default=True,
+        description="Share one upstream call between identical in-flight requests",
+    )
+
+    # Embedding batching
+    embedding_batch_size: int = Field(
+        default=64, description="Maximum number of inputs per embeddings request"
+    )
+    embedding_batch_max_tokens: int = Field(
+        default=32000, description="Maximum estimated tokens per embeddings request"
+    )
+    embedding_max_concurrency: int = Field(
+        default=4, description="Maximum number of embeddings requests in flight"
+    )
+
+    # Embedding cache
+    embedding_cache_enabled: bool = Field(
+        default=True, description="Reuse embeddings from the persistent cache"
+    )
+    embedding_cache_path: Optional[str] = Field(
+        default=None,
+        description="Embedding cache file (defaults to "
+        "app/data/cache/embeddings.sqlite)",
+    )
+    embedding_cache_max_entries: int = Field(
+        default=200000, description="Maximum cached embeddings before LRU eviction"
+    )
+
+    # Index building
+    index_incremental: bool = Field(
+        default=True, description="Only re-embed new or changed documents"
+    )
+    ingest_workers: int = Field(
+        default=0,
+        description="Processes extracting documents in parallel (0 = CPU count)",
+    )
+    chunk_dedup_enabled: bool = Field(
+        default=True,
+        description="Drop near-duplicate chunks (MinHash/LSH) before embedding",
+    )
+    chunk_dedup_threshold: float = Field(
+        default=0.9,
+        description="Estimated Jaccard similarity of word shingles "
+        "at which chunks are duplicates",
+    )
+    chunk_dedup_num_perm: int = Field(
+        default=128, description="MinHash permutations per chunk signature"
+    )
+
+    # FAISS index type (flat, ivf, hnsw, ivfpq) and tuning
+    faiss_index_type: str = Field(
+        default="flat", description="FAISS index type: flat, ivf, hnsw or ivfpq"
+    )
+    faiss_nlist: int = Field(
+        default=0, description="IVF inverted lists (0 = ~4*sqrt(n))"
+    )
+    faiss_nprobe: int = Field(default=8, description="IVF lists probed per query")
+    faiss_hnsw_m: int = Field(default=32, description="HNSW neighbours per node")
+    faiss_ef_construction: int = Field(
+        default=200, description="HNSW build-time search depth"
+    )
+    faiss_ef_search: int = Field(default=64, description="HNSW query-time search depth")
+    faiss_pq_m: int = Field(
+        default=16,
+        description="PQ sub-quantizers (must divide the embedding dimension)",
+    )
+    faiss_pq_nbits: int = Field(default=8, description="Bits per PQ sub-quantizer code")
+    faiss_train_sample: int = Field(
+        default=100000, description="Vectors sampled to train IVF/PQ indexes"
+    )
+    faiss_index_path: Optional[str] = Field(
+        default=None,
+        description="Index directory served by the app (defaults to "
+        "app/data/faiss_index)",
+    )
+    faiss_load_mode: str = Field(
+        default="mmap",
+        description="Serving load mode: "
+        "mmap (memory-mapped index, SQLite docstore) or memory",
+    )
+
+    # Index shards (one per collection)
+    faiss_shards: Optional[str] = Field(
+        default=None,
+        description="Comma-separated collections served as separate index shards "
+        "(unset = one index)",
+    )
+    faiss_shard_workers: int = Field(
+        default=4, description="Shards searched in parallel per query"
+    )
+    faiss_reload_interval: float = Field(
+        default=30.0,
+        description="Seconds between checks for rebuilt shards (0 = never)",
+    )
+
+    # Retrieval context packing
+    retriever_top_k: int = Field(
+        default=3, description="Chunks sent to the model per question"
+    )
+    context_packing_enabled: bool = Field(
+        default=True, description="Merge, deduplicate and token-budget retrieved chunks"
+    )
+    context_candidates: int = Field(
+        default=8, description="Chunks retrieved per question before packing"
+    )
+    context_token_budget: int = Field(
+        default=1000, description="Maximum context tokens sent to the model"
+    )
+    context_dedup_threshold: float = Field(
+        default=0.8,
+        description="Shingle overlap above which a passage counts as a duplicate",
+    )
+
+    # RAG execution
+    rag_cpu_workers: int = Field(
+        default=4,
+        description="Threads running FAISS search and image captioning "
+        "for async requests",
+    )
+    rag_timeout_seconds: float = Field(
+        default=60.0, description="Per-request limit of achat_with_rag (0 = none)"
+    )
+
+    # Semantic answer cache
+    answer_cache_enabled: bool = Field(
+        default=False,
+        description="Serve validated answers of similar previous questions",
+    )
+    answer_cache_threshold: float = Field(
+        default=0.95,
+        description="Cosine similarity of question embeddings "
+        "at which an answer is reused",
+    )
+    answer_cache_max_entries: int = Field(
+        default=5000,
+        description="Cached answers kept (least recently used are evicted)",
+    )
+    answer_cache_ttl: float = Field(
+        default=86400.0, description="Seconds a cached answer is served"
+    )
+
+    # Batch question answering
+    batch_max_questions: int = Field(
+        default=500, description="Maximum questions accepted per batch request"
+    )
+    batch_max_concurrency: int = Field(
+        default=8, description="Answers generated concurrently for a batch"
+    )
+
+    # Image captioning during indexing
+    caption_concurrency: int = Field(
+        default=8, description="Number of image captions requested concurrently"
+    )
+    caption_min_image_size: int = Field(
+        default=64, description="Skip images whose width or height (px) is below this"
+    )
+    caption_cache_path: Optional[str] = Field(
+        default=None,
+        description="Caption cache file (defaults to app/data/cache/captions.sqlite)",
+    )
+
+    # Image captioning of uploaded query images
+    image_captioner: str = Field(
+        default="local",
+        description="Query image captioner: local (BLIP on CPU) or azure (GPT-4o)",
+    )
+    image_caption_model: str = Field(
+        default="Salesforce/blip-image-captioning-base",
+        description="Hugging Face model of the local captioner",
+    )
+    image_caption_max_size: int = Field(
+        default=512,
+        description="Longest side (px) images are downscaled to before captioning",
+    )
+
+    # Chainlit front-end of the Azure Function (app/main.py)
+    azure_function_url: str = Field(
+        default="http://localhost:7071/api/chatbot",
+        description="Chatbot endpoint of the Azure Function",
+    )
+    frontend_http2: bool = Field(
+        default=False, description="Use HTTP/2 to the Function (needs the h2 package)"
+    )
+    frontend_max_connections: int = Field(
+        default=20, description="Maximum pooled connections to the Function"
+    )
+    frontend_keepalive_expiry: float = Field(
+        default=60.0,
+        description="Seconds an idle connection to the Function is kept open",
+    )
+    upload_image_max_size: int = Field(
+        default=1024,
+        description="Longest side (px) attached images are downscaled to "
+        "before upload (0 = send as is)",
+    )
+    upload_image_quality: int = Field(
+        default=85, description="JPEG quality of re-encoded uploads"
+    )
+
+    # Request tracing
+    tracing_enabled: bool = Field(
+        default=True, description="Record per-stage spans of each request"
+    )
+    tracing_sample_rate: float = Field(
+        default=1.0, description="Fraction of requests (traces) recorded"
+    )
+    tracing_exporters: str = Field(
+        default="memory",
+        description="Comma-separated span exporters: memory, stdout, appinsights",
+    )
 
     # App Insights
-    appinsights_connection_string: str = Field(default="", description="Azure Application Insights connection string")
+    appinsights_connection_string: Optional[str] = Field(
+        default=None, description="Azure Application Insights connection string"
+    )
 
     model_config = SettingsConfigDict(env_file=env_file_name)
 
@@ -36,5 +342,7 @@ class Settings(BaseSettings):
         return v
 
 
+@lru_cache(maxsize=None)
 def get_settings() -> Settings:
+    """Parses the environment/.env file once per process and reuses the result."""
     return Settings()
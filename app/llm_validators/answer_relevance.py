@@ -1,17 +1,130 @@
 # app/llm_validators/answer_relevance.py
 
+import asyncio
+import random
+from collections import Counter, deque
+from typing import Optional
+
+from app.config.settings import get_settings
 from app.llm_validators.base import Validator
+from app.llm_validators.relevance_scorer import RelevanceScorer, calibrate
 from app.services.azure_openai import AzureOpenAIWrapper
+from app.services.request_scheduler import BATCH, request_priority
 from app.utils.helpers import get_logger
+from app.utils.tracing import current_span, traced
 
 logger = get_logger(__name__)
 
 class AnswerRelevanceValidator(Validator):
+    """
+    Tiered answer-relevance check: an embedding-similarity score settles
+    clear-cut answers, and only answers in the uncertain band go to the LLM.
+    A sample of fast-path verdicts is re-checked by the LLM in the background
+    to measure agreement and suggest calibrated thresholds.
+    """
+
     def __init__(self, openai_service: AzureOpenAIWrapper):
+        settings = get_settings()
         self.openai_service = openai_service
+        self.fast_path_enabled = settings.relevance_fast_path_enabled
+        self.scorer = RelevanceScorer(
+            accept_threshold=settings.relevance_accept_threshold,
+            reject_threshold=settings.relevance_reject_threshold,
+            source_weight=settings.relevance_source_weight,
+        )
+        self.audit_rate = settings.relevance_audit_rate
+        self.tier_counts: Counter = Counter()
+        self.agreement: Counter = Counter()
+        # (score, LLM judged relevant) pairs used to calibrate the thresholds
+        self.samples: deque = deque(maxlen=5000)
+        self._audits: set = set()
+
+    def metrics(self) -> dict:
+        """
+        How often the LLM call was skipped, how well the fast path agrees with it, and
+        suggested thresholds.
+        """
+        total = sum(self.tier_counts.values())
+        audited = sum(self.agreement.values())
+        return {
+            "total": total,
+            **{f"{tier}_count": count for tier, count in self.tier_counts.items()},
+            "llm_skip_rate": 1 - self.tier_counts["llm"] / total if total else 0.0,
+            "audited": audited,
+            "agreement_rate": self.agreement["agree"] / audited if audited else None,
+            "thresholds": {
+                "accept": self.scorer.accept_threshold,
+                "reject": self.scorer.reject_threshold,
+            },
+            "calibrated": calibrate(list(self.samples)),
+        }
+
+    @traced("validator.answer_relevance")
+    async def validate(
+        self, question: str, answer: str, sources: Optional[list] = None
+    ) -> bool:
+        """
+        Validates whether the given answer is relevant to the question ("YES"/"NO").
+        `sources` are the retrieved documents the answer was generated from, if known.
+        """
+        validator_span = current_span()
+        score = None
+        if self.fast_path_enabled:
+            try:
+                score = await self._score(question, answer, sources)
+            except Exception as e:
+                logger.warning(f"Relevance fast path failed, asking the LLM: {e}")
+        if score is not None:
+            verdict = self.scorer.classify(score)
+            validator_span.set(score=round(score, 4))
+            if verdict is not None:
+                self.tier_counts[
+                    "fast_relevant" if verdict == "YES" else "fast_irrelevant"
+                ] += 1
+                validator_span.set(tier="fast", verdict=verdict)
+                logger.info(
+                    "Answer Relevance Validator fast verdict "
+                    f"(score {score:.3f}): {verdict}"
+                )
+                if random.random() < self.audit_rate:
+                    self._audit(question, answer, score, verdict)
+                return verdict
+
+        self.tier_counts["llm"] += 1
+        response = await self._llm_validate(question, answer)
+        if score is not None and _is_verdict(response):
+            self.samples.append((score, _judged_relevant(response)))
+        validator_span.set(tier="llm", verdict=str(response))
+        return response
+
+    async def _score(
+        self, question: str, answer: str, sources: Optional[list]
+    ) -> float:
+        # The question's embedding is usually already cached by retrieval
+        question_vector, answer_vector = await self.openai_service.aget_embeddings(
+            [question, answer]
+        )
+        return self.scorer.score(question_vector, answer_vector, answer, sources)
 
-    async def validate(self, question: str, answer: str) -> bool:
-        """Validates whether the given answer is relevant to the question."""
+    def _audit(self, question: str, answer: str, score: float, verdict: str) -> None:
+        """
+        Re-checks a fast-path verdict with the LLM off the request's critical path.
+        """
+        async def audit():
+            # Audits yield to interactive requests at the scheduler
+            with request_priority(BATCH):
+                response = await self._llm_validate(question, answer)
+            if _is_verdict(response):
+                relevant = _judged_relevant(response)
+                self.samples.append((score, relevant))
+                agrees = relevant == (verdict == "YES")
+                self.agreement["agree" if agrees else "disagree"] += 1
+
+        task = asyncio.create_task(audit())
+        self._audits.add(task)
+        task.add_done_callback(self._audits.discard)
+
+    async def _llm_validate(self, question: str, answer: str):
         prompt = (
             "You are a helpful assistant evaluating the relevance of answers given to user questions.\n\n"
             "Evaluate whether the following answer correctly and directly addresses the user's question.\n\n"
@@ -25,7 +138,7 @@ class AnswerRelevanceValidator(Validator):
                 {"role": "user", "content": prompt}
             ]
             response = await self.openai_service.chat_completion(messages)
-            
+
 
             logger.info(f"Answer Relevance Validator response: {response}")
             return response
@@ -33,3 +146,14 @@ class AnswerRelevanceValidator(Validator):
         except Exception as e:
             logger.error(f"Error during answer relevance validation: {e}")
             return False  # Treat as irrelevant if evaluation fails
+
+
+def _is_verdict(response) -> bool:
+    return isinstance(response, str) and response.strip().upper().rstrip(".") in (
+        "YES",
+        "NO",
+    )
+
+
+def _judged_relevant(response: str) -> bool:
+    return response.strip().upper().startswith("YES")
@@ -0,0 +1,139 @@
+# app/llm_validators/injection_classifier.py
+
+import math
+import re
+from typing import Dict, Optional, Tuple
+
+# Clear-cut inputs settled by pattern rules alone
+SAFE_PATTERNS = [
+    re.compile(
+        r"^(hi|hello|hey|good (morning|afternoon|evening)|how are you"
+        r"|thanks?( you)?|thank you|bye|goodbye|ok(ay)?)[\s!.?]*$"
+    ),
+]
+UNSAFE_PATTERNS = [
+    re.compile(
+        r"\b(ignore|disregard|forget|override|bypass)\b.{0,40}"
+        r"\b(instructions?|prompts?|guidelines)\b"
+    ),
+    re.compile(
+        r"\b(ignore|disregard|forget)\b.{0,20}\b(previous|prior|above|earlier)\b.{0,20}"
+        r"\b(rules|context|messages?)\b"
+    ),
+    re.compile(
+        r"\b(reveal|show|print|repeat|leak)\b.{0,30}"
+        r"\b(system|hidden|initial|original)\s+(prompt|instructions?|message)\b"
+    ),
+    re.compile(r"\b(jailbreak|developer mode|dan mode|do anything now)\b"),
+    re.compile(r"\byou are (now|no longer)\b"),
+    re.compile(r"\b(always|only) (answer|respond|reply|say|output)\b.{0,20}['\"]"),
+]
+
+# Weights of a small logistic model over word unigrams/bigrams
+LEXICAL_WEIGHTS: Dict[str, float] = {
+    "ignore": 1.6,
+    "disregard": 2.0,
+    "forget": 1.2,
+    "override": 1.8,
+    "bypass": 1.8,
+    "previous": 1.0,
+    "prior": 0.8,
+    "above": 0.5,
+    "instructions": 1.8,
+    "instruction": 1.5,
+    "prompt": 1.0,
+    "system": 0.9,
+    "rules": 0.8,
+    "guidelines": 0.8,
+    "restrictions": 1.2,
+    "jailbreak": 3.0,
+    "pretend": 1.2,
+    "roleplay": 1.0,
+    "persona": 0.8,
+    "reveal": 1.2,
+    "confidential": 0.8,
+    "secret": 0.6,
+    "hidden": 0.6,
+    "filter": 0.8,
+    "censor": 1.0,
+    "act as": 1.2,
+    "are now": 1.2,
+    "from now": 1.0,
+    "new instructions": 2.0,
+    "developer mode": 2.5,
+    "no restrictions": 2.0,
+    "always answer": 1.5,
+    "respond only": 1.0,
+    "what": -0.6,
+    "how": -0.6,
+    "which": -0.4,
+    "where": -0.4,
+    "when": -0.4,
+    "why": -0.4,
+    "explain": -0.5,
+    "document": -0.5,
+    "page": -0.4,
+    "thanks": -1.0,
+    "please": -0.2,
+}
+LEXICAL_BIAS = -3.0
+
+TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def sigmoid(logit: float) -> float:
+    return 1.0 / (1.0 + math.exp(-logit))
+
+
+class LocalInjectionClassifier:
+    """
+    Cheap CPU-only first tier of prompt-injection detection.
+    Returns "YES" (injection), "NO" (safe) or None when the input is ambiguous
+    and must go to the LLM, together with the tier that decided.
+
+    Safe verdicts come from SAFE_PATTERNS; the lexical model only settles
+    inputs as safe when `safe_threshold` > 0, and that threshold must stay
+    below the score of an input without any known word, so that injections
+    the word list misses still reach the LLM.
+    """
+
+    def __init__(
+        self,
+        safe_threshold: float,
+        unsafe_threshold: float,
+        weights: Optional[Dict[str, float]] = None,
+        bias: float = LEXICAL_BIAS,
+    ):
+        if safe_threshold >= sigmoid(bias):
+            raise ValueError(
+                f"safe_threshold {safe_threshold} must be below {sigmoid(bias):.4f}, "
+                "the score of an input without known words"
+            )
+        self.safe_threshold = safe_threshold
+        self.unsafe_threshold = unsafe_threshold
+        self.weights = weights or LEXICAL_WEIGHTS
+        self.bias = bias
+
+    def score(self, text: str) -> float:
+        """Probability that `text` is an injection attempt under the lexical model."""
+        tokens = TOKEN_RE.findall(normalize(text))
+        features = set(tokens) | {f"{a} {b}" for a, b in zip(tokens, tokens[1:])}
+        return sigmoid(self.bias + sum(self.weights.get(f, 0.0) for f in features))
+
+    def classify(self, text: str) -> Tuple[Optional[str], str]:
+        normalized = normalize(text)
+        if any(p.search(normalized) for p in UNSAFE_PATTERNS):
+            return "YES", "rules"
+        if any(p.search(normalized) for p in SAFE_PATTERNS):
+            return "NO", "rules"
+
+        probability = self.score(normalized)
+        if probability >= self.unsafe_threshold:
+            return "YES", "model"
+        if probability <= self.safe_threshold:
+            return "NO", "model"
+        return None, "model"
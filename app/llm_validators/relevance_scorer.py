@@ -0,0 +1,124 @@
+# app/llm_validators/relevance_scorer.py
+
+import math
+import re
+from typing import Iterable, Optional, Sequence, Tuple
+
+TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+# Function words carry no evidence that an answer draws on its sources
+STOPWORDS = frozenset(
+    "a an and are as at be been but by can could do does for from had has have how i "
+    "if in into is it its may might more most no not of on or our should so such "
+    "than that the their them then there these they this those to was we were what "
+    "when where which while who why will with would you your".split()
+)
+
+
+def content_words(text: str) -> set:
+    return {
+        t for t in TOKEN_RE.findall(text.lower()) if len(t) > 2 and t not in STOPWORDS
+    }
+
+
+def cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = math.fsum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(math.fsum(x * x for x in a)) * math.sqrt(
+        math.fsum(y * y for y in b)
+    )
+    return dot / norm if norm else 0.0
+
+
+def source_overlap(answer: str, sources: Iterable) -> Optional[float]:
+    """
+    Share of the answer's content words found in the retrieved sources
+    (documents or their text); None if either is empty.
+    """
+    words = content_words(answer)
+    source_words = set().union(
+        *(content_words(getattr(s, "page_content", s)) for s in sources)
+    )
+    if not words or not source_words:
+        return None
+    return len(words & source_words) / len(words)
+
+
+class RelevanceScorer:
+    """
+    Cheap first tier of answer-relevance checking. The score is the cosine
+    similarity of the question and answer embeddings, blended with the
+    answer's overlap with the retrieved sources when they are known.
+    `classify` returns "YES" (relevant), "NO" or None when the score falls
+    in the uncertain band and the LLM judge must decide. Each band is off
+    until its threshold is set, e.g. to a `calibrate` value: an
+    uncalibrated band would settle answers the LLM would have judged
+    differently without it ever seeing them.
+    """
+
+    def __init__(
+        self,
+        accept_threshold: Optional[float] = None,
+        reject_threshold: Optional[float] = None,
+        source_weight: float = 0.3,
+    ):
+        self.accept_threshold = accept_threshold
+        self.reject_threshold = reject_threshold
+        self.source_weight = source_weight
+
+    def score(
+        self,
+        question_vector: Sequence[float],
+        answer_vector: Sequence[float],
+        answer: str,
+        sources: Optional[list] = None,
+    ) -> float:
+        similarity = cosine(question_vector, answer_vector)
+        overlap = source_overlap(answer, sources) if sources else None
+        if overlap is None:
+            return similarity
+        return (1 - self.source_weight) * similarity + self.source_weight * overlap
+
+    def classify(self, score: float) -> Optional[str]:
+        if self.accept_threshold is not None and score >= self.accept_threshold:
+            return "YES"
+        if self.reject_threshold is not None and score <= self.reject_threshold:
+            return "NO"
+        return None
+
+
+def calibrate(samples: Sequence[Tuple[float, bool]], min_agreement: float = 0.95,
+              min_samples: int = 20) -> Optional[dict]:
+    """
+    Thresholds at which the fast path would have agreed with the LLM judge on
+    at least `min_agreement` of `samples` ((score, judged relevant) pairs):
+    the lowest accept threshold and the highest reject threshold that qualify.
+    A band only ends on a sample of its own class, so it never reaches into
+    the other class just because its agreement leaves room for an error.
+    Returns None until there are `min_samples` samples.
+    """
+    if len(samples) < min_samples:
+        return None
+    ordered = sorted(samples)
+
+    accept = None
+    relevant = 0
+    # Walk from the top score down: the band above each cut must be mostly relevant
+    for n, (score, judged) in enumerate(reversed(ordered), start=1):
+        relevant += judged
+        if judged and relevant / n >= min_agreement:
+            accept = score
+    irrelevant = 0
+    reject = None
+    for n, (score, judged) in enumerate(ordered, start=1):
+        irrelevant += not judged
+        if not judged and irrelevant / n >= min_agreement:
+            reject = score
+
+    # Bands must not overlap: keep an uncertain band between them
+    if accept is not None and reject is not None and reject >= accept:
+        accept = reject = None
+    return {
+        "accept_threshold": round(accept, 4) if accept is not None else None,
+        "reject_threshold": round(reject, 4) if reject is not None else None,
+        "samples": len(ordered),
+    }
@@ -1,9 +1,91 @@
+import asyncio
 import chainlit as cl
 import httpx
 import os
+import time
+from typing import Optional, Tuple
 
-AZURE_FUNCTION_URL = "http://localhost:7071/api/chatbot" #"https://chatbot-multimodal.azurewebsites.net/"  #"http://localhost:7071/api/chatbot"  #os.getenv("AZURE_FUNCTION_URL")  # e.g., "https://your-func-name.azurewebsites.net/api/chatbot"
+from app.config.settings import get_settings
+from app.utils.helpers import get_logger
+from app.utils.image_utils import encode_image
+from app.utils.tracing import current_span, traced
 
+settings = get_settings()
+logger = get_logger(__name__)
+
+# e.g., "https://your-func-name.azurewebsites.net/api/chatbot"
+AZURE_FUNCTION_URL = settings.azure_function_url
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Returns the keep-alive client shared by every message, so they reuse connections to
+    the Function.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        limits = httpx.Limits(
+            max_connections=settings.frontend_max_connections,
+            max_keepalive_connections=settings.frontend_max_connections,
+            keepalive_expiry=settings.frontend_keepalive_expiry,
+        )
+        try:
+            _client = httpx.AsyncClient(http2=settings.frontend_http2, limits=limits)
+        except ImportError:
+            logger.warning(
+                "FRONTEND_HTTP2 needs the h2 package (pip install 'httpx[http2]'); "
+                "using HTTP/1.1"
+            )
+            _client = httpx.AsyncClient(limits=limits)
+    return _client
+
+
+def prepare_image(path: str, filename: str) -> Tuple[str, bytes, str]:
+    """
+    Multipart file tuple of an attached image, downscaled to UPLOAD_IMAGE_MAX_SIZE
+    and re-encoded as JPEG unless the original file is already smaller.
+    """
+    with open(path, "rb") as f:
+        original = f.read()
+    if not settings.upload_image_max_size:
+        return filename, original, "application/octet-stream"
+    try:
+        size = (settings.upload_image_max_size, settings.upload_image_max_size)
+        encoded = encode_image(
+            original, size=size, format="JPEG", quality=settings.upload_image_quality
+        )
+    except Exception:
+        # Not an image Pillow can read: let the Function report it
+        return filename, original, "application/octet-stream"
+    if len(encoded) >= len(original):
+        return filename, original, "application/octet-stream"
+    return f"{os.path.splitext(filename)[0]}.jpg", encoded, "image/jpeg"
+
+
+class TimedUpload(httpx.AsyncByteStream):
+    """Request body that notes how many bytes were sent and when the last one left."""
+
+    def __init__(self, stream: httpx.AsyncByteStream):
+        self.stream = stream
+        self.sent = 0
+        self.finished_at: Optional[float] = None
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            self.sent += len(chunk)
+            yield chunk
+        self.finished_at = time.perf_counter()
+
+    async def aclose(self) -> None:
+        await self.stream.aclose()
+
+
+@cl.on_app_shutdown
+async def on_app_shutdown():
+    if _client is not None:
+        await _client.aclose()
 
 
 @cl.on_chat_start
@@ -11,53 +93,63 @@ async def on_chat_start():
     await cl.Message(content="👋 Hello! I'm your assistant. You can send text or attach an image for multimodal answers.").send()
 
 @cl.on_message
+@traced("frontend.message")
 async def on_message(message: cl.Message):
     files = message.elements or []
-    image_bytes = None
-    image_filename = None
+    client = get_client()
+    started = time.perf_counter()
 
-    # If an image is attached, read its bytes
+    # Prepare the request
     if files:
-        file = files[0]
-        image_filename = file.name
-        with open(file.path, "rb") as f:
-            image_bytes = f.read()
+        # Downscaling is CPU-bound: keep it off the event loop
+        image = await asyncio.to_thread(prepare_image, files[0].path, files[0].name)
+        request = client.build_request(
+            "POST",
+            AZURE_FUNCTION_URL,
+            data={"message": message.content},
+            files={"image": image},
+            timeout=60
+        )
+    else:
+        request = client.build_request(
+            "POST",
+            AZURE_FUNCTION_URL,
+            json={"message": message.content},
+            timeout=30
+        )
+    body = request.stream = TimedUpload(request.stream)
+    sent_at = time.perf_counter()
+    timings = {"prepare_ms": round((sent_at - started) * 1000, 1)}
 
-    # Prepare the request payload
-    data = {"message": message.content}
-    files_payload = None
-
-    if image_bytes and image_filename:
-        files_payload = {"image": (image_filename, image_bytes, "application/octet-stream")}
-
-    async with httpx.AsyncClient() as client:
+    try:
+        res = await client.send(request, stream=True)
         try:
-            if files_payload:
-                res = await client.post(
-                    AZURE_FUNCTION_URL,
-                    data=data,
-                    files=files_payload,
-                    timeout=60
-                )
-            else:
-                res = await client.post(
-                    AZURE_FUNCTION_URL,
-                    json=data,
-                    timeout=30
-                )
-            res.raise_for_status()
-            if res.text:
-                data = res.json()
-                reply = data.get("response", "No response.")
-            else:
-                reply = "❌ Error: Empty response from server."
-        except httpx.HTTPStatusError as e:
-            try:
-                error_detail = e.response.json().get('error', str(e))
-            except Exception:
-                error_detail = str(e)
-            reply = f"❌ Error: {error_detail}"
-        except Exception as e:
-            reply = f"⚠️ Unexpected error: {str(e)}"
-
-    await cl.Message(content=f"💬 {reply}").send()
\ No newline at end of file
+            headers_at = time.perf_counter()
+            timings.update(
+                upload_bytes=body.sent,
+                upload_ms=round(((body.finished_at or headers_at) - sent_at) * 1000, 1),
+                first_byte_ms=round((headers_at - sent_at) * 1000, 1),
+                http_version=res.http_version,
+            )
+            await res.aread()
+        finally:
+            await res.aclose()
+        res.raise_for_status()
+        if res.text:
+            reply = res.json().get("response", "No response.")
+        else:
+            reply = "❌ Error: Empty response from server."
+    except httpx.HTTPStatusError as e:
+        try:
+            error_detail = e.response.json().get('error', str(e))
+        except Exception:
+            error_detail = str(e)
+        reply = f"❌ Error: {error_detail}"
+    except Exception as e:
+        reply = f"⚠️ Unexpected error: {str(e)}"
+    finally:
+        timings["round_trip_ms"] = round((time.perf_counter() - sent_at) * 1000, 1)
+        current_span().set(**timings)
+        logger.info(f"Function request timings: {timings}")
+
+    await cl.Message(content=f"💬 {reply}").send()
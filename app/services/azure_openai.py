@@ -1,19 +1,75 @@
 # app/services/azure_openai.py
-from openai import AzureOpenAI
+import httpx
+from openai import AsyncAzureOpenAI, AzureOpenAI
 #from azure.core.credentials import AzureKeyCredential
-from typing import List, Optional
-import logging
-import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import AsyncIterator, List, Optional, Tuple
+import asyncio
+import contextvars
+import threading
+import time
+from app.services.embedding_cache import get_embedding_cache
+from app.services.request_scheduler import (
+    chat_tokens,
+    get_scheduler,
+    is_retryable,
+    request_key,
+)
+from app.utils.batching import estimate_tokens, make_batches
 from app.utils.helpers import get_logger
+from app.utils.tracing import current_span, traced
 from langchain.embeddings.base import Embeddings
-from app.config.settings import get_settings
+from app.config.settings import Settings, get_settings
 
 logger = get_logger(__name__)
 
+# One connection pool per process, shared by every AzureOpenAIWrapper instance.
+# The async pool is bound to the event loop that created it.
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+_async_http_loop: Optional[asyncio.AbstractEventLoop] = None
+_http_lock = threading.Lock()
+
+
+def _http_options(settings: Settings) -> dict:
+    return {
+        "limits": httpx.Limits(
+            max_connections=settings.openai_max_connections,
+            max_keepalive_connections=settings.openai_max_keepalive_connections,
+            keepalive_expiry=settings.openai_keepalive_expiry,
+        ),
+        "timeout": httpx.Timeout(settings.openai_timeout_seconds, connect=10.0),
+    }
+
+
+def get_http_client(settings: Settings) -> httpx.Client:
+    """Returns the process-wide pooled HTTP client for synchronous calls."""
+    global _http_client
+    with _http_lock:
+        if _http_client is None or _http_client.is_closed:
+            _http_client = httpx.Client(**_http_options(settings))
+        return _http_client
+
+
+def get_async_http_client(settings: Settings) -> httpx.AsyncClient:
+    """Returns the pooled async HTTP client for the running event loop."""
+    global _async_http_client, _async_http_loop
+    loop = asyncio.get_running_loop()
+    with _http_lock:
+        if (
+            _async_http_client is None
+            or _async_http_client.is_closed
+            or _async_http_loop is not loop
+        ):
+            _async_http_client = httpx.AsyncClient(**_http_options(settings))
+            _async_http_loop = loop
+        return _async_http_client
+
 
 class AzureOpenAIWrapper:
     def __init__(self):
         settings = get_settings()
+        self.settings = settings
 
         self.api_key = settings.azure_openai_api_key
         self.endpoint = settings.azure_openai_endpoint
@@ -21,40 +77,351 @@ class AzureOpenAIWrapper:
         self.embedding_deployment = settings.azure_openai_embedding_deployment
         self.api_version = settings.azure_openai_api_version
 
+        self.embedding_batch_size = settings.embedding_batch_size
+        self.embedding_batch_max_tokens = settings.embedding_batch_max_tokens
+        self.embedding_max_concurrency = settings.embedding_max_concurrency
+        self.embedding_cache = get_embedding_cache(settings)
+
+        # Rate limits, retries and coalescing are handled by the schedulers,
+        # so the SDK's own retries are disabled
+        self.chat_scheduler = get_scheduler("chat", self.deployment_name, settings)
+        self.embedding_scheduler = get_scheduler(
+            "embeddings", self.embedding_deployment, settings
+        )
+
         self.client = AzureOpenAI(
             api_version=self.api_version,
             azure_endpoint=self.endpoint,
             api_key=self.api_key,
+            http_client=get_http_client(settings),
+            max_retries=0,
             #credential=AzureKeyCredential(self.api_key)
         )
+        self._async_client: Optional[AsyncAzureOpenAI] = None
+        self._async_http_client: Optional[httpx.AsyncClient] = None
 
-        
-   
+    @property
+    def async_client(self) -> AsyncAzureOpenAI:
+        """Async client backed by the shared pool of the running event loop."""
+        http_client = get_async_http_client(self.settings)
+        if self._async_client is None or self._async_http_client is not http_client:
+            self._async_http_client = http_client
+            self._async_client = AsyncAzureOpenAI(
+                api_version=self.api_version,
+                azure_endpoint=self.endpoint,
+                api_key=self.api_key,
+                http_client=http_client,
+                max_retries=0,
+            )
+        return self._async_client
+
+    @traced("openai.chat")
     async def chat_completion(self, user_input: str, temperature: float = 0.2, max_tokens: int = 800) -> str:
+        async def call():
+            response = await self.async_client.chat.completions.create(
+                model=self.deployment_name,
+                messages=user_input,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+            _record_usage(response)
+            return response
+
         try:
+            response = await self.chat_scheduler.arun(
+                call,
+                chat_tokens(user_input, max_tokens),
+                key=request_key(
+                    self.deployment_name, user_input, temperature, max_tokens
+                ),
+            )
+            return response.choices[0].message.content
+        except Exception as e:
+            logger.warning("Failed to generate chat completion")
+            raise RuntimeError(f"Chat completion error: {str(e)}") from e
+
+    @traced("openai.chat_stream")
+    async def chat_completion_stream(self, user_input: list, temperature: float = 0.2,
+                                     max_tokens: int = 800) -> AsyncIterator[str]:
+        """Yields the completion's content deltas as they arrive."""
+        span = current_span()
+        start, first = time.perf_counter(), True
+        try:
+            # Scheduled until the response starts; streams are never coalesced
+            stream = await self.chat_scheduler.arun(
+                lambda: self.async_client.chat.completions.create(
+                    model=self.deployment_name,
+                    messages=user_input,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=True
+                ),
+                chat_tokens(user_input, max_tokens),
+            )
+            async for chunk in stream:
+                # Azure sends content-filter chunks without choices
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first:
+                        first = False
+                        span.set(ttft_ms=round((time.perf_counter() - start) * 1000, 1))
+                    span.add("completion_chunks", 1)
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            logger.warning("Failed to stream chat completion")
+            raise RuntimeError(f"Chat completion error: {str(e)}") from e
+
+    @traced("openai.chat")
+    def chat_completion_sync(
+        self, user_input: str, temperature: float = 0.2, max_tokens: int = 800
+    ) -> str:
+        """Blocking variant of `chat_completion` for scripts and worker threads."""
+        def call():
             response = self.client.chat.completions.create(
                 model=self.deployment_name,
-                messages= user_input,
+                messages=user_input,
                 temperature=temperature,
                 max_tokens=max_tokens
             )
-            return response.choices[0].message.content 
+            _record_usage(response)
+            return response
+
+        try:
+            response = self.chat_scheduler.run(
+                call,
+                chat_tokens(user_input, max_tokens),
+                key=request_key(
+                    self.deployment_name, user_input, temperature, max_tokens
+                ),
+            )
+            return response.choices[0].message.content
         except Exception as e:
             logger.warning("Failed to generate chat completion")
-            raise RuntimeError(f"Chat completion error: {str(e)}")
+            raise RuntimeError(f"Chat completion error: {str(e)}") from e
 
-    
+    @traced("openai.embeddings")
     def get_embedding(self, text: str) -> List[float]:
+        results, missing = self._from_cache([text])
+        if not missing:
+            return results[0]
         try:
+            vectors = self._embed_batch(missing)
+        except Exception as e:
+            logger.exception("Failed to generate embedding")
+            raise RuntimeError(f"Embedding error: {str(e)}") from e
+        return self._fill_from_api([text], results, missing, vectors)[0]
+
+    @traced("openai.embeddings")
+    async def aget_embedding(self, text: str) -> List[float]:
+        results, missing = await self._afrom_cache([text])
+        if not missing:
+            return results[0]
+        try:
+            vectors = await self._aembed_batch(missing)
+        except Exception as e:
+            logger.exception("Failed to generate embedding")
+            raise RuntimeError(f"Embedding error: {str(e)}") from e
+        return (await self._afill_from_api([text], results, missing, vectors))[0]
+
+    @traced("openai.embeddings")
+    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds many texts, serving repeats from the embedding cache and sending
+        only unseen texts to the API.
+        """
+        if not texts:
+            return []
+        results, missing = self._from_cache(texts)
+        if not missing:
+            return results
+        return self._fill_from_api(texts, results, missing, self._embed_many(missing))
+
+    @traced("openai.embeddings")
+    async def aget_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Async variant of `get_embeddings`."""
+        if not texts:
+            return []
+        results, missing = await self._afrom_cache(texts)
+        if not missing:
+            return results
+        return await self._afill_from_api(
+            texts, results, missing, await self._aembed_many(missing)
+        )
+
+    def _from_cache(
+        self, texts: List[str]
+    ) -> Tuple[List[Optional[List[float]]], List[str]]:
+        """
+        Returns cached vectors (None for misses) and the unique texts still to embed.
+        """
+        if self.embedding_cache is None:
+            results = [None] * len(texts)
+        else:
+            results = self.embedding_cache.get_many(self.embedding_deployment, texts)
+        missing = list(
+            dict.fromkeys(
+                text for text, vector in zip(texts, results) if vector is None
+            )
+        )
+        current_span().set(
+            inputs=len(texts), cache_hits=sum(1 for r in results if r is not None)
+        )
+        return results, missing
+
+    def _fill_from_api(
+        self,
+        texts: List[str],
+        results: List[Optional[List[float]]],
+        missing: List[str],
+        vectors: List[List[float]],
+    ) -> List[List[float]]:
+        if self.embedding_cache is not None:
+            self.embedding_cache.put_many(self.embedding_deployment, missing, vectors)
+        by_text = dict(zip(missing, vectors))
+        return [
+            vector if vector is not None else by_text[text]
+            for text, vector in zip(texts, results)
+        ]
+
+    # The SQLite cache blocks on disk and on its lock: async callers use it
+    # from a worker thread so the event loop keeps serving other requests
+    async def _afrom_cache(
+        self, texts: List[str]
+    ) -> Tuple[List[Optional[List[float]]], List[str]]:
+        if self.embedding_cache is None:
+            return self._from_cache(texts)
+        return await asyncio.to_thread(self._from_cache, texts)
+
+    async def _afill_from_api(
+        self,
+        texts: List[str],
+        results: List[Optional[List[float]]],
+        missing: List[str],
+        vectors: List[List[float]],
+    ) -> List[List[float]]:
+        args = (texts, results, missing, vectors)
+        if self.embedding_cache is None:
+            return self._fill_from_api(*args)
+        return await asyncio.to_thread(self._fill_from_api, *args)
+
+    def _embed_many(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds many texts, packing them into batched requests sized by input count
+        and estimated tokens. Batches run concurrently and results keep input order.
+        Transient errors are retried by the scheduler; a batch rejected for its
+        content is split in half until the bad input is isolated.
+        """
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        pending = make_batches(
+            texts, self.embedding_batch_size, self.embedding_batch_max_tokens
+        )
+
+        while pending:
+            rejected: List[List[int]] = []
+            with ThreadPoolExecutor(max_workers=self.embedding_max_concurrency) as pool:
+                # Each batch runs in the caller's context so its tokens land on the
+                # caller's span
+                futures = {
+                    pool.submit(
+                        contextvars.copy_context().run,
+                        self._embed_batch,
+                        [texts[i] for i in batch],
+                    ): batch
+                    for batch in pending
+                }
+                for future in as_completed(futures):
+                    batch = futures[future]
+                    try:
+                        vectors = future.result()
+                    except Exception as e:
+                        if is_retryable(e):
+                            raise  # the scheduler's retries are exhausted
+                        logger.warning(
+                            f"Embedding batch of {len(batch)} inputs failed: {e}"
+                        )
+                        rejected.append(batch)
+                        continue
+                    for i, vector in zip(batch, vectors):
+                        results[i] = vector
+            pending = _split_batches(rejected)
+
+        self._raise_missing(results)
+        return results
+
+    async def _aembed_many(self, texts: List[str]) -> List[List[float]]:
+        """Async variant of `_embed_many`; batches overlap on the event loop."""
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        pending = make_batches(
+            texts, self.embedding_batch_size, self.embedding_batch_max_tokens
+        )
+        semaphore = asyncio.Semaphore(self.embedding_max_concurrency)
+
+        async def run(batch: List[int]) -> Optional[List[int]]:
+            async with semaphore:
+                try:
+                    vectors = await self._aembed_batch([texts[i] for i in batch])
+                except Exception as e:
+                    if is_retryable(e):
+                        raise  # the scheduler's retries are exhausted
+                    logger.warning(
+                        f"Embedding batch of {len(batch)} inputs failed: {e}"
+                    )
+                    return batch
+            for i, vector in zip(batch, vectors):
+                results[i] = vector
+            return None
+
+        while pending:
+            rejected = [
+                b for b in await asyncio.gather(*(run(b) for b in pending)) if b
+            ]
+            pending = _split_batches(rejected)
+
+        self._raise_missing(results)
+        return results
+
+    def _raise_missing(self, results: List[Optional[List[float]]]) -> None:
+        missing = sum(1 for r in results if r is None)
+        if not missing:
+            return
+        logger.error(f"{missing} of {len(results)} embedding inputs were rejected")
+        raise RuntimeError(
+            f"Embedding error: {missing} of {len(results)} inputs were rejected"
+        )
+
+    def _embed_batch(self, inputs: List[str]) -> List[List[float]]:
+        def call():
             response = self.client.embeddings.create(
-                input=[text],
+                input=inputs,
                 model=self.embedding_deployment
             )
-            return response.data[0].embedding
-        except Exception as e:
-            logger.exception("Failed to generate embedding")
-            raise RuntimeError(f"Embedding error: {str(e)}")
-    
+            _record_usage(response)
+            return [
+                item.embedding for item in sorted(response.data, key=lambda d: d.index)
+            ]
+
+        return self.embedding_scheduler.run(
+            call,
+            sum(estimate_tokens(text) for text in inputs),
+            key=request_key(self.embedding_deployment, inputs),
+        )
+
+    async def _aembed_batch(self, inputs: List[str]) -> List[List[float]]:
+        async def call():
+            response = await self.async_client.embeddings.create(
+                input=inputs,
+                model=self.embedding_deployment
+            )
+            _record_usage(response)
+            return [
+                item.embedding for item in sorted(response.data, key=lambda d: d.index)
+            ]
+
+        return await self.embedding_scheduler.arun(
+            call,
+            sum(estimate_tokens(text) for text in inputs),
+            key=request_key(self.embedding_deployment, inputs),
+        )
+
     def get_embedding_function(self) -> Embeddings:
         """
         Returns an object compatible with LangChain embedding APIs.
@@ -64,9 +431,38 @@ class AzureOpenAIWrapper:
                 self.client = client
 
             def embed_documents(self, texts: List[str]) -> List[List[float]]:
-                return [self.client.get_embedding(text) for text in texts]
+                return self.client.get_embeddings(texts)
 
             def embed_query(self, text: str) -> List[float]:
                 return self.client.get_embedding(text)
 
+            async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+                return await self.client.aget_embeddings(texts)
+
+            async def aembed_query(self, text: str) -> List[float]:
+                return await self.client.aget_embedding(text)
+
         return AzureEmbeddingWrapper(self)
+
+
+def _record_usage(response) -> None:
+    """Adds the token usage of an API response to the current span."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    span = current_span()
+    span.add("prompt_tokens", usage.prompt_tokens or 0)
+    span.add("completion_tokens", getattr(usage, "completion_tokens", None) or 0)
+
+
+def _split_batches(rejected: List[List[int]]) -> List[List[int]]:
+    """
+    Splits rejected batches in half so a single bad input cannot sink its
+    neighbours; a rejected single input is final.
+    """
+    pending: List[List[int]] = []
+    for batch in rejected:
+        half = len(batch) // 2
+        if half:
+            pending.extend([batch[:half], batch[half:]])
+    return pending
@@ -0,0 +1,184 @@
+# app/services/embedding_cache.py
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional
+
+from app.config.settings import Settings
+from app.utils.helpers import get_logger
+
+logger = get_logger(__name__)
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # app/
+DEFAULT_CACHE_PATH = os.path.join(APP_DIR, "data", "cache", "embeddings.sqlite")
+
+_cache: Optional["EmbeddingCache"] = None
+_cache_unavailable = False
+_cache_lock = threading.Lock()
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding store shared by indexing and query paths.
+    Keys are (deployment, hash of whitespace-normalized text); vectors are
+    stored as float32 blobs. The least recently used entries are evicted
+    once `max_entries` is exceeded. Hits record their access time in memory;
+    it is written with the next insert or every `touch_batch` hits. Write
+    errors are logged and ignored: the cache never fails an embedding call.
+    """
+
+    def __init__(self, path: str, max_entries: int = 200_000, touch_batch: int = 256):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_batch = touch_batch
+        self.hits = 0
+        self.misses = 0
+        self.write_errors = 0
+        self._lock = threading.Lock()
+        # key -> last access of hits not written yet
+        self._touched: Dict[str, float] = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, deployment TEXT NOT NULL, vector BLOB NOT NULL, "
+            "last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access "
+            "ON embeddings (last_access)"
+        )
+        self._conn.commit()
+        self._entries = self._conn.execute(
+            "SELECT COUNT(*) FROM embeddings"
+        ).fetchone()[0]
+
+    @staticmethod
+    def key(deployment: str, text: str) -> str:
+        normalized = " ".join(text.split())
+        return hashlib.sha256(f"{deployment}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def get_many(
+        self, deployment: str, texts: List[str]
+    ) -> List[Optional[List[float]]]:
+        """Returns cached vectors in input order, None for misses."""
+        keys = [self.key(deployment, text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            unique = list(dict.fromkeys(keys))
+            for start in range(0, len(unique), 500):
+                part = unique[start:start + 500]
+                rows = self._conn.execute(
+                    "SELECT key, vector FROM embeddings WHERE key IN "
+                    f"({','.join('?' * len(part))})",
+                    part,
+                ).fetchall()
+                found.update({key: array("f", blob).tolist() for key, blob in rows})
+            if found:
+                now = time.time()
+                self._touched.update((key, now) for key in found)
+                if len(self._touched) >= self.touch_batch:
+                    self._write(self._flush_touched)
+
+        results = [found.get(key) for key in keys]
+        hits = sum(1 for r in results if r is not None)
+        self.hits += hits
+        self.misses += len(results) - hits
+        return results
+
+    def put_many(
+        self, deployment: str, texts: List[str], vectors: List[List[float]]
+    ) -> None:
+        now = time.time()
+        rows = [
+            (self.key(deployment, text), deployment, array("f", vector).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._write(self._insert, rows)
+
+    def _write(self, operation, *args) -> None:
+        """Runs and commits a write; caller holds the lock."""
+        try:
+            operation(*args)
+            self._conn.commit()
+        except sqlite3.Error as e:
+            self.write_errors += 1
+            logger.warning(f"Embedding cache write failed, not cached: {e}")
+            try:
+                self._conn.rollback()
+            except sqlite3.Error:
+                pass
+
+    def _flush_touched(self) -> None:
+        touched, self._touched = self._touched, {}
+        self._conn.executemany(
+            "UPDATE embeddings SET last_access = ? WHERE key = ?",
+            [(when, key) for key, when in touched.items()],
+        )
+
+    def _insert(self, rows: list) -> None:
+        # Pending access times first, so eviction sees recent hits
+        self._flush_touched()
+        before = self._conn.total_changes
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO embeddings "
+            "(key, deployment, vector, last_access) VALUES (?, ?, ?, ?)",
+            rows,
+        )
+        self._entries += self._conn.total_changes - before
+        if self._entries > self.max_entries:
+            self._evict()
+
+    def _evict(self) -> None:
+        # Trim to 90% of the limit so eviction is not paid on every insert
+        excess = self._entries - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+            (excess,),
+        )
+        self._entries = self._conn.execute(
+            "SELECT COUNT(*) FROM embeddings"
+        ).fetchone()[0]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self._entries,
+            "write_errors": self.write_errors,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._touched:
+                self._write(self._flush_touched)
+            self._conn.close()
+
+
+def get_embedding_cache(settings: Settings) -> Optional[EmbeddingCache]:
+    """
+    Returns the process-wide embedding cache, or None when it is disabled
+    or cannot be opened (e.g. a read-only deployment package).
+    """
+    global _cache, _cache_unavailable
+    if not settings.embedding_cache_enabled or _cache_unavailable:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            path = settings.embedding_cache_path or DEFAULT_CACHE_PATH
+            try:
+                _cache = EmbeddingCache(path, settings.embedding_cache_max_entries)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Embedding cache disabled, cannot open {path}: {e}")
+                _cache_unavailable = True
+                return None
+        return _cache
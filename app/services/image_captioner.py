@@ -0,0 +1,124 @@
+# app/services/image_captioner.py
+
+import threading
+import time
+from collections import deque
+
+from app.config.settings import get_settings
+from app.services.azure_openai import AzureOpenAIWrapper
+from app.utils.helpers import get_logger
+from app.utils.image_utils import base64_to_image, preprocess_image
+from app.utils.startup import lazy_singleton
+from app.utils.stats import peak_rss_mb, percentiles
+
+logger = get_logger(__name__)
+
+CAPTION_PROMPT = "Describe this image in one sentence."
+CAPTIONERS = ("local", "azure")
+
+
+def caption_messages(image_b64: str) -> list:
+    """Chat messages asking the model to caption a base64-encoded JPEG."""
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": CAPTION_PROMPT},
+                {
+                    "type": "image_url",
+                    "image_url": {"url": f"data:image/jpeg;base64,{image_b64}"},
+                },
+            ],
+        }
+    ]
+
+
+class LocalImageCaptioner:
+    """BLIP captioning model loaded once and run on CPU."""
+
+    def __init__(self, model_name: str):
+        from transformers import BlipForConditionalGeneration, BlipProcessor
+
+        self.model_name = model_name
+        self.processor = BlipProcessor.from_pretrained(model_name)
+        self.model = BlipForConditionalGeneration.from_pretrained(model_name).eval()
+        # Generation is CPU-bound; concurrent calls would only compete for cores
+        self._lock = threading.Lock()
+
+    def caption(self, image_b64: str) -> str:
+        import torch
+
+        inputs = self.processor(images=base64_to_image(image_b64), return_tensors="pt")
+        with self._lock, torch.inference_mode():
+            output = self.model.generate(**inputs, max_new_tokens=30)
+        return self.processor.decode(output[0], skip_special_tokens=True).strip()
+
+
+class AzureImageCaptioner:
+    """Captions images with the Azure OpenAI chat deployment (GPT-4o)."""
+
+    def __init__(self, openai_service: AzureOpenAIWrapper):
+        self.openai_service = openai_service
+
+    def caption(self, image_b64: str) -> str:
+        return self.openai_service.chat_completion_sync(
+            caption_messages(image_b64)
+        ).strip()
+
+
+class CaptionService:
+    """
+    Process-wide captioner for query images: downscales the image in memory,
+    captions it and keeps per-image latency and peak-memory figures.
+    """
+
+    def __init__(self, captioner, max_size: int):
+        self.captioner = captioner
+        self.max_size = max_size
+        self.latencies_ms: deque = deque(maxlen=1000)
+        self.images = 0
+
+    def caption(self, image_bytes: bytes) -> str:
+        start = time.perf_counter()
+        rss_before = peak_rss_mb()
+        image_b64 = preprocess_image(image_bytes, size=(self.max_size, self.max_size))
+        preprocess_ms = (time.perf_counter() - start) * 1000
+        caption = self.captioner.caption(image_b64)
+        latency_ms = (time.perf_counter() - start) * 1000
+        self.latencies_ms.append(latency_ms)
+        self.images += 1
+
+        rss_after = peak_rss_mb()
+        memory = (
+            f", peak RSS {rss_after:.0f} MB (+{rss_after - rss_before:.0f})"
+            if rss_after is not None
+            else ""
+        )
+        logger.info(
+            f"Captioned {len(image_bytes) / 1024:.0f} KB image in {latency_ms:.0f} ms "
+            f"(preprocess {preprocess_ms:.0f} ms{memory})"
+        )
+        return caption
+
+    def stats(self) -> dict:
+        return {
+            "images": self.images,
+            **percentiles(list(self.latencies_ms)),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+
+@lazy_singleton("captioner")
+def get_captioner() -> CaptionService:
+    settings = get_settings()
+    if settings.image_captioner not in CAPTIONERS:
+        raise ValueError(
+            f"Unknown image captioner '{settings.image_captioner}', "
+            f"expected one of {CAPTIONERS}"
+        )
+    if settings.image_captioner == "local":
+        captioner = LocalImageCaptioner(settings.image_caption_model)
+    else:
+        from app.chains.langchain_rag import get_openai_client
+        captioner = AzureImageCaptioner(get_openai_client())
+    return CaptionService(captioner, settings.image_caption_max_size)
@@ -0,0 +1,425 @@
+# app/services/request_scheduler.py
+"""
+Client-side scheduling of Azure OpenAI calls: every chat and embeddings
+request of a deployment goes through one `RequestScheduler`, which
+
+- waits for room in the deployment's requests-per-minute and
+  tokens-per-minute buckets (OPENAI_*_RPM / OPENAI_*_TPM, 0 = unlimited),
+- serves interactive requests first: batch work (indexing, bulk answering)
+  waits while interactive requests are queued and cannot use the last
+  OPENAI_INTERACTIVE_RESERVE share of either bucket,
+- retries 429, 5xx and connection errors with jittered exponential backoff,
+  never sooner than the server's Retry-After, and pauses the whole
+  deployment for that long,
+- coalesces identical in-flight requests so duplicates share one call.
+
+Batch callers mark their work with `request_priority(BATCH)`.
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+import openai
+
+from app.config.settings import Settings
+from app.utils.batching import estimate_tokens
+from app.utils.helpers import get_logger
+from app.utils.tracing import current_span
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# Rough prompt-token cost of one image part (a 512px tile at high detail)
+IMAGE_TOKENS = 765
+
+_priority: ContextVar = ContextVar("request_priority", default=INTERACTIVE)
+_schedulers: Dict[Tuple[str, str], "RequestScheduler"] = {}
+_schedulers_lock = threading.Lock()
+
+
+@contextmanager
+def request_priority(priority: str):
+    """
+    Runs the calls made inside the block (and tasks/threads started from it) at
+    `priority`.
+    """
+    if priority not in (INTERACTIVE, BATCH):
+        raise ValueError(
+            f"Unknown request priority '{priority}', "
+            f"expected '{INTERACTIVE}' or '{BATCH}'"
+        )
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds the server asked us to wait (retry-after-ms or Retry-After), or None."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is None:
+        return None
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after") is not None:
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, openai.APIConnectionError):
+        return True
+    return getattr(exc, "status_code", None) in RETRYABLE_STATUS
+
+
+def chat_tokens(messages: list, max_tokens: int) -> int:
+    """Tokens a chat request counts against TPM: estimated prompt plus `max_tokens`."""
+    total = max_tokens
+    for message in messages:
+        content = message.get("content") or ""
+        parts = (
+            content
+            if isinstance(content, list)
+            else [{"type": "text", "text": content}]
+        )
+        for part in parts:
+            total += (
+                estimate_tokens(part.get("text", ""))
+                if part.get("type") == "text"
+                else IMAGE_TOKENS
+            )
+    return total
+
+
+def request_key(*parts) -> str:
+    """
+    Identity of a request for coalescing (model, messages/inputs and sampling
+    parameters).
+    """
+    return hashlib.sha256(
+        json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+class TokenBucket:
+    """
+    Refills `per_minute` units per minute up to one minute's worth; 0 means unlimited.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.rate = per_minute / 60.0
+        self._updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_for(self, amount: float, reserve: float) -> float:
+        """Seconds until `amount` fits above `reserve`; 0 if it fits now."""
+        if not self.capacity:
+            return 0.0
+        amount = min(amount, self.capacity - reserve)
+        missing = amount + reserve - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float) -> None:
+        if self.capacity:
+            self.level -= min(amount, self.capacity)
+
+
+class RequestScheduler:
+    """Rate limiting, prioritization, retries and coalescing for one deployment."""
+
+    def __init__(
+        self,
+        name: str,
+        rpm: int,
+        tpm: int,
+        max_retries: int = 6,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        interactive_reserve: float = 0.2,
+        coalesce: bool = True,
+    ):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.interactive_reserve = interactive_reserve
+        self.coalesce = coalesce
+        self.stats = {
+            "calls": 0,
+            "retries": 0,
+            "throttled": 0,
+            "coalesced": 0,
+            "wait_s": 0.0,
+        }
+        self._paused_until = 0.0
+        self._interactive_waiting = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._ainflight: Dict[Tuple[int, str], "_SharedCall"] = {}
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "scheduler": self.name,
+                **self.stats,
+                "wait_s": round(self.stats["wait_s"], 3),
+            }
+
+    # --- Admission ---
+
+    def _try_acquire(self, tokens: int, priority: str) -> float:
+        """
+        Takes one request and `tokens` from the buckets, or returns the seconds to wait
+        first.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._paused_until > now:
+                return self._paused_until - now
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            if priority == BATCH and self._interactive_waiting:
+                # Re-check shortly: queued interactive requests go first
+                return 0.05
+            reserve = self.interactive_reserve if priority == BATCH else 0.0
+            wait = max(
+                self.requests.wait_for(1, self.requests.capacity * reserve),
+                self.tokens.wait_for(tokens, self.tokens.capacity * reserve),
+            )
+            if wait <= 0:
+                self.requests.take(1)
+                self.tokens.take(tokens)
+            return wait
+
+    def _queued(self, priority: str, delta: int) -> None:
+        if priority == INTERACTIVE:
+            with self._lock:
+                self._interactive_waiting += delta
+
+    def _acquire(self, tokens: int) -> float:
+        """Blocks until the request is admitted; returns the seconds spent waiting."""
+        priority = _priority.get()
+        wait, waited = self._try_acquire(tokens, priority), 0.0
+        if not wait:
+            return waited
+        self._queued(priority, 1)
+        try:
+            while wait:
+                time.sleep(wait)
+                waited += wait
+                wait = self._try_acquire(tokens, priority)
+        finally:
+            self._queued(priority, -1)
+        return waited
+
+    async def _aacquire(self, tokens: int) -> float:
+        priority = _priority.get()
+        wait, waited = self._try_acquire(tokens, priority), 0.0
+        if not wait:
+            return waited
+        self._queued(priority, 1)
+        try:
+            while wait:
+                await asyncio.sleep(wait)
+                waited += wait
+                wait = self._try_acquire(tokens, priority)
+        finally:
+            self._queued(priority, -1)
+        return waited
+
+    # --- Retries ---
+
+    def _backoff(self, exc: BaseException, attempt: int) -> Optional[float]:
+        """Delay before retrying after `exc`, or None if it should be raised."""
+        if attempt >= self.max_retries or not is_retryable(exc):
+            return None
+        hint = retry_after(exc)
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+        with self._lock:
+            self.stats["retries"] += 1
+            if getattr(exc, "status_code", None) == 429:
+                self.stats["throttled"] += 1
+                if hint:
+                    # The whole deployment is out of quota, not just this request
+                    self._paused_until = max(
+                        self._paused_until, time.monotonic() + hint
+                    )
+        delay = max(delay, hint or 0.0)
+        logger.warning(
+            f"{self.name} call failed ({type(exc).__name__}), "
+            f"retry {attempt + 1} in {delay:.2f}s"
+        )
+        return delay
+
+    def _run(self, call: Callable[[], T], tokens: int) -> T:
+        attempt, waited = 0, 0.0
+        try:
+            while True:
+                waited += self._acquire(tokens)
+                try:
+                    return call()
+                except Exception as e:
+                    delay = self._backoff(e, attempt)
+                    if delay is None:
+                        raise
+                time.sleep(delay)
+                attempt += 1
+        finally:
+            self._record(attempt, waited)
+
+    async def _arun(self, call: Callable[[], Awaitable[T]], tokens: int) -> T:
+        attempt, waited = 0, 0.0
+        try:
+            while True:
+                waited += await self._aacquire(tokens)
+                try:
+                    return await call()
+                except Exception as e:
+                    delay = self._backoff(e, attempt)
+                    if delay is None:
+                        raise
+                await asyncio.sleep(delay)
+                attempt += 1
+        finally:
+            self._record(attempt, waited)
+
+    def _record(self, retries: int, waited: float) -> None:
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["wait_s"] += waited
+        current_span().set(retries=retries, queued_ms=round(waited * 1000, 1))
+
+    # --- Entry points ---
+
+    def run(self, call: Callable[[], T], tokens: int, key: Optional[str] = None) -> T:
+        """
+        Runs the blocking `call`; callers passing the same `key` concurrently share its
+        result.
+        """
+        if key is None or not self.coalesce:
+            return self._run(call, tokens)
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            current_span().set(coalesced=True)
+            return future.result()
+        try:
+            result = self._run(call, tokens)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    async def arun(
+        self, call: Callable[[], Awaitable[T]], tokens: int, key: Optional[str] = None
+    ) -> T:
+        """
+        Async variant of `run`; `call` returns a fresh awaitable per attempt.
+        Coalesced calls run as a task owned by the scheduler: a cancelled
+        caller stops waiting, and the call is cancelled once nobody waits.
+        """
+        if key is None or not self.coalesce:
+            return await self._arun(call, tokens)
+        loop = asyncio.get_running_loop()
+        inflight_key = (id(loop), key)
+        with self._lock:
+            shared = self._ainflight.get(inflight_key)
+            if shared is None or shared.task.done():
+                task = loop.create_task(self._arun(call, tokens))
+                task.add_done_callback(lambda done: self._release(inflight_key, done))
+                shared = self._ainflight[inflight_key] = _SharedCall(task)
+            else:
+                self.stats["coalesced"] += 1
+                current_span().set(coalesced=True)
+            shared.waiters += 1
+        try:
+            return await asyncio.shield(shared.task)
+        except asyncio.CancelledError:
+            with self._lock:
+                shared.waiters -= 1
+                abandoned = shared.waiters == 0
+            if abandoned:
+                shared.task.cancel()
+            raise
+
+    def _release(self, inflight_key: Tuple[int, str], task: asyncio.Task) -> None:
+        with self._lock:
+            shared = self._ainflight.get(inflight_key)
+            if shared is not None and shared.task is task:
+                del self._ainflight[inflight_key]
+        if not task.cancelled():
+            task.exception()  # waiters re-raise it; don't log it as unretrieved
+
+
+class _SharedCall:
+    """An in-flight coalesced call and the number of callers awaiting it."""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+def get_scheduler(kind: str, deployment: str, settings: Settings) -> RequestScheduler:
+    """
+    Process-wide scheduler for the `kind` ("chat" or "embeddings") calls of a
+    deployment.
+    """
+    key = (kind, deployment)
+    with _schedulers_lock:
+        if key not in _schedulers:
+            rpm, tpm = (
+                (settings.openai_chat_rpm, settings.openai_chat_tpm) if kind == "chat"
+                else (settings.openai_embedding_rpm, settings.openai_embedding_tpm)
+            )
+            _schedulers[key] = RequestScheduler(
+                f"{kind}:{deployment}", rpm, tpm,
+                max_retries=settings.openai_max_retries,
+                backoff_base=settings.openai_backoff_base,
+                backoff_max=settings.openai_backoff_max,
+                interactive_reserve=settings.openai_interactive_reserve,
+                coalesce=settings.openai_coalesce_requests,
+            )
+        return _schedulers[key]
+
+
+def scheduler_metrics() -> list:
+    """Counters of every scheduler in this process."""
+    with _schedulers_lock:
+        schedulers = list(_schedulers.values())
+    return [s.metrics() for s in schedulers]
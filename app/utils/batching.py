@@ -0,0 +1,33 @@
+# app/utils/batching.py
+
+from typing import List
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for request sizing."""
+    return len(text) // 4 + 1
+
+
+def make_batches(texts: List[str], max_items: int, max_tokens: int) -> List[List[int]]:
+    """
+    Groups texts into batches bounded by input count and estimated token count.
+    Returns lists of input positions so results can be put back in input order.
+    A single text larger than `max_tokens` still gets its own batch.
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (
+            len(current) >= max_items or current_tokens + tokens > max_tokens
+        ):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+    return batches
@@ -1,53 +1,34 @@
 # app/utils/build_faiss_index.py
 
-import os
-from langchain.vectorstores import FAISS
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.document_loaders import DirectoryLoader, TextLoader, UnstructuredPDFLoader
+import asyncio
+from app.chains.ingestion import build_index
+from app.chains.sharded_store import build_dirs
 from app.config.settings import get_settings
+from app.services.azure_openai import AzureOpenAIWrapper
+from app.services.request_scheduler import BATCH, request_priority
 
 # Get app settings
 settings = get_settings()
 
 # Initialize the embedding model
-embedding_model = OpenAIEmbeddings(
-    deployment=settings.azure_openai_embedding_deployment,
-    openai_api_key=settings.azure_openai_api_key,
-    openai_api_base=settings.azure_openai_endpoint,
-    openai_api_version=settings.azure_openai_api_version,
-    openai_api_type="azure"
-)
-
-def load_documents(directory: str):
-    """Load documents from the specified directory."""
-    loaders = [
-        TextLoader,
-        UnstructuredPDFLoader
-    ]
-    docs = []
-    for loader_cls in loaders:
-        loader = DirectoryLoader(directory, loader_cls=loader_cls)
-        docs.extend(loader.load())
-    return docs
+embedding_model = AzureOpenAIWrapper().get_embedding_function()
 
 def build_faiss_index():
-    """Load documents, create FAISS index, and save it locally."""
-    doc_path = "data/docs"  # Directory where docs are located
-    documents = load_documents(doc_path)
-
-    if not documents:
-        raise ValueError("No documents found in the directory.")
-
-    print(f"Loaded {len(documents)} documents.")
-
-    # Create FAISS index from documents
-    db = FAISS.from_documents(documents, embedding_model)
+    """
+    Load new or changed documents (text only), update the FAISS index, and save it
+    locally.
+    """
+    # Directories where docs are located and the index is saved (unsharded only)
+    doc_path, index_path = build_dirs("data/docs", "data/faiss_index", None, settings)
+
+    # Same pipeline as app/chains/create_faiss_index.py, without image captioning
+    with request_priority(BATCH):
+        db = asyncio.run(build_index(doc_path, index_path, embedding_model, settings))
+    if db is None:
+        print("✅ FAISS index is already up to date.")
+        return
 
-    # Save the FAISS index to the specified directory
-    index_path = "data/faiss_index"
-    db.save_local(index_path)
     print(f"✅ FAISS index built and saved to '{index_path}'")
 
 if __name__ == "__main__":
     build_faiss_index()
-    
\ No newline at end of file
@@ -0,0 +1,53 @@
+# app/utils/caption_cache.py
+
+import hashlib
+import os
+import sqlite3
+import time
+from typing import Optional
+
+
+class CaptionCache:
+    """
+    Persistent, content-addressed store of image captions.
+    Keys are a hash of the image bytes plus a version string (model and prompt),
+    so changing either one naturally invalidates old captions.
+    """
+
+    def __init__(self, path: str, version: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS captions (key TEXT PRIMARY KEY, "
+            "caption TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def key(self, image_bytes: bytes) -> str:
+        digest = hashlib.sha256(self.version.encode("utf-8"))
+        digest.update(image_bytes)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._conn.execute(
+            "SELECT caption FROM captions WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, key: str, caption: str) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO captions (key, caption, created) VALUES (?, ?, ?)",
+            (key, caption, time.time()),
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
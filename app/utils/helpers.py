@@ -1,17 +1,26 @@
 # app/utils/helpers.py
 
 import logging
+from functools import lru_cache
 from opencensus.ext.azure.log_exporter import AzureLogHandler
 from app.config.settings import get_settings
 
 
+@lru_cache(maxsize=None)
+def _azure_log_handler(connection_string: str) -> AzureLogHandler:
+    """One exporter per process, shared by every logger."""
+    return AzureLogHandler(connection_string=connection_string)
+
+
 def get_logger(name: str) -> logging.Logger:
     settings = get_settings()
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
     
+    # Idempotent: calling get_logger again must not export each record twice
     if settings.function_enable_logging and settings.appinsights_connection_string:
-        handler = AzureLogHandler(connection_string=settings.appinsights_connection_string)
-        logger.addHandler(handler)
+        handler = _azure_log_handler(settings.appinsights_connection_string)
+        if handler not in logger.handlers:
+            logger.addHandler(handler)
     
     return logger
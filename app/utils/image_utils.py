@@ -1,14 +1,41 @@
 import base64
 import io
+from typing import Optional, Union
 from PIL import Image
+from app.utils.helpers import get_logger
 
-def preprocess_image(file_path: str, size: tuple = (512, 512)) -> str:
-    """Loads, resizes, and encodes an image to base64."""
+logger = get_logger(__name__)
+
+
+def preprocess_image(
+    source: Union[str, bytes], size: tuple = (512, 512), format: str = "JPEG"
+) -> str:
+    """
+    Loads an image (file path or raw bytes), downscales it to fit within
+    `size` keeping its aspect ratio, and encodes it to base64.
+    """
+    data = encode_image(source, size=size, format=format)
+    return base64.b64encode(data).decode("utf-8")
+
+
+def encode_image(
+    source: Union[str, bytes],
+    size: tuple = (512, 512),
+    format: str = "JPEG",
+    quality: Optional[int] = None,
+) -> bytes:
+    """
+    Loads an image (file path or raw bytes), downscales it to fit within
+    `size` keeping its aspect ratio, and re-encodes it (JPEG `quality` 1-95).
+    """
     try:
-        image = Image.open(file_path).convert("RGB")
+        image = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+        image = image.convert("RGB")
         if size:
-            image = image.resize(size)
-        return image_to_base64(image)
+            image.thumbnail(size)
+        buffered = io.BytesIO()
+        image.save(buffered, format=format, **({"quality": quality} if quality else {}))
+        return buffered.getvalue()
     except Exception as e:
         logger.error(f"Error preprocessing image: {e}")
         raise
@@ -19,4 +46,9 @@ def image_to_base64(image: Image.Image, format: str = "PNG") -> str:
     """Converts a PIL Image to base64 string."""
     buffered = io.BytesIO()
     image.save(buffered, format=format)
-    return base64.b64encode(buffered.getvalue()).decode("utf-8")
\ No newline at end of file
+    return base64.b64encode(buffered.getvalue()).decode("utf-8")
+
+
+def base64_to_image(image_b64: str) -> Image.Image:
+    """Decodes a base64 string produced by `image_to_base64`."""
+    return Image.open(io.BytesIO(base64.b64decode(image_b64))).convert("RGB")
@@ -0,0 +1,67 @@
+# app/utils/startup.py
+
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+_PROCESS_START = time.perf_counter()
+_timings: Dict[str, float] = {}
+_lock = threading.Lock()
+
+
+def record(component: str, seconds: float) -> None:
+    with _lock:
+        _timings[component] = _timings.get(component, 0.0) + seconds
+
+
+@contextmanager
+def timed(component: str):
+    """Records how long the enclosed block (an import or an init step) took."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(component, time.perf_counter() - start)
+
+
+def lazy_singleton(component: str) -> Callable[[Callable[[], T]], Callable[[], T]]:
+    """
+    Memoizes a zero-argument factory so the object is built once per process,
+    on first use, and records its initialization time under `component`.
+    """
+    def decorator(factory: Callable[[], T]) -> Callable[[], T]:
+        instance = []
+        factory_lock = threading.Lock()
+
+        @wraps(factory)
+        def get() -> T:
+            if not instance:
+                with factory_lock:
+                    if not instance:
+                        with timed(f"init:{component}"):
+                            instance.append(factory())
+            return instance[0]
+
+        get.is_initialized = lambda: bool(instance)
+        get.reset = instance.clear
+        return get
+
+    return decorator
+
+
+def startup_report() -> Dict[str, float]:
+    """
+    Seconds spent per import/init component, plus time since the module was first
+    imported.
+    """
+    with _lock:
+        report = {
+            name: round(seconds, 4)
+            for name, seconds in sorted(_timings.items(), key=lambda kv: -kv[1])
+        }
+    report["since_first_import"] = round(time.perf_counter() - _PROCESS_START, 4)
+    return report
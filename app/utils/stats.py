@@ -0,0 +1,27 @@
+# app/utils/stats.py
+
+import math
+import sys
+from typing import Dict, Iterable, Optional, Sequence
+
+
+def percentiles(
+    values: Iterable[float], points: Sequence[int] = (50, 95, 99)
+) -> Dict[str, float]:
+    """Nearest-rank percentiles, e.g. {"p50": ..., "p95": ..., "p99": ...}."""
+    ordered = sorted(values)
+    if not ordered:
+        return {f"p{p}": 0.0 for p in points}
+    return {
+        f"p{p}": ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)] for p in points
+    }
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident memory of this process, where the platform reports it."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
@@ -0,0 +1,330 @@
+# app/utils/tracing.py
+"""
+Lightweight request tracing: nested spans with durations and attributes
+(token counts, cache hits, verdicts) handed to pluggable exporters.
+
+    with span("retriever", k=3) as s:
+        docs = ...
+        s.set(documents=len(docs))
+
+The sampling decision is made once per trace, at its root span; spans of an
+unsampled trace are no-ops, so tracing costs almost nothing when sampled out.
+Exporters are chosen with TRACING_EXPORTERS (memory, stdout, appinsights).
+"""
+
+import asyncio
+import functools
+import inspect
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional
+
+from app.utils.stats import percentiles
+
+_lock = threading.Lock()
+
+
+class Span:
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start_time",
+        "_start",
+        "duration_ms",
+        "error",
+        "attributes",
+    )
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: dict):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent else None
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.error: Optional[str] = None
+        self.attributes = attributes
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def add(self, key: str, value: float) -> None:
+        """Accumulates a counter (e.g. tokens of concurrent batches)."""
+        with _lock:
+            self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def fail(self, error: BaseException) -> None:
+        """Marks the span as failed when the error is handled rather than raised."""
+        self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration_ms": self.duration_ms,
+            "error": self.error,
+            **self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Stands in for every span of an unsampled trace."""
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def add(self, key: str, value: float) -> None:
+        pass
+
+    def fail(self, error: BaseException) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+_current: ContextVar = ContextVar("current_span", default=None)
+
+
+# --- Exporters ---
+
+class InMemoryExporter:
+    """Keeps the most recent spans in process and summarizes them per span name."""
+
+    def __init__(self, max_spans: int = 10000):
+        self.spans: deque = deque(maxlen=max_spans)
+
+    def export(self, span: Span) -> None:
+        self.spans.append(span)
+
+    def summary(self) -> Dict[str, dict]:
+        """
+        Count, errors, latency percentiles and summed numeric attributes per span name.
+        """
+        grouped: Dict[str, List[Span]] = {}
+        for span in list(self.spans):
+            grouped.setdefault(span.name, []).append(span)
+        result = {}
+        for name, spans in sorted(grouped.items()):
+            totals: Dict[str, float] = {}
+            for span in spans:
+                for key, value in span.attributes.items():
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        totals[key] = totals.get(key, 0) + value
+            result[name] = {
+                "count": len(spans),
+                "errors": sum(1 for s in spans if s.error),
+                **{
+                    f"{p}_ms": round(v, 2)
+                    for p, v in percentiles(s.duration_ms for s in spans).items()
+                },
+                **{f"total_{key}": value for key, value in totals.items()},
+            }
+        return result
+
+    def clear(self) -> None:
+        self.spans.clear()
+
+
+class StdoutExporter:
+    """Prints one line per finished span, for local runs."""
+
+    def export(self, span: Span) -> None:
+        attributes = " ".join(f"{k}={v}" for k, v in span.attributes.items())
+        error = f" error={span.error!r}" if span.error else ""
+        print(
+            f"[trace {span.trace_id[:8]}] {span.name} {span.duration_ms:.1f} ms "
+            f"{attributes}{error}",
+            flush=True,
+        )
+
+
+class AppInsightsExporter:
+    """
+    Sends spans as log records with custom dimensions through the shared
+    AzureLogHandler.
+    """
+
+    def __init__(self):
+        from app.utils.helpers import get_logger
+        self.logger = get_logger("app.tracing")
+
+    def export(self, span: Span) -> None:
+        self.logger.info(
+            f"span {span.name} {span.duration_ms:.1f} ms",
+            extra={
+                "custom_dimensions": {
+                    k: v for k, v in span.to_dict().items() if v is not None
+                }
+            },
+        )
+
+
+EXPORTERS: Dict[str, Callable[[], object]] = {
+    "memory": InMemoryExporter,
+    "stdout": StdoutExporter,
+    "appinsights": AppInsightsExporter,
+}
+
+_config: Optional[dict] = None
+
+
+def register_exporter(name: str, factory: Callable[[], object]) -> None:
+    """
+    Makes a custom exporter (any object with `export(span)`) selectable in
+    TRACING_EXPORTERS.
+    """
+    EXPORTERS[name] = factory
+
+
+def configure(
+    enabled: bool = True,
+    sample_rate: float = 1.0,
+    exporters: Optional[List[object]] = None,
+) -> None:
+    """Overrides the settings-based configuration (e.g. for benchmarks)."""
+    global _config
+    with _lock:
+        _config = {
+            "enabled": enabled,
+            "sample_rate": sample_rate,
+            "exporters": exporters or [],
+        }
+
+
+def _get_config() -> dict:
+    global _config
+    if _config is None:
+        from app.config.settings import get_settings
+        settings = get_settings()
+        names = [n.strip() for n in settings.tracing_exporters.split(",") if n.strip()]
+        unknown = [n for n in names if n not in EXPORTERS]
+        if unknown:
+            raise ValueError(
+                f"Unknown tracing exporters {unknown}, expected some of "
+                f"{list(EXPORTERS)}"
+            )
+        with _lock:
+            if _config is None:
+                _config = {
+                    "enabled": settings.tracing_enabled and bool(names),
+                    "sample_rate": settings.tracing_sample_rate,
+                    "exporters": [EXPORTERS[n]() for n in names],
+                }
+    return _config
+
+
+def get_exporter(kind: type) -> Optional[object]:
+    return next((e for e in _get_config()["exporters"] if isinstance(e, kind)), None)
+
+
+def summary() -> Dict[str, dict]:
+    """Per-span-name summary of the in-process exporter (empty if it is not enabled)."""
+    exporter = get_exporter(InMemoryExporter)
+    return exporter.summary() if exporter else {}
+
+
+# --- Span API ---
+
+def current_span():
+    """The innermost active span (a no-op object outside a sampled trace)."""
+    return _current.get() or NOOP_SPAN
+
+
+def start_span(name: str, **attributes):
+    """
+    Opens a span under the current one without making it current; close it with
+    `end_span`.
+    """
+    parent = _current.get()
+    if parent is NOOP_SPAN:
+        return NOOP_SPAN
+    if parent is None:
+        config = _get_config()
+        if not config["enabled"] or random.random() >= config["sample_rate"]:
+            return NOOP_SPAN
+    return Span(name, parent, attributes)
+
+
+def end_span(span, error: Optional[BaseException] = None) -> None:
+    if span is NOOP_SPAN:
+        return
+    span.duration_ms = (time.perf_counter() - span._start) * 1000
+    if error is not None:
+        span.fail(error)
+    for exporter in _get_config()["exporters"]:
+        try:
+            exporter.export(span)
+        except Exception:  # never let telemetry break a request
+            pass
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Times the enclosed block as a child of the current span."""
+    s = start_span(name, **attributes)
+    token = _current.set(s)
+    error = None
+    try:
+        yield s
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _current.reset(token)
+        end_span(s, error)
+
+
+def traced(name: str):
+    """Decorator form of `span` for functions, coroutines and async generators."""
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        if inspect.isasyncgenfunction(fn):
+            @functools.wraps(fn)
+            async def agen_wrapper(*args, **kwargs):
+                # The span is current only while the generator body runs, never
+                # in the consumer between items
+                s = start_span(name)
+                agen = fn(*args, **kwargs)
+                error = None
+                try:
+                    while True:
+                        token = _current.set(s)
+                        try:
+                            item = await agen.__anext__()
+                        except StopAsyncIteration:
+                            break
+                        finally:
+                            _current.reset(token)
+                        yield item
+                except GeneratorExit:  # consumer stopped early
+                    raise
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    await agen.aclose()
+                    end_span(s, error)
+            return agen_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
@@ -1,12 +1,24 @@
-import azure.functions as func
-import json
-import tempfile
-from app.services.azure_openai import AzureOpenAIWrapper
-from app.llm_validators.prompt_injection import PromptInjectionValidator
-from app.llm_validators.answer_relevance import AnswerRelevanceValidator
-from app.utils.helpers import get_logger
-from app.chains.langchain_rag import chat_with_rag
-from azure_function.function_config import get_function_settings
+from app.utils.startup import startup_report, timed
+
+with timed("import:function_handler"):
+    import azure.functions as func
+    import asyncio
+    import json
+    from app.services.request_scheduler import BATCH, request_priority
+    from app.llm_validators.prompt_injection import PromptInjectionValidator
+    from app.llm_validators.answer_relevance import AnswerRelevanceValidator
+    from app.utils.helpers import get_logger
+    from app.utils.tracing import span
+    from app.chains.langchain_rag import (
+        abatch_chat_with_rag,
+        achat_with_rag,
+        alookup_answer,
+        astore_answer,
+        get_openai_client,
+        warm_up,
+    )
+    from app.chains.sharded_store import route, shard_dirs, shard_scope
+    from azure_function.function_config import get_function_settings
 
 logger = get_logger(__name__)
 
@@ -15,16 +27,228 @@ settings = get_function_settings()
 if settings.function_enable_logging:
     logger.info("Azure Function config loaded.")
 
-azure_service = AzureOpenAIWrapper()
+azure_service = get_openai_client()
+shard_names = set(shard_dirs("", settings))
 prompt_validator = PromptInjectionValidator(azure_service)
 relevance_validator = AnswerRelevanceValidator(azure_service)
 
+# Optionally pay the vector store / retriever cost while the host starts up
+if settings.function_warm_up_on_start:
+    logger.info(f"Warm-up complete: {warm_up()}")
+
+_startup_reported = False
+
+
+async def generate_with_speculation(
+    user_input: str, image: bytes = None, sources: list = None
+):
+    """
+    Starts RAG generation while the prompt-injection check is still running.
+    If the input is flagged the in-flight generation is cancelled and its
+    result discarded; returns None in that case, the answer otherwise.
+    """
+    generation = asyncio.create_task(
+        achat_with_rag(user_input, image=image, sources=sources)
+    )
+    try:
+        is_prompt_injection = await prompt_validator.validate(user_input)
+    except BaseException:
+        generation.cancel()
+        raise
+
+    if is_prompt_injection == "YES":
+        generation.cancel()
+        return None
+    return await generation
+
+
+async def batch_response(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    POST /api/chatbot/batch with {"questions": [...]}: answers every question
+    with the same validation as single requests, in order, with a status per
+    item (ok, rejected, irrelevant, error). Identical questions are handled once.
+    """
+    req_body = req.get_json()
+    questions = req_body.get("questions")
+    if (
+        not isinstance(questions, list)
+        or not questions
+        or not all(isinstance(q, str) for q in questions)
+    ):
+        return func.HttpResponse(
+            json.dumps({"error": "Expected a non-empty 'questions' list of strings."}),
+            status_code=400,
+            mimetype="application/json"
+        )
+    max_questions = settings.batch_max_questions
+    if len(questions) > max_questions:
+        return func.HttpResponse(
+            json.dumps({"error": f"At most {max_questions} questions per batch."}),
+            status_code=400,
+            mimetype="application/json",
+        )
+
+    unique = list(dict.fromkeys(q.strip() for q in questions if q.strip()))
+    limit = asyncio.Semaphore(settings.batch_max_concurrency)
+
+    async def bounded(coro):
+        async with limit:
+            return await coro
+
+    outcomes = {}
+    if settings.function_enable_prompt_validation:
+        verdicts = await asyncio.gather(
+            *(bounded(prompt_validator.validate(q)) for q in unique)
+        )
+        for q, verdict in zip(unique, verdicts):
+            if verdict == "YES":
+                outcomes[q] = {
+                    "status": "rejected",
+                    "error": "Prompt injection attempt detected.",
+                }
+
+    accepted = [q for q in unique if q not in outcomes]
+    sources = {}
+    for result in await abatch_chat_with_rag(accepted):
+        question = result.pop("question")
+        sources[question] = result.pop("sources", None)
+        outcomes[question] = result
+
+    if settings.function_enable_relevance_validation:
+        answered = [q for q in accepted if outcomes[q]["status"] == "ok"]
+        verdicts = await asyncio.gather(
+            *(
+                bounded(
+                    relevance_validator.validate(q, outcomes[q]["answer"], sources[q])
+                )
+                for q in answered
+            )
+        )
+        for q, verdict in zip(answered, verdicts):
+            if verdict == "NO":
+                outcomes[q] = {
+                    "status": "irrelevant",
+                    "error": "Input does not seem relevant to the expected context.",
+                }
+
+    results = [
+        {
+            "question": q,
+            **outcomes.get(q.strip(), {"status": "error", "error": "Empty question."}),
+        }
+        for q in questions
+    ]
+    return func.HttpResponse(
+        json.dumps({"results": results, "count": len(results), "unique": len(unique)}),
+        status_code=200,
+        mimetype="application/json"
+    )
+
+
+async def answer_request(user_input: str, image: bytes) -> func.HttpResponse:
+    """
+    Validates the input, generates the answer and validates its relevance.
+    Answers of similar earlier questions come from the answer cache, which
+    only holds answers that passed relevance validation.
+    """
+    sources = []
+    cached = None if image else await alookup_answer(user_input)
+    speculative = (
+        settings.function_enable_prompt_validation
+        and settings.function_speculative_generation
+        and cached is None
+    )
+    if speculative:
+        # Prompt injection validation overlapped with generation
+        logger.info("Prompt injection validation is enabled (speculative generation).")
+        response = await generate_with_speculation(
+            user_input, image=image, sources=sources
+        )
+        if response is None:
+            logger.warning("Prompt injection detected.")
+            return func.HttpResponse(
+                json.dumps({"error": "Prompt injection attempt detected."}),
+                status_code=400,
+                mimetype="application/json"
+            )
+
+    # Prompt injection validation (if enabled)
+    elif settings.function_enable_prompt_validation:
+        logger.info("Prompt injection validation is enabled.")
+        is_prompt_injection = await prompt_validator.validate(user_input)
+        if is_prompt_injection == "YES":
+            logger.warning("Prompt injection detected.")
+            return func.HttpResponse(
+                json.dumps({"error": "Prompt injection attempt detected."}),
+                status_code=400,
+                mimetype="application/json"
+            )
+
+    if cached is not None:
+        return func.HttpResponse(
+            json.dumps({"response": cached}),
+            status_code=200,
+            mimetype="application/json"
+        )
+
+    if not speculative:
+        # Generate response (pass the image if present)
+        response = await achat_with_rag(user_input, image=image, sources=sources)
+
+    # Answer relevance validation (if enabled)
+    if settings.function_enable_relevance_validation:
+        logger.info("Answer relevance validation is enabled.")
+        is_relevant = await relevance_validator.validate(user_input, response, sources)
+        if is_relevant == "NO":
+            logger.warning("Input deemed not relevant.")
+            return func.HttpResponse(
+                json.dumps(
+                    {"error": "Input does not seem relevant to the expected context."}
+                ),
+                status_code=400,
+                mimetype="application/json",
+            )
+
+    if not image:
+        await astore_answer(user_input, response, sources)
+    return func.HttpResponse(
+        json.dumps({"response": response}),
+        status_code=200,
+        mimetype="application/json"
+    )
+
+
 async def main(req: func.HttpRequest) -> func.HttpResponse:
+    # Root span of the request trace: every stage below nests under it
+    with span("function.request") as request_span:
+        response = await _handle_request(req)
+        request_span.set(status=str(response.status_code), mimetype=response.mimetype)
+        return response
+
+
+async def _handle_request(req: func.HttpRequest) -> func.HttpResponse:
+    global _startup_reported
     try:
         logger.info("Azure Function triggered")
+        if not _startup_reported:
+            _startup_reported = True
+            logger.info(f"Startup timings (s): {startup_report()}")
+
+        action = req.route_params.get("action")
+        if action == "batch":
+            # Bulk work yields to interactive requests at the Azure OpenAI schedulers
+            with request_priority(BATCH):
+                return await batch_response(req)
+        if action:
+            return func.HttpResponse(
+                json.dumps({"error": f"Unknown action '{action}'."}),
+                status_code=404,
+                mimetype="application/json"
+            )
 
         user_input = None
-        image_path = None
+        image = None
+        metadata = None
 
         # Handle multipart/form-data (with image)
         
@@ -32,15 +256,21 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
         if content_type.startswith("multipart/form-data"):
             form = req.form  # <-- No parentheses
             user_input = form.get("message")
-            image_file = form.get("image")
+            metadata = (
+                {"collection": form.get("collection")}
+                if form.get("collection")
+                else None
+            )
+            # Uploaded files are parsed into req.files, not req.form
+            image_file = req.files.get("image")
             if image_file:
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-                    tmp.write(image_file.read())
-                    image_path = tmp.name
+                # Kept in memory: downscaled and captioned without touching disk
+                image = image_file.read()
         else:
             # Handle application/json
             req_body = req.get_json()
             user_input = req_body.get("message")
+            metadata = req_body.get("metadata")
 
         if not user_input:
             return func.HttpResponse(
@@ -51,38 +281,18 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
 
         logger.info(f"Received message: {user_input}")
 
-        # Prompt injection validation (if enabled)
-        if settings.function_enable_prompt_validation:
-            logger.info("Prompt injection validation is enabled.")
-            is_prompt_injection = await prompt_validator.validate(user_input)
-            if is_prompt_injection == "YES":
-                logger.warning("Prompt injection detected.")
-                return func.HttpResponse(
-                    json.dumps({"error": "Prompt injection attempt detected."}),
-                    status_code=400,
-                    mimetype="application/json"
-                )
-
-        # Generate response (pass image_path if present)
-        response = chat_with_rag(user_input, image_path=image_path)
-
-        # Answer relevance validation (if enabled)
-        if settings.function_enable_relevance_validation:
-            logger.info("Answer relevance validation is enabled.")
-            is_relevant = await relevance_validator.validate(user_input, response)
-            if is_relevant == "NO":
-                logger.warning("Input deemed not relevant.")
-                return func.HttpResponse(
-                    json.dumps({"error": "Input does not seem relevant to the expected context."}),
-                    status_code=400,
-                    mimetype="application/json"
-                )
-
-        return func.HttpResponse(
-            json.dumps({"response": response}),
-            status_code=200,
-            mimetype="application/json"
-        )
+        # Optional routing to index shards: {"metadata": {"collection": "retail",
+        # "source": "x.pdf"}}
+        collections, chunk_filter = route(metadata)
+        unknown = [c for c in collections or [] if c not in shard_names]
+        if unknown:
+            return func.HttpResponse(
+                json.dumps({"error": f"Unknown collections {unknown}."}),
+                status_code=400,
+                mimetype="application/json"
+            )
+        with shard_scope(collections, chunk_filter):
+            return await answer_request(user_input, image)
 
     except Exception as e:
         logger.exception("Error in Azure Function handler")
@@ -0,0 +1,300 @@
+# benchmarks/fake_azure_openai.py
+"""
+Local stand-in for the Azure OpenAI chat completions and embeddings
+endpoints, for benchmarks and manual runs without live Azure calls.
+
+    python -m benchmarks.fake_azure_openai --port 8089 --latency-ms 300 --rate-429 0.05
+
+Responses follow the Azure REST shapes used by the openai SDK. Latency is
+`latency_ms` +/- `jitter_ms` per request (plus `token_ms` per streamed
+token); a `rate_429` fraction of requests is rejected with Retry-After.
+Embeddings are deterministic: the sum of per-word pseudo-random vectors,
+so texts sharing words end up close, as with a real embedding model.
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+import numpy as np
+
+WORD_RE = re.compile(r"\w+")
+ROUTE_RE = re.compile(
+    r"^/openai/deployments/(?P<deployment>[^/]+)"
+    r"/(?P<operation>chat/completions|embeddings)"
+)
+
+ANSWER = (
+    "Based on the provided context, the main risk factors are age, family "
+    "history, hormonal exposure and lifestyle factors such as alcohol "
+    "consumption and physical inactivity."
+)
+
+
+@dataclass
+class FakeAzureConfig:
+    latency_ms: float = 200.0
+    jitter_ms: float = 50.0
+    token_ms: float = 10.0
+    embedding_latency_ms: float = 50.0
+    rate_429: float = 0.0
+    retry_after_s: float = 0.5
+    dim: int = 1536
+    seed: int = 0
+
+
+@dataclass
+class FakeAzureStats:
+    requests: dict = field(
+        default_factory=lambda: {"chat": 0, "embeddings": 0, "throttled": 0}
+    )
+    embedded_inputs: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def count(self, key: str, n: int = 1) -> None:
+        with self.lock:
+            self.requests[key] += n
+
+
+@lru_cache(maxsize=100000)
+def _word_vector(word: str, dim: int, seed: int) -> np.ndarray:
+    digest = hashlib.sha256(f"{seed}:{word}".encode("utf-8")).digest()
+    rng = np.random.default_rng(int.from_bytes(digest[:8], "little"))
+    return rng.standard_normal(dim).astype("float32")
+
+
+def fake_embedding(text: str, dim: int = 1536, seed: int = 0) -> List[float]:
+    vector = np.zeros(dim, dtype="float32")
+    for word in WORD_RE.findall(text.lower()) or [""]:
+        vector += _word_vector(word, dim, seed)
+    return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+
+
+def prompt_text(messages: list) -> str:
+    return " ".join(
+        part.get("text", "") if isinstance(part, dict) else str(part)
+        for message in messages
+        for part in (
+            message["content"]
+            if isinstance(message["content"], list)
+            else [message["content"]]
+        )
+    )
+
+
+def fake_answer(messages: list) -> str:
+    """Validator prompts get their expected verdict, everything else a canned answer."""
+    prompt = prompt_text(messages)
+    if "detect prompt injection" in prompt:
+        return "NO"
+    if "relevance of answers" in prompt:
+        return "YES"
+    if "Describe this image" in prompt:
+        return "A chart comparing risk factors across age groups."
+    return ANSWER
+
+
+class FakeAzureOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: FakeAzureConfig
+    stats: FakeAzureStats
+
+    def log_message(self, format, *args):  # keep benchmark output clean
+        pass
+
+    def do_POST(self):
+        body = json.loads(
+            self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}"
+        )
+        route = ROUTE_RE.match(self.path)
+        if route is None:
+            return self._json(
+                404, {"error": {"code": "404", "message": f"Unknown path {self.path}"}}
+            )
+
+        config = self.config
+        if random.random() < config.rate_429:
+            self.stats.count("throttled")
+            return self._json(
+                429,
+                {"error": {"code": "429", "message": "Rate limit is exceeded."}},
+                {
+                    "Retry-After": f"{config.retry_after_s:g}",
+                    "retry-after-ms": str(int(config.retry_after_s * 1000)),
+                },
+            )
+
+        if route["operation"] == "embeddings":
+            self.stats.count("embeddings")
+            inputs = (
+                body["input"] if isinstance(body["input"], list) else [body["input"]]
+            )
+            with self.stats.lock:
+                self.stats.embedded_inputs += len(inputs)
+            self._sleep(config.embedding_latency_ms)
+            return self._json(
+                200,
+                {
+                    "object": "list",
+                    "model": route["deployment"],
+                    "data": [
+                        {
+                            "object": "embedding",
+                            "index": i,
+                            "embedding": fake_embedding(text, config.dim, config.seed),
+                        }
+                        for i, text in enumerate(inputs)
+                    ],
+                    "usage": {
+                        "prompt_tokens": sum(len(t) // 4 + 1 for t in inputs),
+                        "total_tokens": 0,
+                    },
+                },
+            )
+
+        self.stats.count("chat")
+        answer = fake_answer(body.get("messages", []))
+        self._sleep(config.latency_ms)
+        if body.get("stream"):
+            return self._stream(route["deployment"], answer)
+        return self._json(
+            200,
+            {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": route["deployment"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": answer},
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": len(prompt_text(body.get("messages", []))) // 4
+                    + 1,
+                    "completion_tokens": len(answer.split()),
+                    "total_tokens": 0,
+                },
+            },
+        )
+
+    def _sleep(self, base_ms: float) -> None:
+        jitter = random.uniform(-self.config.jitter_ms, self.config.jitter_ms)
+        time.sleep(max(0.0, base_ms + jitter) / 1000)
+
+    def _json(self, status: int, payload: dict, headers: Optional[dict] = None) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, deployment: str, answer: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, token in enumerate(re.findall(r"\S+\s*", answer)):
+            if i:
+                time.sleep(self.config.token_ms / 1000)
+            self._chunk(
+                {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": deployment,
+                    "choices": [
+                        {"index": 0, "delta": {"content": token}, "finish_reason": None}
+                    ],
+                }
+            )
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _chunk(self, payload: dict) -> None:
+        self._write_chunk(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+class FakeAzureOpenAI:
+    """
+    Runs the fake endpoint on a background thread: `with FakeAzureOpenAI(config) as
+    server: server.endpoint`.
+    """
+
+    def __init__(
+        self,
+        config: Optional[FakeAzureConfig] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.config = config or FakeAzureConfig()
+        self.stats = FakeAzureStats()
+        handler = type(
+            "Handler",
+            (FakeAzureOpenAIHandler,),
+            {"config": self.config, "stats": self.stats},
+        )
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def __enter__(self) -> "FakeAzureOpenAI":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve a fake Azure OpenAI endpoint.")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--token-ms", type=float, default=10.0)
+    parser.add_argument("--embedding-latency-ms", type=float, default=50.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--dim", type=int, default=1536)
+    args = parser.parse_args()
+
+    config = FakeAzureConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        token_ms=args.token_ms,
+        embedding_latency_ms=args.embedding_latency_ms,
+        rate_429=args.rate_429,
+        dim=args.dim,
+    )
+    with FakeAzureOpenAI(config, port=args.port) as server:
+        print(f"Fake Azure OpenAI listening on {server.endpoint} (Ctrl+C to stop)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,498 @@
+# benchmarks/run.py
+"""
+Offline end-to-end benchmark: builds an index from synthetic PDFs and drives
+the RAG chain, the validators and the Azure Function handler against a local
+fake Azure OpenAI endpoint (benchmarks/fake_azure_openai.py).
+
+    python -m benchmarks.run                  # run and compare with the baseline
+    python -m benchmarks.run --concurrency 16 --requests 200 --rate-429 0.05
+    python -m benchmarks.run --save-baseline  # record the current commit as baseline
+
+Reports p50/p95/p99 latency, throughput and peak RSS per stage. Results can be
+saved to (and compared against) a JSON baseline to spot regressions between
+commits; latencies depend on the fake endpoint settings, so compare runs made
+with the same arguments.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from benchmarks.fake_azure_openai import FakeAzureConfig, FakeAzureOpenAI
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+TOPICS = [
+    "age",
+    "family history",
+    "hormonal exposure",
+    "alcohol consumption",
+    "physical activity",
+    "obesity",
+    "breast density",
+    "radiation exposure",
+    "BRCA mutations",
+    "screening",
+    "menopause",
+    "diet",
+]
+WORDS = (
+    "risk factor cancer breast study women incidence hormone exposure genetic "
+    "mutation screening mammography density estrogen cohort population "
+    "analysis treatment prevention lifestyle"
+).split()
+
+
+def configure_environment(
+    endpoint: str, work_dir: str, args: argparse.Namespace
+) -> None:
+    """
+    Points the app's settings at the fake endpoint and a scratch directory (before
+    importing app).
+    """
+    os.environ.update({
+        "AZURE_OPENAI_API_KEY": "benchmark",
+        "AZURE_OPENAI_ENDPOINT": endpoint,
+        "AZURE_OPENAI_DEPLOYMENT_NAME": "gpt-4o",
+        "AZURE_OPENAI_EMBEDDING_DEPLOYMENT": "text-embedding-ada-002",
+        "AZURE_OPENAI_API_VERSION": "2024-06-01",
+        "FUNCTION_ENABLE_LOGGING": "False",
+        "FAISS_INDEX_PATH": os.path.join(work_dir, "faiss_index"),
+        "EMBEDDING_CACHE_ENABLED": str(args.embedding_cache),
+        "EMBEDDING_CACHE_PATH": os.path.join(work_dir, "cache", "embeddings.sqlite"),
+        "CAPTION_CACHE_PATH": os.path.join(work_dir, "cache", "captions.sqlite"),
+        "IMAGE_CAPTIONER": "azure",
+        "TRACING_ENABLED": "True",
+        "TRACING_SAMPLE_RATE": "1.0",
+        "TRACING_EXPORTERS": "memory",
+    })
+
+
+def synthetic_pdfs(docs_dir: str, n_docs: int, pages: int, seed: int = 0) -> int:
+    """
+    Writes `n_docs` PDFs with text pages and one image each; returns the page count.
+    """
+    import pymupdf
+    from PIL import Image
+
+    rng = random.Random(seed)
+    os.makedirs(docs_dir, exist_ok=True)
+    for d in range(n_docs):
+        pdf = pymupdf.open()
+        for p in range(pages):
+            page = pdf.new_page()
+            text = " ".join(rng.choice(WORDS) for _ in range(400))
+            page.insert_textbox(
+                pymupdf.Rect(40, 40, 560, 600),
+                f"{rng.choice(TOPICS)}. {text}",
+                fontsize=8,
+            )
+            if p == 0:
+                image = Image.frombytes(
+                    "RGB",
+                    (128, 128),
+                    bytes(rng.getrandbits(8) for _ in range(128 * 128 * 3)),
+                )
+                buffer = io.BytesIO()
+                image.save(buffer, format="PNG")
+                page.insert_image(
+                    pymupdf.Rect(40, 620, 168, 748), stream=buffer.getvalue()
+                )
+        pdf.save(os.path.join(docs_dir, f"doc_{d:04d}.pdf"))
+        pdf.close()
+    return n_docs * pages
+
+
+def question(i: int) -> str:
+    topic = TOPICS[i % len(TOPICS)]
+    return f"What does the study say about {topic} as a risk factor (case {i})?"
+
+
+def image_bytes(i: int) -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (1600, 1200), (i % 256, 80, 160)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def multipart(fields: Dict[str, str], files: Dict[str, bytes]) -> tuple:
+    boundary = "benchmark-boundary"
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+            f"{value}\r\n".encode()
+        )
+    for name, data in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; '
+            f'filename="{name}.jpg"\r\n'
+            f"Content-Type: image/jpeg\r\n\r\n".encode() + data + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+async def run_stage(name: str, call: Callable[[int], Awaitable[None]], requests: int,
+                    concurrency: int) -> Dict[str, float]:
+    """
+    Runs `requests` calls with at most `concurrency` in flight; failed calls count as
+    errors.
+    """
+    from app.utils.stats import peak_rss_mb, percentiles
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors: List[str] = []
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await call(i)
+            except Exception as e:
+                errors.append(str(e))
+                return
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - start
+
+    result = {
+        "count": len(latencies),
+        "errors": len(errors),
+        **{f"{p}_ms": round(v, 2) for p, v in percentiles(latencies).items()},
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    print(
+        f"  {name:<22} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} "
+        f"{result['p99_ms']:>9.1f} {result['throughput_rps']:>9.1f} "
+        f"{result['errors']:>6}"
+    )
+    if errors:
+        print(f"    first error: {errors[0][:200]}")
+    return result
+
+
+async def benchmark_index(work_dir: str, args: argparse.Namespace) -> Dict[str, dict]:
+    from app.chains.create_faiss_index import CaptionStage, caption_cache_version
+    from app.chains.ingestion import build_index
+    from app.config.settings import get_settings
+    from app.services.azure_openai import AzureOpenAIWrapper
+    from app.utils.caption_cache import CaptionCache
+    from app.utils.stats import peak_rss_mb
+
+    settings = get_settings()
+    docs_dir = os.path.join(work_dir, "docs")
+    pages = synthetic_pdfs(docs_dir, args.docs, args.pages)
+    client = AzureOpenAIWrapper()
+    results = {}
+    for name in ("index_build", "index_noop"):
+        cache = CaptionCache(settings.caption_cache_path, caption_cache_version(client))
+        stage = CaptionStage(client, settings.caption_concurrency, cache=cache)
+        start = time.perf_counter()
+        store = await build_index(
+            docs_dir,
+            settings.faiss_index_path,
+            client.get_embedding_function(),
+            settings,
+            stage,
+        )
+        seconds = time.perf_counter() - start
+        cache.close()
+        results[name] = {"seconds": round(seconds, 3), "peak_rss_mb": peak_rss_mb()}
+        if store is not None:
+            chunks = store.index.ntotal
+            results[name].update(
+                pages=pages,
+                chunks=chunks,
+                pages_per_s=round(pages / seconds, 2),
+                chunks_per_s=round(chunks / seconds, 2),
+            )
+        print(f"  {name:<22} {seconds:>9.2f}s  {results[name]}")
+    return results
+
+
+async def benchmark_queries(args: argparse.Namespace) -> Dict[str, dict]:
+    import azure.functions as func
+
+    from app.chains.langchain_rag import (
+        achat_with_rag,
+        astream_chat_with_rag,
+        chat_with_rag,
+        get_openai_client,
+        get_retriever,
+        warm_up,
+    )
+    from app.llm_validators.answer_relevance import AnswerRelevanceValidator
+    from app.llm_validators.prompt_injection import PromptInjectionValidator
+    from azure_function import function_handler
+
+    await asyncio.to_thread(warm_up)
+    client = get_openai_client()
+    injection = PromptInjectionValidator(client)
+    relevance = AnswerRelevanceValidator(client)
+    # Distinct questions per stage, so caches do not help
+    offset = iter(range(0, 10**9, args.requests))
+
+    def stage_questions():
+        base = next(offset)
+        return lambda i: question(base + i)
+
+    async def rag_stream(q: str) -> None:
+        async for _ in astream_chat_with_rag(q):
+            pass
+
+    def check_rag(answer: str) -> None:
+        if answer.startswith("⚠️"):
+            raise RuntimeError(answer)
+
+    async def achat(q: str) -> None:
+        check_rag(await achat_with_rag(q))
+
+    async def call_function(body: bytes, headers: dict) -> None:
+        request = func.HttpRequest(
+            method="POST",
+            url="http://localhost/api/chatbot",
+            body=body,
+            headers=headers,
+        )
+        response = await function_handler.main(request)
+        text = response.get_body().decode("utf-8")
+        if response.status_code != 200 or "event: error" in text:
+            raise RuntimeError(f"HTTP {response.status_code}: {text[:200]}")
+
+    def json_body(q: str) -> bytes:
+        return json.dumps({"message": q}).encode("utf-8")
+
+    stages: Dict[
+        str, Callable[[Callable[[int], str]], Callable[[int], Awaitable[None]]]
+    ] = {
+        "embed_query": lambda q: lambda i: client.aget_embedding(q(i)),
+        "retrieve": lambda q: lambda i: asyncio.to_thread(get_retriever().invoke, q(i)),
+        "prompt_injection": lambda q: lambda i: injection.validate(q(i)),
+        "answer_relevance": lambda q: lambda i: relevance.validate(
+            q(i), "The main risk factors are age and genetics."
+        ),
+        "chat_with_rag": lambda q: lambda i: asyncio.to_thread(
+            lambda: check_rag(chat_with_rag(q(i)))
+        ),
+        "achat_with_rag": lambda q: lambda i: achat(q(i)),
+        "rag_stream": lambda q: lambda i: rag_stream(q(i)),
+        "function_json": lambda q: lambda i: call_function(
+            json_body(q(i)), {"Content-Type": "application/json"}
+        ),
+        "function_image": lambda q: lambda i: call_function(
+            *_multipart_request(q(i), image_bytes(i))
+        ),
+    }
+
+    results = {}
+    for name, make_call in stages.items():
+        if args.stages and name not in args.stages:
+            continue
+        results[name] = await run_stage(
+            name, make_call(stage_questions()), args.requests, args.concurrency
+        )
+    if "answer_relevance" in results:
+        print(f"  answer_relevance tiers: {relevance.metrics()}")
+    return results
+
+
+def _multipart_request(q: str, image: bytes) -> tuple:
+    body, content_type = multipart({"message": q}, {"image": image})
+    return body, {"Content-Type": content_type}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=BENCHMARK_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    Lists metrics that got worse than the baseline by more than `tolerance` (fraction).
+    """
+    regressions = []
+    print(
+        f"\nComparison with baseline ({baseline['meta'].get('commit')}, "
+        f"{baseline['meta'].get('timestamp')}):"
+    )
+    for stage, metrics in results["stages"].items():
+        before = baseline["stages"].get(stage)
+        if not before:
+            continue
+        for metric, value in metrics.items():
+            old = before.get(metric)
+            if (
+                not isinstance(value, (int, float))
+                or not isinstance(old, (int, float))
+                or not old
+            ):
+                continue
+            if metric in ("count", "pages", "chunks"):
+                continue
+            change = (value - old) / old
+            higher_is_better = metric.endswith(("_rps", "_per_s"))
+            worse = -change if higher_is_better else change
+            flag = "REGRESSION" if worse > tolerance else ""
+            if (
+                metric.startswith(
+                    ("p50", "p95", "throughput", "seconds", "pages_per_s", "errors")
+                )
+                or flag
+            ):
+                print(
+                    f"  {stage:<22} {metric:<16} {old:>10.2f} -> {value:>10.2f} "
+                    f"({change:+.1%}) {flag}"
+                )
+            if flag:
+                regressions.append(f"{stage}.{metric}")
+    return regressions
+
+
+async def run(args: argparse.Namespace) -> dict:
+    config = FakeAzureConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        token_ms=args.token_ms,
+        embedding_latency_ms=args.embedding_latency_ms,
+        rate_429=args.rate_429,
+        seed=args.seed,
+    )
+    random.seed(args.seed)
+    with (
+        tempfile.TemporaryDirectory(prefix="chatbot-benchmark-") as work_dir,
+        FakeAzureOpenAI(config) as server,
+    ):
+        configure_environment(server.endpoint, work_dir, args)
+        print(
+            f"Fake Azure OpenAI at {server.endpoint}; concurrency={args.concurrency}, "
+            f"requests={args.requests}"
+        )
+        print(
+            f"  {'stage':<22} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+            f"{'req/s':>9} {'errors':>6}"
+        )
+        stages = await benchmark_index(work_dir, args)
+        stages.update(await benchmark_queries(args))
+
+        from app.services.request_scheduler import scheduler_metrics
+        from app.utils import tracing
+        spans = tracing.summary()
+        print(
+            f"\n  {'span':<28} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'errors':>6}"
+        )
+        for name, metrics in spans.items():
+            print(
+                f"  {name:<28} {metrics['count']:>6} {metrics.get('p50_ms', 0):>9.1f} "
+                f"{metrics.get('p95_ms', 0):>9.1f} {metrics['errors']:>6}"
+            )
+        return {
+            "meta": {
+                "commit": git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": sys.version.split()[0],
+                "args": {
+                    k: v
+                    for k, v in vars(args).items()
+                    if k not in ("baseline", "output", "save_baseline")
+                },
+                "fake_endpoint": server.stats.requests,
+                "schedulers": scheduler_metrics(),
+            },
+            "stages": stages,
+            "spans": spans,
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Offline end-to-end benchmark against a fake Azure OpenAI endpoint."
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--requests", type=int, default=50, help="Requests per query stage"
+    )
+    parser.add_argument(
+        "--stages", nargs="*", default=[], help="Subset of query stages to run"
+    )
+    parser.add_argument("--docs", type=int, default=20, help="Synthetic PDFs to index")
+    parser.add_argument("--pages", type=int, default=5, help="Pages per synthetic PDF")
+    parser.add_argument(
+        "--latency-ms", type=float, default=200.0, help="Chat completion latency"
+    )
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument(
+        "--token-ms", type=float, default=10.0, help="Delay between streamed tokens"
+    )
+    parser.add_argument("--embedding-latency-ms", type=float, default=50.0)
+    parser.add_argument(
+        "--rate-429", type=float, default=0.0, help="Fraction of requests throttled"
+    )
+    parser.add_argument(
+        "--embedding-cache",
+        action="store_true",
+        help="Enable the persistent embedding cache",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Write the results to the baseline file",
+    )
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed relative slowdown before flagging",
+    )
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+    if regressions:
+        print(
+            f"\n{len(regressions)} metric(s) regressed beyond {args.tolerance:.0%}: "
+            f"{', '.join(regressions)}"
+        )
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
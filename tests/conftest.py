@@ -0,0 +1,12 @@
+import os
+
+# Settings() requires the Azure OpenAI connection; unit tests never call it
+for name, value in {
+    "AZURE_OPENAI_API_KEY": "test-key",
+    "AZURE_OPENAI_ENDPOINT": "https://example.openai.azure.com/",
+    "AZURE_OPENAI_DEPLOYMENT_NAME": "gpt-4o",
+    "AZURE_OPENAI_EMBEDDING_DEPLOYMENT": "text-embedding-ada-002",
+    "AZURE_OPENAI_API_VERSION": "2024-02-01",
+    "EMBEDDING_CACHE_ENABLED": "False",
+}.items():
+    os.environ.setdefault(name, value)
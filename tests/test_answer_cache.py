@@ -0,0 +1,102 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from langchain.schema import Document
+
+from app.chains.answer_cache import AnswerCache
+from app.chains.index_manifest import MANIFEST_FILE, MANIFEST_VERSION
+
+QUESTION = [1.0, 0.0, 0.0]
+PARAPHRASE = [0.99, 0.05, 0.0]
+OTHER = [0.0, 1.0, 0.0]
+
+
+class FakeShardedStore:
+    """Shards whose manifests and versions the tests change by hand."""
+
+    def __init__(self, root, names=("default",)):
+        self.shards = {}
+        for name in names:
+            path = root / name
+            path.mkdir()
+            self.shards[name] = SimpleNamespace(path=str(path), version=(name, 0))
+
+    def maybe_reload(self):
+        pass
+
+    def rebuild(self, name, files):
+        shard = self.shards[name]
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "files": {k: {"sha256": v} for k, v in files.items()},
+        }
+        with open(f"{shard.path}/{MANIFEST_FILE}", "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        shard.version = (name, shard.version[1] + 1)
+
+
+def chunk(doc_id=None, collection="default"):
+    metadata = {"collection": collection}
+    if doc_id is not None:
+        metadata["doc_id"] = doc_id
+    return Document(page_content="text", metadata=metadata)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = FakeShardedStore(tmp_path, names=("default", "hr"))
+    store.rebuild("default", {"a.pdf": "sha-a", "b.pdf": "sha-b"})
+    store.rebuild("hr", {"policy.pdf": "sha-p"})
+    return store
+
+
+@pytest.fixture
+def cache(store):
+    return AnswerCache(store, threshold=0.95)
+
+
+def test_similar_question_in_same_namespace_hits(cache):
+    cache.store("What is A?", QUESTION, "A is a letter.", [chunk("a.pdf")], "ns")
+    assert cache.lookup("What's A?", PARAPHRASE, "ns").answer == "A is a letter."
+    assert cache.lookup("What's A?", PARAPHRASE, "other") is None
+    assert cache.lookup("What is B?", OTHER, "ns") is None
+
+
+def test_changed_document_invalidates_its_answers(cache, store):
+    cache.store("What is A?", QUESTION, "A", [chunk("a.pdf")], "ns")
+    cache.store("What is B?", OTHER, "B", [chunk("b.pdf")], "ns")
+    store.rebuild("default", {"a.pdf": "sha-a2", "b.pdf": "sha-b"})
+    assert cache.lookup("What is A?", QUESTION, "ns") is None
+    assert cache.lookup("What is B?", OTHER, "ns").answer == "B"
+
+
+def test_chunks_without_doc_id_are_invalidated_by_their_shard(cache, store):
+    cache.store("What is A?", QUESTION, "A", [chunk()], "ns")
+    store.rebuild("hr", {"policy.pdf": "sha-p"})
+    assert cache.lookup("What is A?", QUESTION, "ns").answer == "A"
+    store.rebuild("default", {"a.pdf": "sha-a", "b.pdf": "sha-b"})
+    assert cache.lookup("What is A?", QUESTION, "ns") is None
+
+
+def test_answers_without_documents_are_invalidated_by_any_reload(cache, store):
+    cache.store("What is A?", QUESTION, "A", [], "ns")
+    store.rebuild("hr", {"policy.pdf": "sha-p2"})
+    assert cache.lookup("What is A?", QUESTION, "ns") is None
+    assert cache.metrics()["invalidated"] == 1
+
+
+def test_invalidate_by_doc_id(cache):
+    cache.store("What is A?", QUESTION, "A", [chunk("a.pdf")], "ns")
+    cache.store("What is B?", OTHER, "B", [chunk("b.pdf")], "ns")
+    assert cache.invalidate(["a.pdf"]) == 1
+    assert cache.lookup("What is A?", QUESTION, "ns") is None
+    assert cache.invalidate() == 1
+
+
+def test_least_recently_used_entries_are_evicted(store):
+    cache = AnswerCache(store, threshold=0.95, max_entries=1)
+    cache.store("What is A?", QUESTION, "A", [chunk("a.pdf")], "ns")
+    cache.store("What is B?", OTHER, "B", [chunk("b.pdf")], "ns")
+    assert cache.lookup("What is A?", QUESTION, "ns") is None
+    assert cache.metrics()["evicted"] == 1
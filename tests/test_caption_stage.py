@@ -0,0 +1,57 @@
+import asyncio
+
+from app.chains.create_faiss_index import CaptionStage
+from app.utils.caption_cache import CaptionCache
+
+
+class FakeOpenAI:
+    deployment_name = "gpt-4o"
+
+    def __init__(self, fail=False):
+        self.calls = 0
+        self.fail = fail
+
+    async def chat_completion(self, messages):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise RuntimeError("Chat completion error: content filtered")
+        return f" caption {self.calls} "
+
+
+async def caption_all(stage, images):
+    stage.start()
+    for i, image in enumerate(images):
+        await stage.submit(image, "doc.pdf", page=i + 1, img_index=0)
+    return await stage.close()
+
+
+def test_repeated_images_are_captioned_once():
+    service = FakeOpenAI()
+    stage = CaptionStage(service, concurrency=4)
+    docs = asyncio.run(caption_all(stage, [b"logo", b"chart", b"logo", b"logo"]))
+    assert service.calls == 2
+    assert stage.deduplicated == 2
+    assert [d.metadata["page"] for d in docs] == [1, 2, 3, 4]
+    logo = {d.page_content.split(": ")[1] for d in docs if d.metadata["page"] != 2}
+    assert len(logo) == 1
+
+
+def test_cached_images_skip_the_api(tmp_path):
+    service = FakeOpenAI()
+    cache = CaptionCache(str(tmp_path / "captions.sqlite"), "v1")
+    asyncio.run(
+        caption_all(CaptionStage(service, concurrency=2, cache=cache), [b"logo"])
+    )
+    stage = CaptionStage(service, concurrency=2, cache=cache)
+    docs = asyncio.run(caption_all(stage, [b"logo", b"logo"]))
+    cache.close()
+    assert service.calls == 1
+    assert len(docs) == 2
+
+
+def test_failed_captions_are_dropped_for_every_repeat():
+    service = FakeOpenAI(fail=True)
+    stage = CaptionStage(service, concurrency=2)
+    assert asyncio.run(caption_all(stage, [b"logo", b"logo"])) == []
+    assert (service.calls, stage.failed) == (1, 1)
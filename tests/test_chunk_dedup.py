@@ -0,0 +1,87 @@
+import asyncio
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+
+from app.chains.chunk_dedup import ChunkDeduplicator, lsh_params, minhash
+from app.chains.context_packing import word_shingles
+from app.chains.ingestion import ingest
+from app.config.settings import get_settings
+
+NOTICE = (
+    "This document is provided for information only. All trademarks are the "
+    "property of their respective owners. No part of this publication may be "
+    "reproduced without written permission of the publisher. Specifications "
+    "are subject to change without notice."
+)
+
+
+def chunk(text, doc_id="a.pdf", page=1):
+    return Document(
+        page_content=text, metadata={"doc_id": doc_id, "source": doc_id, "page": page}
+    )
+
+
+def test_minhash_estimates_shingle_similarity():
+    edited = NOTICE.replace("information only", "informational purposes only")
+    exact = len(word_shingles(NOTICE) & word_shingles(edited)) / len(
+        word_shingles(NOTICE) | word_shingles(edited)
+    )
+    estimate = float(np.mean(minhash(NOTICE, 256) == minhash(edited, 256)))
+    assert abs(estimate - exact) < 0.1
+    assert np.array_equal(minhash(NOTICE), minhash(NOTICE))
+
+
+def test_lsh_params_split_the_signature():
+    bands, rows = lsh_params(0.9, 128)
+    assert bands * rows == 128
+    assert abs((1 / bands) ** (1 / rows) - 0.9) < 0.1
+
+
+def test_first_chunk_of_a_cluster_is_kept_with_its_duplicates_sources():
+    dedup = ChunkDeduplicator(threshold=0.8)
+    kept = dedup.add(
+        [chunk(NOTICE), chunk("Battery safety instructions for the charger.")]
+    )
+    assert dedup.add([chunk(NOTICE + " ", doc_id="b.pdf", page=7)]) == []
+    assert len(kept) == 2
+    assert kept[0].metadata["duplicates"] == 1
+    assert kept[0].metadata["duplicate_sources"] == [
+        {"doc_id": "b.pdf", "source": "b.pdf", "page": 7}
+    ]
+    assert (dedup.seen, dedup.dropped) == (3, 1)
+
+
+def test_distinct_chunks_are_kept():
+    dedup = ChunkDeduplicator(threshold=0.9)
+    texts = [
+        f"Section {i}: the device supports feature number {i} in mode {i * 7}."
+        for i in range(20)
+    ]
+    assert len(dedup.add([chunk(t) for t in texts])) == 20
+
+
+class FakeEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [[float(len(t))] for t in texts]
+
+    def embed_query(self, text):
+        return [float(len(text))]
+
+
+def test_ingest_keeps_the_duplicate_of_the_first_file(tmp_path):
+    settings = get_settings().model_copy(update={"ingest_workers": 3})
+    sources = {}
+    for name, extra in (("a.txt", "Alpha " * 2000), ("b.txt", ""), ("c.txt", "Gamma.")):
+        (tmp_path / name).write_text(f"{extra}\n\n{NOTICE}")
+        sources[name] = str(tmp_path / name)
+
+    chunks, vectors, stats = asyncio.run(ingest(sources, FakeEmbeddings(), settings))
+    notices = [c for c in chunks if NOTICE in c.page_content]
+    assert [c.metadata["doc_id"] for c in notices] == ["a.txt"]
+    assert {d["doc_id"] for d in notices[0].metadata["duplicate_sources"]} == {
+        "b.txt",
+        "c.txt",
+    }
+    assert len(vectors) == len(chunks)
@@ -0,0 +1,94 @@
+from langchain.schema import Document
+
+from app.chains.context_packing import (
+    PackedContextRetriever,
+    count_tokens,
+    merge_adjacent,
+    pack,
+    pack_context,
+    remove_near_duplicates,
+)
+
+FIRST = (
+    "The warranty covers the battery and the charger for two years "
+    "from the date of purchase."
+)
+SECOND = (
+    "from the date of purchase. "
+    "Water damage and lost accessories are not covered by it."
+)
+
+
+def doc(text, page=1, source="manual.pdf", type="text"):
+    return Document(
+        page_content=text, metadata={"source": source, "page": page, "type": type}
+    )
+
+
+def test_overlapping_chunks_of_a_page_are_merged():
+    merged = merge_adjacent(
+        [doc(SECOND), doc("Unrelated text on another page.", page=2), doc(FIRST)]
+    )
+    assert merged[0].page_content == (
+        "The warranty covers the battery and the charger for two years "
+        "from the date of purchase. "
+        "Water damage and lost accessories are not covered by it."
+    )
+    assert merged[0].metadata["merged_chunks"] == 2
+    assert merged[1].metadata["page"] == 2
+
+
+def test_chunks_of_different_pages_are_not_merged():
+    assert len(merge_adjacent([doc(FIRST, page=1), doc(SECOND, page=2)])) == 2
+
+
+def test_near_duplicates_keep_the_more_relevant_passage():
+    caption = doc("[Image] " + FIRST, type="image")
+    kept = remove_near_duplicates([doc(FIRST), caption, doc(SECOND)], threshold=0.8)
+    assert kept == [doc(FIRST), doc(SECOND)]
+
+
+def test_pack_respects_budget_and_chunk_limit():
+    docs = [doc(FIRST), doc(SECOND, page=2), doc("Short third passage.", page=3)]
+    budget = count_tokens(FIRST) + count_tokens(SECOND)
+    assert pack(docs, budget, max_chunks=3) == docs[:2]
+    assert pack(docs, 10_000, max_chunks=1) == docs[:1]
+
+
+def test_pack_skips_passages_over_budget_for_smaller_ones():
+    small = doc("Short third passage.", page=3)
+    budget = count_tokens(FIRST) + count_tokens(small.page_content)
+    assert pack([doc(FIRST), doc(FIRST + " " + SECOND, page=2), small], budget, 3) == [
+        doc(FIRST),
+        small,
+    ]
+
+
+def test_most_relevant_passage_is_truncated_not_dropped():
+    packed = pack([doc(FIRST)], token_budget=5, max_chunks=3)
+    assert len(packed) == 1
+    assert packed[0].metadata["truncated"]
+    assert count_tokens(packed[0].page_content) <= 6
+
+
+def test_duplicates_free_slots_for_the_next_chunks():
+    docs = [
+        doc(FIRST),
+        doc(FIRST, page=5),
+        doc(SECOND, page=2),
+        doc("Short third passage.", page=3),
+    ]
+    packed = pack_context(docs, token_budget=1000, max_chunks=2, dedup_threshold=0.8)
+    assert [d.metadata["page"] for d in packed] == [1, 2]
+
+
+def test_retriever_packs_vector_store_candidates():
+    class Store:
+        def similarity_search(self, query, k):
+            self.k = k
+            return [doc(FIRST), doc(FIRST, page=5), doc(SECOND, page=2)]
+
+    store = Store()
+    retriever = PackedContextRetriever(vector_store=store, candidates=6, max_chunks=3)
+    assert [d.metadata["page"] for d in retriever.invoke("warranty")] == [1, 2]
+    assert store.k == 6
@@ -0,0 +1,124 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from app.services import embedding_cache
+from app.services.azure_openai import AzureOpenAIWrapper
+from app.services.embedding_cache import EmbeddingCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        self.now += 1
+        return self.now
+
+
+class LockedConnection:
+    """SQLite connection whose writes fail as if another process held the lock."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, *args):
+        if not sql.lstrip().startswith("SELECT"):
+            raise sqlite3.OperationalError("database is locked")
+        return self.conn.execute(sql, *args)
+
+    def executemany(self, sql, rows):
+        raise sqlite3.OperationalError("database is locked")
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(embedding_cache, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"))
+    yield cache
+    cache.close()
+
+
+def last_access(cache, text):
+    row = cache._conn.execute(
+        "SELECT last_access FROM embeddings WHERE key = ?",
+        (cache.key("ada", text),),
+    ).fetchone()
+    return row and row[0]
+
+
+def test_hits_are_served_in_input_order(cache):
+    cache.put_many("ada", ["a", "b"], [[1.0, 2.0], [3.0, 4.0]])
+    assert cache.get_many("ada", ["b", "c", " a "]) == [[3.0, 4.0], None, [1.0, 2.0]]
+    assert cache.get_many("other", ["a"]) == [None]
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_access_times_are_written_in_batches(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"), touch_batch=3)
+    cache.put_many("ada", ["a", "b", "c"], [[1.0], [2.0], [3.0]])
+    written = last_access(cache, "a")
+    cache.get_many("ada", ["a", "b", "a"])
+    assert last_access(cache, "a") == written
+    cache.get_many("ada", ["c"])
+    assert last_access(cache, "a") > written
+    cache.close()
+
+
+def test_pending_access_times_are_written_on_close(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    cache = EmbeddingCache(path)
+    cache.put_many("ada", ["a"], [[1.0]])
+    written = last_access(cache, "a")
+    cache.get_many("ada", ["a"])
+    cache.close()
+    cache = EmbeddingCache(path)
+    assert last_access(cache, "a") > written
+    cache.close()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"), max_entries=3)
+    for text in "abc":
+        cache.put_many("ada", [text], [[1.0]])
+    cache.get_many("ada", ["a"])
+    cache.put_many("ada", ["d"], [[1.0]])
+    assert cache.get_many("ada", list("abcd")) == [[1.0], None, None, [1.0]]
+    assert cache.stats()["entries"] == 2
+    cache.close()
+
+
+def test_write_errors_are_logged_and_ignored(cache):
+    cache.put_many("ada", ["a"], [[1.0]])
+    cache._conn = LockedConnection(cache._conn)
+    cache.put_many("ada", ["b"], [[2.0]])
+    assert cache.get_many("ada", ["a", "b"]) == [[1.0], None]
+    assert cache.stats()["write_errors"] == 1
+
+
+def test_embeddings_are_returned_when_the_cache_cannot_write(cache):
+    cache._conn = LockedConnection(cache._conn)
+    client = AzureOpenAIWrapper()
+    client.embedding_cache = cache
+    client.embedding_deployment = "ada"
+
+    async def embed_many(texts):
+        return [[float(len(text))] for text in texts]
+
+    client._aembed_many = embed_many
+    assert asyncio.run(client.aget_embeddings(["a", "bb", "a"])) == [
+        [1.0],
+        [2.0],
+        [1.0],
+    ]
+    assert cache.stats()["write_errors"] == 1
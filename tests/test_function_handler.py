@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("azure.functions")
+
+from azure_function import function_handler  # noqa: E402
+
+
+class FakeValidator:
+    def __init__(self, verdict=None, error=None):
+        self.verdict = verdict
+        self.error = error
+
+    async def validate(self, user_input):
+        # Lets the speculative generation start (or finish) first
+        await asyncio.sleep(0.01)
+        if self.error is not None:
+            raise self.error
+        return self.verdict
+
+
+class FakeGenerator:
+    def __init__(self, delay):
+        self.delay = delay
+        self.started = False
+        self.running = False
+        self.cancelled = False
+        # Whether the generation was still running when the call returned
+        self.outlived_call = False
+
+    async def __call__(self, user_input, image=None, sources=None):
+        self.started = self.running = True
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        finally:
+            self.running = False
+        return f"Answer to {user_input}"
+
+
+@pytest.fixture
+def speculate(monkeypatch):
+    def run(validator, generator):
+        monkeypatch.setattr(function_handler, "prompt_validator", validator)
+        monkeypatch.setattr(function_handler, "achat_with_rag", generator)
+
+        async def call():
+            try:
+                return await function_handler.generate_with_speculation("question")
+            finally:
+                # Lets a cancelled generation observe its cancellation
+                await asyncio.sleep(0)
+                generator.outlived_call = generator.running
+
+        return asyncio.run(call())
+
+    return run
+
+
+def test_clean_input_returns_the_speculative_answer(speculate):
+    generator = FakeGenerator(delay=0)
+    assert speculate(FakeValidator("NO"), generator) == "Answer to question"
+    assert not generator.cancelled
+
+
+@pytest.mark.parametrize("delay", [0, 10])
+def test_flagged_input_never_returns_the_speculative_answer(speculate, delay):
+    generator = FakeGenerator(delay)
+    assert speculate(FakeValidator("YES"), generator) is None
+    assert generator.started
+    # A generation still in flight is cancelled rather than left running
+    assert generator.cancelled == bool(delay)
+    assert not generator.outlived_call
+
+
+def test_validator_error_cancels_the_generation(speculate):
+    generator = FakeGenerator(delay=10)
+    with pytest.raises(RuntimeError, match="validator down"):
+        speculate(FakeValidator(error=RuntimeError("validator down")), generator)
+    assert generator.started
+    assert generator.cancelled
+    assert not generator.outlived_call
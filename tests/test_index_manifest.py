@@ -0,0 +1,163 @@
+import os
+
+import pytest
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+
+from app.chains.index_manifest import (
+    apply_update,
+    load_manifest,
+    plan_update,
+    scan_sources,
+)
+from app.chains.sqlite_docstore import LEGACY_BACKUP_FILE
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic 8-dimensional vectors, enough to build a flat index."""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+    def embed_query(self, text):
+        return [float((hash(text) >> shift) & 0xFF) for shift in range(0, 64, 8)]
+
+
+@pytest.fixture
+def docs(tmp_path):
+    docs_dir = tmp_path / "docs"
+    docs_dir.mkdir()
+    for name in ("a.pdf", "b.pdf"):
+        (docs_dir / name).write_text(f"contents of {name}")
+    return docs_dir
+
+
+def build(docs_dir, index_dir, incremental=True, merged=None):
+    """
+    Builds the index from two chunks per loaded file; for files in `merged`
+    (doc_id -> kept doc_id) the first chunk is a duplicate of a kept chunk.
+    """
+    merged = merged or {}
+    plan = plan_update(
+        str(index_dir), scan_sources(str(docs_dir), (".pdf",)), incremental
+    )
+    chunks = [
+        Document(
+            page_content=f"{doc_id} chunk {i}",
+            metadata={"doc_id": doc_id, "source": doc_id},
+        )
+        for doc_id in plan.to_load
+        for i in range(2)
+        if not (i == 0 and doc_id in merged)
+    ]
+    for duplicate, kept in merged.items():
+        if duplicate in plan.to_load:
+            chunk = next(c for c in chunks if c.metadata["doc_id"] == kept)
+            chunk.metadata.setdefault("duplicate_sources", []).append(
+                {"doc_id": duplicate}
+            )
+    apply_update(plan, chunks, FakeEmbeddings())
+    return plan
+
+
+def test_first_build_loads_everything(docs, tmp_path):
+    plan = plan_update(str(tmp_path / "index"), scan_sources(str(docs), (".pdf",)))
+    assert not plan.incremental
+    assert plan.to_load == ["a.pdf", "b.pdf"]
+    assert plan.to_delete == []
+
+
+def test_unchanged_files_are_skipped(docs, tmp_path):
+    build(docs, tmp_path / "index")
+    plan = plan_update(str(tmp_path / "index"), scan_sources(str(docs), (".pdf",)))
+    assert plan.incremental
+    assert (plan.to_load, plan.to_delete, plan.removed) == ([], [], [])
+    assert apply_update(plan, [], FakeEmbeddings()) is None
+
+
+def test_changed_file_replaces_its_chunks(docs, tmp_path):
+    build(docs, tmp_path / "index")
+    old_ids = load_manifest(str(tmp_path / "index"))["files"]["a.pdf"]["chunk_ids"]
+    (docs / "a.pdf").write_text("new contents of a.pdf")
+    plan = plan_update(str(tmp_path / "index"), scan_sources(str(docs), (".pdf",)))
+    assert plan.to_load == ["a.pdf"]
+    assert plan.to_delete == old_ids
+
+
+def test_touched_file_with_same_content_is_kept(docs, tmp_path):
+    build(docs, tmp_path / "index")
+    stat = os.stat(docs / "a.pdf")
+    os.utime(docs / "a.pdf", (stat.st_atime, stat.st_mtime + 10))
+    plan = plan_update(str(tmp_path / "index"), scan_sources(str(docs), (".pdf",)))
+    assert plan.to_load == []
+    assert plan.sources["a.pdf"]["chunk_ids"]
+
+
+def test_deleted_file_removes_its_chunks(docs, tmp_path):
+    build(docs, tmp_path / "index")
+    old_ids = load_manifest(str(tmp_path / "index"))["files"]["b.pdf"]["chunk_ids"]
+    (docs / "b.pdf").unlink()
+    plan = build(docs, tmp_path / "index")
+    assert plan.removed == ["b.pdf"]
+    assert plan.to_delete == old_ids
+    assert list(load_manifest(str(tmp_path / "index"))["files"]) == ["a.pdf"]
+
+
+def test_full_rebuild_when_not_incremental(docs, tmp_path):
+    build(docs, tmp_path / "index")
+    plan = plan_update(
+        str(tmp_path / "index"), scan_sources(str(docs), (".pdf",)), incremental=False
+    )
+    assert not plan.incremental
+    assert plan.to_load == ["a.pdf", "b.pdf"]
+
+
+def test_merged_duplicates_are_recorded(docs, tmp_path):
+    build(docs, tmp_path / "index", merged={"b.pdf": "a.pdf"})
+    files = load_manifest(str(tmp_path / "index"))["files"]
+    assert files["b.pdf"]["merged_into"] == ["a.pdf"]
+    assert len(files["b.pdf"]["chunk_ids"]) == 1
+    assert "merged_into" not in files["a.pdf"]
+
+
+def test_changed_file_reloads_files_merged_into_it(docs, tmp_path):
+    (docs / "c.pdf").write_text("contents of c.pdf")
+    build(docs, tmp_path / "index", merged={"b.pdf": "a.pdf", "c.pdf": "b.pdf"})
+    (docs / "a.pdf").write_text("new contents of a.pdf")
+    manifest = load_manifest(str(tmp_path / "index"))
+    plan = plan_update(str(tmp_path / "index"), scan_sources(str(docs), (".pdf",)))
+    assert sorted(plan.to_load) == ["a.pdf", "b.pdf", "c.pdf"]
+    assert sorted(plan.to_delete) == sorted(
+        sum((f["chunk_ids"] for f in manifest["files"].values()), [])
+    )
+    assert "merged_into" not in plan.sources["b.pdf"]
+
+
+def test_removed_file_reloads_files_merged_into_it(docs, tmp_path):
+    build(docs, tmp_path / "index", merged={"b.pdf": "a.pdf"})
+    (docs / "a.pdf").unlink()
+    plan = build(docs, tmp_path / "index")
+    assert plan.removed == ["a.pdf"]
+    assert plan.to_load == ["b.pdf"]
+    files = load_manifest(str(tmp_path / "index"))["files"]
+    assert len(files["b.pdf"]["chunk_ids"]) == 2
+
+
+def test_touched_duplicate_keeps_its_merge(docs, tmp_path):
+    build(docs, tmp_path / "index", merged={"b.pdf": "a.pdf"})
+    stat = os.stat(docs / "b.pdf")
+    os.utime(docs / "b.pdf", (stat.st_atime, stat.st_mtime + 10))
+    plan = build(docs, tmp_path / "index")
+    assert plan.to_load == []
+    files = load_manifest(str(tmp_path / "index"))["files"]
+    assert files["b.pdf"]["merged_into"] == ["a.pdf"]
+
+
+def test_rebuild_keeps_the_migrated_docstore_backup(docs, tmp_path):
+    build(docs, tmp_path / "index")
+    (tmp_path / "index" / LEGACY_BACKUP_FILE).write_bytes(b"pickled docstore")
+    (docs / "a.pdf").write_text("new contents of a.pdf")
+    build(docs, tmp_path / "index")
+    build(docs, tmp_path / "index", incremental=False)
+    backup = tmp_path / "index" / LEGACY_BACKUP_FILE
+    assert backup.read_bytes() == b"pickled docstore"
@@ -0,0 +1,75 @@
+import asyncio
+import json
+
+import pytest
+from langchain.embeddings.base import Embeddings
+
+from app.chains.index_manifest import MANIFEST_FILE
+from app.chains.ingestion import build_index, ingest
+from app.config.settings import get_settings
+
+
+class FakeEmbeddings(Embeddings):
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+
+    def embed_documents(self, texts):
+        if any(self.fail_on and self.fail_on in t for t in texts):
+            raise RuntimeError("embedding failed")
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0]
+
+
+class FakeCaptionStage:
+    def __init__(self):
+        self.cancelled = False
+
+    async def submit(self, image_bytes, filename, page, img_index):
+        pass
+
+    async def close(self):
+        return []
+
+    def cancel(self):
+        self.cancelled = True
+
+
+@pytest.fixture
+def docs(tmp_path):
+    docs_dir = tmp_path / "docs"
+    docs_dir.mkdir()
+    (docs_dir / "a.txt").write_text("Alpha manual.")
+    (docs_dir / "broken.pdf").write_bytes(b"not a pdf")
+    (docs_dir / "c.txt").write_text("Gamma manual.")
+    return docs_dir
+
+
+def test_unreadable_files_are_skipped_and_reported(docs):
+    sources = {name: str(docs / name) for name in ("a.txt", "broken.pdf", "c.txt")}
+    chunks, vectors, stats = asyncio.run(
+        ingest(sources, FakeEmbeddings(), get_settings())
+    )
+    assert [c.metadata["doc_id"] for c in chunks] == ["a.txt", "c.txt"]
+    assert len(vectors) == 2
+    assert list(stats.failed) == ["broken.pdf"]
+    assert stats.files == 2
+    assert "1 files failed: broken.pdf" in stats.report()
+
+
+def test_skipped_files_are_retried_by_the_next_build(docs, tmp_path):
+    index_dir = str(tmp_path / "index")
+    asyncio.run(build_index(str(docs), index_dir, FakeEmbeddings(), get_settings()))
+    with open(f"{index_dir}/{MANIFEST_FILE}", encoding="utf-8") as f:
+        assert sorted(json.load(f)["files"]) == ["a.txt", "c.txt"]
+
+
+def test_failed_build_stops_pending_work(docs):
+    sources = {name: str(docs / name) for name in ("a.txt", "c.txt")}
+    stage = FakeCaptionStage()
+    with pytest.raises(RuntimeError, match="embedding failed"):
+        asyncio.run(
+            ingest(sources, FakeEmbeddings(fail_on="Alpha"), get_settings(), stage)
+        )
+    assert stage.cancelled
@@ -0,0 +1,52 @@
+from app.llm_validators.relevance_scorer import (
+    RelevanceScorer,
+    calibrate,
+    source_overlap,
+)
+
+
+def test_uncalibrated_scorer_leaves_every_answer_to_the_llm():
+    scorer = RelevanceScorer()
+    assert scorer.classify(1.0) is None
+    assert scorer.classify(-1.0) is None
+
+
+def test_scorer_without_reject_threshold_only_accepts():
+    scorer = RelevanceScorer(accept_threshold=0.8)
+    assert scorer.classify(0.9) == "YES"
+    assert scorer.classify(0.5) is None
+    assert scorer.classify(-1.0) is None
+
+
+def test_calibrated_reject_threshold_rejects_low_scores():
+    scorer = RelevanceScorer(accept_threshold=0.8, reject_threshold=0.3)
+    assert scorer.classify(0.3) == "NO"
+    assert scorer.classify(0.5) is None
+
+
+def test_score_blends_source_overlap():
+    scorer = RelevanceScorer(accept_threshold=0.8, source_weight=0.5)
+    sources = ["The warranty covers batteries for two years."]
+    answer = "Batteries have a two years warranty in Europe."
+    assert source_overlap(answer, sources) == 0.8
+    assert scorer.score([1.0, 0.0], [1.0, 0.0], answer, sources) == 0.9
+    assert scorer.score([1.0, 0.0], [1.0, 0.0], "Anything", None) == 1.0
+
+
+def test_calibrate_waits_for_enough_samples():
+    assert calibrate([(0.9, True)] * 5) is None
+    thresholds = calibrate([(0.9, True)] * 20 + [(0.2, False)] * 20)
+    assert thresholds == {
+        "accept_threshold": 0.9,
+        "reject_threshold": 0.2,
+        "samples": 40,
+    }
+
+
+def test_calibrated_bands_stop_at_the_other_class():
+    samples = [(0.9, True)] * 20 + [(0.5, True), (0.45, False)] + [(0.2, False)] * 20
+    thresholds = calibrate(samples)
+    assert (thresholds["accept_threshold"], thresholds["reject_threshold"]) == (
+        0.5,
+        0.45,
+    )
@@ -0,0 +1,205 @@
+import asyncio
+
+import pytest
+
+from app.services.request_scheduler import (
+    BATCH,
+    INTERACTIVE,
+    RequestScheduler,
+    TokenBucket,
+    chat_tokens,
+    request_priority,
+    retry_after,
+)
+
+
+class FakeAPIError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": headers or {}})()
+
+
+def scheduler(**kwargs):
+    options = {"rpm": 0, "tpm": 0, "backoff_base": 0.001, "backoff_max": 0.001}
+    options.update(kwargs)
+    return RequestScheduler("test", **options)
+
+
+# --- Admission ---
+
+def test_unlimited_bucket_never_waits():
+    assert TokenBucket(0).wait_for(10 ** 6, 0) == 0.0
+
+
+def test_bucket_waits_for_missing_tokens():
+    bucket = TokenBucket(60)  # one per second
+    bucket.take(60)
+    bucket.refill(bucket._updated)
+    assert bucket.wait_for(1, 0) == pytest.approx(1.0)
+
+
+def test_batch_requests_leave_the_interactive_reserve():
+    s = scheduler(rpm=10, interactive_reserve=0.2)
+    for _ in range(8):
+        assert s._try_acquire(1, BATCH) == 0
+    assert s._try_acquire(1, BATCH) > 0
+    assert s._try_acquire(1, INTERACTIVE) == 0
+
+
+def test_batch_waits_while_interactive_requests_are_queued():
+    s = scheduler()
+    s._queued(INTERACTIVE, 1)
+    assert s._try_acquire(1, BATCH) > 0
+    assert s._try_acquire(1, INTERACTIVE) == 0
+    s._queued(INTERACTIVE, -1)
+    assert s._try_acquire(1, BATCH) == 0
+
+
+def test_request_priority_is_validated():
+    with pytest.raises(ValueError):
+        with request_priority("urgent"):
+            pass
+
+
+def test_chat_tokens_counts_prompt_and_completion():
+    messages = [
+        {
+            "role": "user",
+            "content": [{"type": "text", "text": "hi"}, {"type": "image_url"}],
+        }
+    ]
+    assert chat_tokens(messages, max_tokens=100) > 100 + 765
+
+
+# --- Retries ---
+
+def test_retry_after_prefers_milliseconds():
+    assert (
+        retry_after(FakeAPIError(429, {"retry-after-ms": "1500", "retry-after": "9"}))
+        == 1.5
+    )
+    assert retry_after(FakeAPIError(429, {"retry-after": "2"})) == 2.0
+    assert retry_after(ValueError()) is None
+
+
+def test_retryable_errors_are_retried():
+    s = scheduler(max_retries=3)
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise FakeAPIError(503)
+        return "ok"
+
+    assert s.run(call, tokens=1) == "ok"
+    assert len(attempts) == 3
+    assert s.metrics()["retries"] == 2
+    assert s.metrics()["calls"] == 1
+
+
+def test_retries_stop_after_max_retries():
+    s = scheduler(max_retries=2)
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        raise FakeAPIError(429)
+
+    with pytest.raises(FakeAPIError):
+        s.run(call, tokens=1)
+    assert len(attempts) == 3
+    assert s.metrics()["throttled"] == 2
+
+
+def test_non_retryable_errors_are_raised_at_once():
+    s = scheduler(max_retries=5)
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        raise FakeAPIError(400)
+
+    with pytest.raises(FakeAPIError):
+        s.run(call, tokens=1)
+    assert len(attempts) == 1
+
+
+def test_retry_after_pauses_the_deployment():
+    s = scheduler(max_retries=1)
+    s._backoff(FakeAPIError(429, {"retry-after": "30"}), attempt=0)
+    assert s._try_acquire(1, INTERACTIVE) > 29
+
+
+# --- Coalescing ---
+
+async def _coalesced(s, release, calls, key="k"):
+    async def call():
+        calls.append(1)
+        await release.wait()
+        return "answer"
+    return await s.arun(call, tokens=1, key=key)
+
+
+def test_identical_calls_are_coalesced():
+    async def main():
+        s, release, calls = scheduler(), asyncio.Event(), []
+        tasks = [asyncio.create_task(_coalesced(s, release, calls)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        release.set()
+        assert await asyncio.gather(*tasks) == ["answer"] * 3
+        assert len(calls) == 1
+        assert s.metrics()["coalesced"] == 2
+        assert not s._ainflight
+
+    asyncio.run(main())
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def main():
+        s, release, calls = scheduler(), asyncio.Event(), []
+        leader = asyncio.create_task(_coalesced(s, release, calls))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(_coalesced(s, release, calls))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        await asyncio.sleep(0.01)
+        release.set()
+        assert await follower == "answer"
+        assert leader.cancelled()
+        assert len(calls) == 1
+
+    asyncio.run(main())
+
+
+def test_call_is_cancelled_when_every_caller_is():
+    async def main():
+        s, release, calls = scheduler(), asyncio.Event(), []
+        callers = [asyncio.create_task(_coalesced(s, release, calls)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        shared = next(iter(s._ainflight.values()))
+        for caller in callers:
+            caller.cancel()
+        await asyncio.sleep(0.01)
+        assert shared.task.cancelled()
+        assert not s._ainflight
+
+    asyncio.run(main())
+
+
+def test_errors_reach_every_coalesced_caller():
+    async def main():
+        s = scheduler(max_retries=0)
+        started = asyncio.Event()
+
+        async def call():
+            started.set()
+            await asyncio.sleep(0.01)
+            raise FakeAPIError(400)
+
+        tasks = [asyncio.create_task(s.arun(call, tokens=1, key="k")) for _ in range(2)]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert all(isinstance(r, FakeAPIError) for r in results)
+
+    asyncio.run(main())
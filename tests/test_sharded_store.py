@@ -0,0 +1,135 @@
+import pytest
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+
+from app.chains.index_manifest import apply_update, plan_update, scan_sources
+from app.chains.sharded_store import (
+    ShardedVectorStore,
+    _merge,
+    build_dirs,
+    current_scope,
+    route,
+    shard_dirs,
+    shard_scope,
+)
+from app.config.settings import get_settings
+
+
+class NoEmbeddings(Embeddings):
+    """Shards are built from given vectors and searched by vector."""
+
+    def embed_documents(self, texts):
+        raise AssertionError("unexpected embedding call")
+
+    def embed_query(self, text):
+        raise AssertionError("unexpected embedding call")
+
+
+def sharded(names="retail,pharma"):
+    return get_settings().model_copy(update={"faiss_shards": names})
+
+
+def build_shard(root, name, vectors):
+    """Index of one file whose chunk i has vector vectors[i]."""
+    docs_dir = root / "docs" / name
+    docs_dir.mkdir(parents=True)
+    (docs_dir / f"{name}.pdf").write_text(name)
+    index_dir = root / "index" / name
+    plan = plan_update(str(index_dir), scan_sources(str(docs_dir), (".pdf",)))
+    chunks = [
+        Document(
+            page_content=f"{name} {i}",
+            metadata={"doc_id": f"{name}.pdf", "source": f"{name}.pdf", "page": i},
+        )
+        for i in range(len(vectors))
+    ]
+    apply_update(plan, chunks, NoEmbeddings(), vectors)
+    return str(index_dir)
+
+
+@pytest.fixture
+def store(tmp_path):
+    shards = {
+        "retail": build_shard(tmp_path, "retail", [[0, 0, 0, 0], [5, 5, 0, 0]]),
+        "pharma": build_shard(tmp_path, "pharma", [[1, 0, 0, 0], [9, 9, 9, 9]]),
+    }
+    store = ShardedVectorStore(shards, NoEmbeddings(), sharded())
+    yield store
+    store._pool.shutdown()
+
+
+def test_route_splits_collections_from_chunk_filter():
+    assert route({"collection": "retail", "source": "a.pdf"}) == (
+        ["retail"],
+        {"source": "a.pdf"},
+    )
+    assert route({"collections": ["retail", "pharma"]}) == (["retail", "pharma"], None)
+    assert route(None) == (None, None)
+
+
+def test_shard_scope_is_reset_on_exit():
+    with shard_scope(["retail"], {"page": 1}):
+        assert current_scope() == (["retail"], {"page": 1})
+    assert current_scope() == (None, None)
+
+
+def test_shard_dirs_live_under_the_index_root():
+    assert shard_dirs("idx", get_settings().model_copy()) == {"default": "idx"}
+    assert shard_dirs("idx", sharded()) == {
+        "retail": "idx/retail",
+        "pharma": "idx/pharma",
+    }
+
+
+def test_root_build_is_refused_when_shards_are_configured():
+    with pytest.raises(ValueError, match="--collection"):
+        build_dirs("docs", "idx", None, sharded())
+    assert build_dirs("docs", "idx", "retail", sharded()) == (
+        "docs/retail",
+        "idx/retail",
+    )
+
+
+def test_only_listed_collections_can_be_built():
+    with pytest.raises(ValueError, match="not listed"):
+        build_dirs("docs", "idx", "hr", sharded())
+    with pytest.raises(ValueError, match="not listed"):
+        build_dirs("docs", "idx", "retail", get_settings().model_copy())
+    assert build_dirs("docs", "idx", None, get_settings().model_copy()) == (
+        "docs",
+        "idx",
+    )
+
+
+def test_merge_keeps_the_global_top_k_by_distance():
+    a, b, c = (Document(page_content=t) for t in "abc")
+    assert _merge([[(a, 0.5), (c, 3.0)], [(b, 1.0)]], 2) == [(a, 0.5), (b, 1.0)]
+
+
+def test_search_merges_shards_and_tags_collections(store):
+    hits = store.similarity_search_with_score_by_vector([0.2, 0, 0, 0], k=3)
+    assert [(d.page_content, d.metadata["collection"]) for d, _ in hits] == [
+        ("retail 0", "retail"),
+        ("pharma 0", "pharma"),
+        ("retail 1", "retail"),
+    ]
+    assert [score for _, score in hits] == sorted(score for _, score in hits)
+
+
+def test_scope_restricts_collections_and_filters_chunks(store):
+    with shard_scope(["pharma"]):
+        hits = store.similarity_search_by_vector([0, 0, 0, 0], k=2)
+    assert {d.metadata["collection"] for d in hits} == {"pharma"}
+    with shard_scope(filter={"page": 1}):
+        hits = store.similarity_search_by_vector([0, 0, 0, 0], k=4)
+    assert [d.page_content for d in hits] == ["retail 1", "pharma 1"]
+    with shard_scope(["hr"]), pytest.raises(ValueError, match="Unknown collections"):
+        store.similarity_search_by_vector([0, 0, 0, 0], k=1)
+
+
+def test_search_many_matches_single_searches(store):
+    queries = [[0.2, 0, 0, 0], [8, 8, 8, 8]]
+    batched = store.search_many(queries, k=2)
+    single = [store.similarity_search_by_vector(q, k=2) for q in queries]
+    assert batched == single
+    assert batched[1][0].page_content == "pharma 1"
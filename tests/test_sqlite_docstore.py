@@ -0,0 +1,41 @@
+import os
+import pickle
+
+import pytest
+from langchain.docstore.in_memory import InMemoryDocstore
+from langchain.schema import Document
+
+from app.chains.sqlite_docstore import DOCSTORE_FILE, SQLiteDocstore, migrate
+
+
+def legacy_index(index_dir, docstore, index_to_docstore_id):
+    with open(index_dir / "index.pkl", "wb") as f:
+        pickle.dump((docstore, index_to_docstore_id), f)
+
+
+def test_migrate_keeps_the_pickle_as_backup(tmp_path):
+    docs = {
+        f"id-{i}": Document(page_content=f"chunk {i}", metadata={"page": i})
+        for i in range(3)
+    }
+    legacy_index(tmp_path, InMemoryDocstore(docs), {i: f"id-{i}" for i in range(3)})
+
+    migrate(str(tmp_path))
+
+    assert not (tmp_path / "index.pkl").exists()
+    assert (tmp_path / "index.pkl.bak").exists()
+    store = SQLiteDocstore(str(tmp_path / DOCSTORE_FILE))
+    assert store.count() == 3
+    assert store.search("id-2").page_content == "chunk 2"
+    assert store.search("id-2").metadata == {"page": 2}
+    store.close()
+
+
+def test_migrate_keeps_the_pickle_when_a_chunk_is_missing(tmp_path):
+    legacy_index(tmp_path, InMemoryDocstore({}), {0: "id-0"})
+
+    with pytest.raises(ValueError):
+        migrate(str(tmp_path))
+
+    assert (tmp_path / "index.pkl").exists()
+    assert not os.path.exists(tmp_path / DOCSTORE_FILE)